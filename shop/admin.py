@@ -1,11 +1,143 @@
-from django.contrib import admin
+import re
+
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
-from .models import Product, Profile, Order, StockNotification
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.db.models import Case, Value, When
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils.functional import cached_property
+from . import inventory
+from .sales import set_status
+from .models import Product, Profile, Order, OrderItem, StockNotification, StockReservation, OutgoingEmail, RestockJob, Campaign, TelegramMessage
+
+# Выше этого числа строк changelist без фильтров показывает оценку из статистики Postgres
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор для больших таблиц: без фильтров берёт число строк
+    из pg_class.reltuples вместо COUNT(*) по всей таблице.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [self.object_list.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] > ESTIMATED_COUNT_THRESHOLD:
+                return row[0]
+        return super().count
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр-поле ввода вместо списка всех значений (пользователей, товаров)"""
+    template = 'admin/shop/input_filter.html'
+    placeholder = ''
+
+    def lookups(self, request, model_admin):
+        return ()
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        # Остальные параметры changelist сохраняем скрытыми полями формы
+        yield {
+            'query_parts': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, 'p')
+            ],
+            'value': self.value() or '',
+            'placeholder': self.placeholder,
+        }
+
+
+class UserFilter(InputFilter):
+    title = 'покупателю'
+    parameter_name = 'user'
+    placeholder = 'логин или id'
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        if value.isdigit():
+            return queryset.filter(user_id=int(value))
+        return queryset.filter(user__username=value)
+
+
+class ProductFilter(InputFilter):
+    title = 'товару'
+    parameter_name = 'product'
+    placeholder = 'артикул или id'
+
+    def queryset(self, request, queryset):
+        value = (self.value() or '').strip()
+        if not value:
+            return queryset
+        if value.isdigit():
+            return queryset.filter(product_id=int(value))
+        return queryset.filter(product__sku=value)
+
+
+class StockFilter(admin.SimpleListFilter):
+    title = 'остатку'
+    parameter_name = 'stock'
+
+    def lookups(self, request, model_admin):
+        return [('none', 'Нет в наличии'), ('low', 'Мало (1–5)'), ('available', 'Больше 5')]
+
+    def queryset(self, request, queryset):
+        if self.value() == 'none':
+            return queryset.filter(stock=0)
+        if self.value() == 'low':
+            return queryset.filter(stock__gte=1, stock__lte=5)
+        if self.value() == 'available':
+            return queryset.filter(stock__gt=5)
+        return queryset
+
+
+class StockDeltaForm(forms.Form):
+    delta = forms.IntegerField(label='Изменить остаток на', help_text='Отрицательное число — списать')
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'price']
+    list_display = ['name', 'sku', 'price', 'stock']
+    list_filter = [StockFilter]
+    search_fields = ['=sku', 'name']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    actions = ['adjust_stock']
+
+    @admin.action(description='Изменить остаток выбранных товаров')
+    def adjust_stock(self, request, queryset):
+        form = StockDeltaForm(request.POST if 'apply' in request.POST else None)
+        if form.is_valid():
+            updated = inventory.shift_stock(queryset, form.cleaned_data['delta'])
+            self.message_user(request, f'Остаток изменён у {updated} товаров.', messages.SUCCESS)
+            return None
+        return TemplateResponse(request, 'admin/shop/product/adjust_stock.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Изменить остаток',
+            'opts': self.model._meta,
+            'form': form,
+            'queryset': queryset,
+            'selected': request.POST.getlist(admin.helpers.ACTION_CHECKBOX_NAME),
+            'select_across': request.POST.get('select_across', '0'),
+            'action': 'adjust_stock',
+        })
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -17,16 +149,174 @@ class CustomUserAdmin(UserAdmin):
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
 
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    fields = ['product', 'name', 'price', 'discounted_price', 'quantity', 'total']
+    readonly_fields = fields
+    can_delete = False
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+TRACKING_LINE_RE = re.compile(r'^\s*#?(\d+)[\s,;:]+(\S+)\s*$')
+
+
+def parse_tracking_numbers(text):
+    """Строки «номер_заказа трек-номер» -> ({id: трек}, [нераспознанные строки])"""
+    numbers = {}
+    errors = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = TRACKING_LINE_RE.match(line)
+        if match:
+            numbers[int(match.group(1))] = match.group(2)
+        else:
+            errors.append(line.strip())
+    return numbers, errors
+
+
+def set_tracking_numbers(numbers, chunk_size=1000):
+    """
+    Проставить трек-номера и перевести новые заказы в «В пути».
+
+    Один UPDATE с CASE на каждые chunk_size заказов. Возвращает число
+    обновлённых заказов.
+    """
+    updated = 0
+    ids = list(numbers)
+    with transaction.atomic():
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            updated += Order.objects.filter(id__in=chunk).update(
+                tracking_number=Case(*[When(id=pk, then=Value(numbers[pk])) for pk in chunk]),
+            )
+            # Статус — отдельным UPDATE, чтобы поправить дневные продажи по статусам
+            set_status(Order.objects.filter(id__in=chunk, status__in=['new', 'processing']), 'shipped')
+    return updated
+
+
+class TrackingNumbersForm(forms.Form):
+    numbers = forms.CharField(
+        label='Трек-номера',
+        widget=forms.Textarea(attrs={'rows': 20, 'cols': 60}),
+        help_text='По строке на заказ: «номер_заказа трек-номер» (через пробел, таб, запятую или точку с запятой)',
+    )
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'total', 'status', 'tracking_number', 'created_at']
-    list_editable = ['status', 'tracking_number']  # можно менять прямо в списке
-    list_filter = ['status', 'created_at', 'user']
-    readonly_fields = ['items', 'created_at']
-    search_fields = ['user__username', 'tracking_number']
+    list_display = ['id', 'user', 'total', 'status', 'tracking_number', 'created_at', 'items_summary']
+    # Фильтр по покупателю — поле ввода, а не список всех пользователей
+    list_filter = ['status', 'created_at', UserFilter]
+    list_select_related = ['user']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    autocomplete_fields = ['user']
+    readonly_fields = ['created_at']
+    exclude = ['items']
+    search_fields = ['=tracking_number', 'user__username']
+    inlines = [OrderItemInline]
+    actions = ['mark_processing', 'mark_shipped', 'mark_delivered', 'mark_cancelled']
+    change_list_template = 'admin/shop/order/change_list.html'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('items').prefetch_related('lines')
+
+    def get_urls(self):
+        return [
+            path(
+                'tracking/',
+                self.admin_site.admin_view(self.tracking_view),
+                name='shop_order_tracking',
+            ),
+        ] + super().get_urls()
+
+    def tracking_view(self, request):
+        """Вставить список трек-номеров из файла службы доставки"""
+        if not self.has_change_permission(request):
+            return redirect('admin:shop_order_changelist')
+        form = TrackingNumbersForm(request.POST or None)
+        if form.is_valid():
+            numbers, errors = parse_tracking_numbers(form.cleaned_data['numbers'])
+            updated = set_tracking_numbers(numbers)
+            self.message_user(request, f'Трек-номера проставлены у {updated} заказов.', messages.SUCCESS)
+            missing = len(numbers) - updated
+            if missing:
+                self.message_user(request, f'Не найдено заказов: {missing}.', messages.WARNING)
+            for line in errors[:20]:
+                self.message_user(request, f'Не разобрана строка: {line}', messages.ERROR)
+            return redirect('admin:shop_order_changelist')
+        return TemplateResponse(request, 'admin/shop/order/tracking_form.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Трек-номера из списка',
+            'opts': self.model._meta,
+            'form': form,
+        })
+
+    def _set_status(self, request, queryset, status):
+        # Один UPDATE вместо save() по каждому заказу; продажи по дням правит set_status
+        updated = set_status(queryset, status)
+        self.message_user(request, f'Обновлено заказов: {updated}.', messages.SUCCESS)
+
+    @admin.action(description='Перевести в «В обработке»')
+    def mark_processing(self, request, queryset):
+        self._set_status(request, queryset, 'processing')
+
+    @admin.action(description='Перевести в «В пути»')
+    def mark_shipped(self, request, queryset):
+        self._set_status(request, queryset, 'shipped')
+
+    @admin.action(description='Перевести в «Доставлен»')
+    def mark_delivered(self, request, queryset):
+        self._set_status(request, queryset, 'delivered')
+
+    @admin.action(description='Отменить')
+    def mark_cancelled(self, request, queryset):
+        self._set_status(request, queryset, 'cancelled')
+
+    @admin.display(description='Товары')
+    def items_summary(self, obj):
+        return ', '.join(f'{line.name} × {line.quantity}' for line in obj.lines.all())
 
 @admin.register(StockNotification)
 class StockNotificationAdmin(admin.ModelAdmin):
     list_display = ['email', 'product', 'created_at']
-    list_filter = ['product', 'created_at']
-    search_fields = ['email', 'product__name']
\ No newline at end of file
+    list_filter = [ProductFilter, 'created_at']
+    list_select_related = ['product']
+    raw_id_fields = ['product']
+    search_fields = ['email', 'product__name']
+
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['user', 'product', 'quantity', 'expires_at']
+    list_select_related = ['user', 'product']
+    raw_id_fields = ['user', 'product']
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['subject', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['subject']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+@admin.register(TelegramMessage)
+class TelegramMessageAdmin(admin.ModelAdmin):
+    list_display = ['chat_id', 'status', 'attempts', 'next_attempt_at', 'sent_at']
+    list_filter = ['status']
+    search_fields = ['chat_id']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+@admin.register(RestockJob)
+class RestockJobAdmin(admin.ModelAdmin):
+    list_display = ['product', 'status', 'sent', 'total', 'created_at', 'finished_at']
+    list_filter = ['status']
+    list_select_related = ['product']
+    readonly_fields = ['sent', 'total', 'last_notification_id', 'finished_at']
+
+@admin.register(Campaign)
+class CampaignAdmin(admin.ModelAdmin):
+    list_display = ['title', 'slug', 'starts_at', 'ends_at', 'is_enabled']
+    list_editable = ['is_enabled']
+    prepopulated_fields = {'slug': ['title']}
@@ -0,0 +1,99 @@
+"""
+Асинхронные версии страниц только для чтения (под ASGI, см. sportshop/asgi.py).
+
+Запросы к базе идут через async ORM, кэш читается синхронно, шаблоны
+рендерятся синхронно — это чистый CPU без ввода-вывода, поэтому всё,
+что шаблон читает, загружается заранее (списки, а не ленивые QuerySet).
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+
+from . import inventory, views
+from .cache import acached_render, catalog_version
+from .cart import aprice_cart
+from .conditional import catalog_marker, conditional, product_marker
+from .deals import acurrent_campaign, adeals_html
+from .models import Product
+from .ratelimit import ratelimit
+from .routers import use_replica
+from .views import _catalog_params, _drop_missing_products
+
+
+async def _load_user(request):
+    """
+    Загрузить request.user до рендеринга: base.html проверяет вход.
+
+    Без cookie сессии пользователь анонимный и база не нужна; иначе
+    сессия и пользователь читаются в потоке (в Django 4.2 у них нет async API).
+    """
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        await sync_to_async(lambda: request.user.is_authenticated)()
+    else:
+        request.user.is_authenticated
+
+
+@use_replica
+async def index_page(request):
+    async def get_context():
+        return {'products': [product async for product in Product.objects.all()[:6]]}
+
+    body_html = await acached_render('includes/index_body.html', (), get_context)
+    await _load_user(request)
+    return render(request, 'index.html', {'body_html': body_html})
+
+
+@use_replica
+@conditional(catalog_marker)
+async def catalog_page(request):
+    sort, max_price, paginator, cursor, key_parts = _catalog_params(request)
+
+    async def get_context():
+        page = await paginator.apage(cursor)
+        return {'products': page.object_list, 'page': page, 'sort': sort, 'max_price': max_price}
+
+    products_html = await acached_render('includes/catalog_products.html', key_parts, get_context)
+    await _load_user(request)
+    return render(request, 'catalog.html', {'products_html': products_html, 'sort': sort})
+
+
+@ratelimit('stock_notification')
+@use_replica
+@conditional(product_marker)
+async def product_detail(request, product_id):
+    if request.method == 'POST':
+        # Подписка на поступление пишет в базу — это делает обычный view
+        return await sync_to_async(views.product_detail)(request, product_id)
+    try:
+        product = await Product.objects.with_discount().aget(id=product_id)
+    except Product.DoesNotExist:
+        raise Http404('Товар не найден')
+    await _load_user(request)
+    available = (await inventory.aavailable_for(request.user, [product]))[product.id]
+    return render(request, 'product.html', {
+        'product': product, 'available': available, 'catalog_version': catalog_version(),
+    })
+
+
+@use_replica
+async def black_friday_page(request):
+    campaign = await acurrent_campaign()
+    products_html = await adeals_html()
+    await _load_user(request)
+    return render(request, 'black_friday.html', {
+        'products_html': products_html,
+        'campaign': campaign,
+        'is_active': campaign is not None and campaign.is_active(),
+        'bf_end': campaign.ends_at if campaign else None,
+    })
+
+
+async def cart_view(request):
+    await _load_user(request)
+    cart = request.cart
+    await cart.aload()
+    priced = await aprice_cart(cart, request.user)
+    _drop_missing_products(request, cart, priced)
+    return render(request, 'cart.html', {'cart_items': priced, 'total': priced.total})
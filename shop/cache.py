@@ -0,0 +1,124 @@
+import hashlib
+import time
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+VERSION_KEY = 'catalog:version'
+MODIFIED_KEY = 'catalog:modified'
+STATS_KEYS = {'hits': 'cache:stats:hits', 'misses': 'cache:stats:misses'}
+
+
+def catalog_version():
+    """Текущая версия каталога; входит во все ключи кэша страниц"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # После очистки кэша начинаем с метки времени, а не с 1,
+        # чтобы не совпасть со старыми ключами в другом кэше (например, файловом)
+        initial = int(time.time() * 1000)
+        cache.add(VERSION_KEY, initial, timeout=None)
+        version = cache.get(VERSION_KEY, initial)
+    return version
+
+
+def bump_catalog_version():
+    """Сбросить кэш страниц каталога (старые ключи просто перестают читаться)"""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        catalog_version()
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
+
+
+def catalog_last_modified():
+    """
+    Когда каталог последний раз менялся (для Last-Modified страниц каталога).
+
+    Метку ставит bump_catalog_version(); после очистки кэша она берётся
+    из самого свежего Product.updated_at (один запрос по индексу).
+    """
+    value = cache.get(MODIFIED_KEY)
+    if value is None:
+        from .models import Product
+        latest = Product.objects.aggregate(latest=Max('updated_at'))['latest']
+        value = latest.timestamp() if latest else time.time()
+        cache.add(MODIFIED_KEY, value, timeout=None)
+    return datetime.fromtimestamp(int(value), tz=timezone.utc)
+
+
+def bump_catalog_version_on_commit():
+    # До коммита другой запрос мог бы закэшировать старые данные под новой версией
+    transaction.on_commit(bump_catalog_version)
+
+
+def _count(name):
+    key = STATS_KEYS[name]
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def cache_stats():
+    """Счётчики попаданий и промахов кэша страниц"""
+    values = cache.get_many(STATS_KEYS.values())
+    return {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+
+
+def cached_render(template_name, key_parts, get_context, timeout=None):
+    """
+    Отрендерить шаблон с данными каталога через кэш.
+
+    get_context вызывается только при промахе, так что при попадании
+    в базу не ходим вовсе. В шаблон нельзя класть ничего, что зависит
+    от пользователя (сообщения, шапка, csrf) — это остаётся в базовом
+    шаблоне и рендерится на каждый запрос. key_parts=None — рендер без
+    кэша (для непроверенного ввода, чтобы не плодить ключи).
+    """
+    if key_parts is None:
+        return mark_safe(render_to_string(template_name, get_context()))
+    key = _page_key(template_name, key_parts)
+    html = cache.get(key)
+    if html is None:
+        html = _store(key, render_to_string(template_name, get_context()), timeout)
+    else:
+        _count('hits')
+    return mark_safe(html)
+
+
+async def acached_render(template_name, key_parts, get_context, timeout=None):
+    """
+    cached_render() для async views: get_context — корутина (async ORM).
+
+    Кэш вызывается синхронно: locmem/Redis отвечают быстрее, чем стоит
+    переход в поток, а async-методы кэша в Django 4.2 — это sync_to_async.
+    """
+    if key_parts is None:
+        return mark_safe(render_to_string(template_name, await get_context()))
+    key = _page_key(template_name, key_parts)
+    html = cache.get(key)
+    if html is None:
+        html = _store(key, render_to_string(template_name, await get_context()), timeout)
+    else:
+        _count('hits')
+    return mark_safe(html)
+
+
+def _page_key(template_name, key_parts):
+    digest = hashlib.md5(repr(key_parts).encode()).hexdigest()
+    return f'page:{template_name}:{catalog_version()}:{digest}'
+
+
+def _store(key, html, timeout):
+    _count('misses')
+    if timeout is None:
+        timeout = getattr(settings, 'PAGE_CACHE_SECONDS', 600)
+    cache.set(key, html, timeout)
+    return html
@@ -0,0 +1,291 @@
+import re
+import secrets
+from decimal import Decimal
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import inventory
+from .models import Cart, Product
+
+TOKEN_RE = re.compile(r'^[A-Za-z0-9_-]{20,64}$')
+
+
+def encode_items(items):
+    """{id: количество} -> "id:количество,..." """
+    return ','.join(f'{pid}:{qty}' for pid, qty in items.items())
+
+
+def decode_items(data):
+    items = {}
+    for part in data.split(',') if data else ():
+        pid, _, qty = part.partition(':')
+        if pid.isdigit() and qty.isdigit() and int(qty) > 0:
+            items[int(pid)] = int(qty)
+    return items
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class CartStore:
+    """
+    Корзина вне сессии: {id товара: количество}.
+
+    Читается из кэша (при промахе — из таблицы Cart). Сохраняется только
+    если что-то изменилось, и сразу в базу и в кэш: таблица — источник
+    истины, кэш можно потерять в любой момент.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.new_token = None
+        self._items = None
+        self._changed = False
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(f'u{user.pk}')
+
+    @classmethod
+    def for_request(cls, request):
+        if request.user.is_authenticated:
+            return cls.for_user(request.user)
+        token = request.COOKIES.get(_setting('CART_COOKIE_NAME', 'cart_id'), '')
+        # У гостя без cookie корзина пустая, ключ появится при первом сохранении
+        return cls(f'a{token}' if TOKEN_RE.match(token) else None)
+
+    @property
+    def _cache_key(self):
+        # v2: в кэше только данные корзины, без времени записи в базу
+        return f'cart:v2:{self.key}'
+
+    def _cache(self, data):
+        cache.set(self._cache_key, data, _setting('CART_CACHE_SECONDS', 60))
+
+    def _load(self):
+        if self._items is not None:
+            return self._items
+        data = ''
+        if self.key is not None:
+            data = cache.get(self._cache_key)
+            if data is None:
+                data = Cart.objects.filter(key=self.key).values_list('data', flat=True).first() or ''
+                self._cache(data)
+        self._items = decode_items(data)
+        return self._items
+
+    async def aload(self):
+        """_load() для async views: из базы — через async ORM, кэш читается как есть"""
+        if self._items is None and self.key is not None and cache.get(self._cache_key) is None:
+            data = await Cart.objects.filter(key=self.key).values_list('data', flat=True).afirst() or ''
+            self._cache(data)
+        return self._load()
+
+    def items(self):
+        return self._load().items()
+
+    def quantity(self, product_id):
+        return self._load().get(int(product_id), 0)
+
+    def __contains__(self, product_id):
+        return int(product_id) in self._load()
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+    def set(self, product_id, quantity):
+        items = self._load()
+        product_id = int(product_id)
+        if quantity <= 0:
+            self.remove(product_id)
+        elif items.get(product_id) != quantity:
+            items[product_id] = quantity
+            self._changed = True
+
+    def add(self, product_id, quantity=1):
+        self.set(product_id, self.quantity(product_id) + quantity)
+
+    def remove(self, *product_ids):
+        items = self._load()
+        for product_id in product_ids:
+            if items.pop(int(product_id), None) is not None:
+                self._changed = True
+
+    def clear(self):
+        if self._load():
+            self._items = {}
+            self._changed = True
+
+    def save(self):
+        if not self._changed:
+            return
+        if self.key is None:
+            self.new_token = secrets.token_urlsafe(24)
+            self.key = f'a{self.new_token}'
+        data = encode_items(self._items)
+        self._write_db(data)
+        self._cache(data)
+        self._changed = False
+
+    def _write_db(self, data):
+        if not data:
+            Cart.objects.filter(key=self.key).delete()
+            return
+        if Cart.objects.filter(key=self.key).update(data=data, updated_at=timezone.now()):
+            return
+        try:
+            Cart.objects.create(key=self.key, data=data, updated_at=timezone.now())
+        except IntegrityError:
+            # Параллельный запрос успел создать строку
+            Cart.objects.filter(key=self.key).update(data=data, updated_at=timezone.now())
+
+    def delete(self):
+        if self.key is None:
+            return
+        cache.delete(self._cache_key)
+        Cart.objects.filter(key=self.key).delete()
+        self._items = {}
+        self._changed = False
+
+
+def merge_anonymous_cart(request, user):
+    """Перенести гостевую корзину в корзину пользователя при входе"""
+    token = request.COOKIES.get(_setting('CART_COOKIE_NAME', 'cart_id'), '')
+    if not TOKEN_RE.match(token):
+        return
+    anonymous = CartStore(f'a{token}')
+    target = CartStore.for_user(user)
+    if anonymous:
+        for pid, qty in anonymous.items():
+            target.add(pid, qty)
+        target.save()
+        anonymous.delete()
+    request.cart = target
+    request.cart_cookie_stale = True
+
+
+class CartMiddleware:
+    """request.cart — корзина, которая грузится только при обращении"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        request.cart = SimpleLazyObject(lambda: CartStore.for_request(request))
+        response = self.get_response(request)
+        cart = self._loaded_cart(request)
+        if cart is not None:
+            cart.save()
+        return self._set_cookie(request, cart, response)
+
+    async def __acall__(self, request):
+        request.cart = SimpleLazyObject(lambda: CartStore.for_request(request))
+        response = await self.get_response(request)
+        cart = self._loaded_cart(request)
+        # В поток уходим, только если корзину действительно надо записать
+        if cart is not None and cart._changed:
+            await sync_to_async(cart.save)()
+        return self._set_cookie(request, cart, response)
+
+    def _loaded_cart(self, request):
+        cart = request.cart
+        if isinstance(cart, SimpleLazyObject):
+            cart = None if cart._wrapped is empty else cart._wrapped
+        return cart
+
+    def _set_cookie(self, request, cart, response):
+        cookie_name = _setting('CART_COOKIE_NAME', 'cart_id')
+        if cart is not None and cart.new_token:
+            response.set_cookie(
+                cookie_name, cart.new_token,
+                max_age=_setting('CART_COOKIE_AGE', 30 * 24 * 3600),
+                httponly=True, samesite='Lax',
+            )
+        if getattr(request, 'cart_cookie_stale', False):
+            response.delete_cookie(cookie_name, samesite='Lax')
+        return response
+
+
+class CartLine:
+    """Строка корзины с уже посчитанной ценой"""
+
+    def __init__(self, product, quantity, available=None):
+        self.product = product
+        self.quantity = quantity
+        # Сколько можно взять этому покупателю (остаток + его резерв)
+        self.available = product.stock if available is None else available
+        # Скидку уже посчитала база (Product.objects.with_discount())
+        self.discount = product.discount_percent
+        self.unit_price = product.discounted_price
+        self.total = self.unit_price * quantity
+
+    @property
+    def in_stock(self):
+        return self.quantity <= self.available
+
+
+class PricedCart:
+    """Корзина, посчитанная одним запросом к базе"""
+
+    def __init__(self, lines, missing):
+        self.lines = lines
+        # id товаров, которые лежат в корзине, но уже удалены из каталога
+        self.missing = missing
+        self.total = sum((line.total for line in lines), Decimal('0.00'))
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+
+def price_cart(cart, user=None):
+    """
+    Посчитать корзину ({id: количество}, например CartStore) одним запросом.
+
+    С user доступное количество учитывает его резерв (ещё один запрос).
+    """
+    quantities = dict(cart.items())
+    products = Product.objects.with_discount().in_bulk(quantities.keys())
+    available = inventory.available_for(user, list(products.values())) if user is not None else {}
+    return _priced(quantities, products, available)
+
+
+async def aprice_cart(cart, user=None):
+    """price_cart() для async views; CartStore должен быть загружен (aload)"""
+    quantities = dict(cart.items())
+    products = await Product.objects.with_discount().ain_bulk(quantities.keys())
+    available = await inventory.aavailable_for(user, list(products.values())) if user is not None else {}
+    return _priced(quantities, products, available)
+
+
+def _priced(quantities, products, available):
+    lines = []
+    missing = []
+    for pid, qty in quantities.items():
+        product = products.get(pid)
+        if product is None:
+            missing.append(pid)
+        else:
+            lines.append(CartLine(product, qty, available.get(pid)))
+    return PricedCart(lines, missing)
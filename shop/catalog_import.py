@@ -0,0 +1,220 @@
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .deals import sync_deals
+from .models import Product, RestockJob
+from .search import index_products
+
+# Поля, которые можно загружать; без name/price/stock товар создать нельзя,
+# такие строки только обновляют уже существующие товары
+IMPORT_FIELDS = ['sku', 'name', 'description', 'price', 'stock', 'image']
+REQUIRED_FIELDS = {'name', 'price', 'stock'}
+READ_SIZE = 64 * 1024
+
+
+class ImportStats:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.errors = []
+
+    def __str__(self):
+        return (f'создано: {self.created}, обновлено: {self.updated}, '
+                f'пропущено: {self.skipped}, с ошибками: {len(self.errors)}')
+
+
+def iter_json_records(stream):
+    """
+    Читать записи из файла потоком, не загружая его целиком.
+
+    Понимает JSON-массив (в том числе формат фикстур loaddata) и JSONL.
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(READ_SIZE)
+    start = len(buffer) - len(buffer.lstrip())
+    if not buffer[start:start + 1] == '[':
+        # JSONL: по объекту на строку
+        for line in _lines(buffer, stream):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+        return
+
+    pos = start + 1
+    eof = False
+    while True:
+        # Пропускаем пробелы и запятые между элементами
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError('Файл оборвался: нет закрывающей скобки массива')
+            buffer, pos = stream.read(READ_SIZE), 0
+            eof = not buffer
+            continue
+        if buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Объект не поместился в буфер — дочитываем
+            chunk = stream.read(READ_SIZE)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield record
+        pos = end
+
+
+def _lines(head, stream):
+    rest = ''
+    chunk = head
+    while chunk:
+        lines = (rest + chunk).split('\n')
+        rest = lines.pop()
+        yield from lines
+        chunk = stream.read(READ_SIZE)
+    if rest:
+        yield rest
+
+
+def _normalize(record, key):
+    """Запись фикстуры или плоский объект -> словарь полей товара (или None)"""
+    if 'model' in record and 'fields' in record:
+        if record['model'] != 'shop.product':
+            return None
+        row = dict(record['fields'])
+        if 'pk' in record:
+            row['id'] = record['pk']
+    else:
+        row = dict(record)
+
+    row = {name: value for name, value in row.items() if name in IMPORT_FIELDS or name == 'id'}
+    if row.get(key) in (None, ''):
+        raise ValueError(f'нет ключа {key}')
+    if key == 'id':
+        row['id'] = int(row['id'])
+    else:
+        row.pop('id', None)
+    if 'price' in row:
+        try:
+            row['price'] = Decimal(str(row['price'])).quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f'неверная цена {row["price"]!r}')
+        if not row['price'].is_finite() or row['price'] < 0:
+            raise ValueError(f'неверная цена {row["price"]!r}')
+    if 'stock' in row:
+        row['stock'] = int(row['stock'])
+        if row['stock'] < 0:
+            raise ValueError('отрицательный остаток')
+    if row.get('image') is None and 'image' in row:
+        row['image'] = ''
+    return row
+
+
+def _grouped(rows):
+    """Разбить строки по набору полей: в одном bulk-запросе набор должен совпадать"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    return groups.items()
+
+
+def _import_batch(rows, key, stats):
+    # Повтор ключа внутри пачки — побеждает последняя строка
+    rows = list({row[key]: row for row in rows}.values())
+    keys = [row[key] for row in rows]
+    existing = {
+        value: (pk, stock)
+        for value, pk, stock in Product.objects.filter(**{f'{key}__in': keys}).values_list(key, 'id', 'stock')
+    }
+
+    now = timezone.now()
+    with transaction.atomic():
+        for fields, group in _grouped(rows):
+            update_fields = sorted(fields - {key, 'id'})
+            if REQUIRED_FIELDS <= fields:
+                Product.objects.bulk_create(
+                    [Product(**row) for row in group],
+                    update_conflicts=True,
+                    unique_fields=[key],
+                    update_fields=update_fields + ['updated_at'],
+                )
+                stats.created += sum(1 for row in group if row[key] not in existing)
+                stats.updated += sum(1 for row in group if row[key] in existing)
+                continue
+
+            known = [row for row in group if row[key] in existing]
+            stats.skipped += len(group) - len(known)
+            if known and update_fields:
+                objects = []
+                for row in known:
+                    product = Product(**row)
+                    product.pk = existing[row[key]][0]
+                    product.updated_at = now
+                    objects.append(product)
+                # bulk_update() не выставляет auto_now — updated_at задан выше
+                Product.objects.bulk_update(objects, update_fields + ['updated_at'])
+                stats.updated += len(known)
+
+        # Поступления считаем по снимку остатков до импорта — одна рассылка на пачку
+        restocked = [
+            existing[row[key]][0]
+            for row in rows
+            if row[key] in existing and existing[row[key]][1] == 0 and row.get('stock', 0) > 0
+        ]
+        if restocked:
+            RestockJob.schedule(restocked)
+
+        ids = list(Product.objects.filter(**{f'{key}__in': keys}).values_list('id', flat=True))
+        sync_deals(ids)
+        if connection.vendor == 'sqlite':
+            index_products(ids)
+
+
+def import_catalog(stream, key='sku', batch_size=1000, progress=None):
+    """
+    Загрузить товары из JSON/JSONL пачками через upsert по ключу.
+
+    Save() и сигналы не вызываются: поисковый индекс, витрина скидок, рассылки
+    о поступлении и версия кэша каталога обновляются один раз на пачку
+    или на весь импорт.
+    """
+    stats = ImportStats()
+    records = iter_json_records(stream)
+    number = 0
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+        batch = []
+        for record in chunk:
+            number += 1
+            try:
+                row = _normalize(record, key)
+            except (TypeError, ValueError) as error:
+                stats.errors.append(f'запись {number}: {error}')
+                continue
+            if row is not None:
+                batch.append(row)
+        if batch:
+            _import_batch(batch, key, stats)
+        if progress:
+            progress(stats)
+
+    if key == 'id':
+        # id пришли из файла — двигаем последовательность, как это делает loaddata
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                cursor.execute(sql)
+    if stats.created or stats.updated:
+        bump_catalog_version()
+    return stats
@@ -0,0 +1,140 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import catalog_last_modified, catalog_version
+from .models import Product
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _client_part(request):
+    """
+    (часть ETag от посетителя, вошёл ли он) или None — тогда 304 не отдаём.
+
+    Шапка страницы зависит от входа, формы — от CSRF-cookie: после входа
+    или смены cookie браузер не должен получить старую страницу из своего кэша.
+    Непоказанные сообщения (messages) тоже должны попасть в ответ.
+    """
+    if CookieStorage.cookie_name in request.COOKIES:
+        return None
+    user_id = ''
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        # Из сессии, без запроса пользователя из базы
+        user_id = request.session.get(SESSION_KEY, '')
+    return f'{user_id}:{request.COOKIES.get(settings.CSRF_COOKIE_NAME, "")}', bool(user_id)
+
+
+def _validators(request, marker, args, kwargs):
+    client = _client_part(request)
+    if client is None:
+        return None
+    marker = marker(request, *args, **kwargs)
+    if marker is None:
+        return None
+    key, last_modified = marker
+    client_key, authenticated = client
+    etag = hashlib.md5(f'{key}|{client_key}'.encode()).hexdigest()
+    return quote_etag(etag), last_modified, authenticated
+
+
+def _sets_new_cookies(request, response):
+    """
+    Выдаёт ли ответ посетителю cookie, которой у него ещё нет.
+
+    CSRF-cookie (после get_token() в шаблоне) и cookie сессии добавляются
+    уже после view, поэтому смотрим и на их признаки в запросе. Продление
+    CSRF-cookie, которую браузер прислал, не в счёт: с Vary: Cookie такой
+    ответ достанется только ему же.
+    """
+    session = getattr(request, 'session', None)
+    return bool(
+        response.cookies
+        or (request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and settings.CSRF_COOKIE_NAME not in request.COOKIES)
+        or (session is not None and session.modified)
+    )
+
+
+def _respond(request, response, validators):
+    """Проставить валидаторы и Cache-Control на ответ 200 или 304"""
+    if response.status_code not in (200, 304):
+        return response
+    etag, last_modified, authenticated = validators
+    response.headers.setdefault('ETag', etag)
+    response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    if authenticated or _sets_new_cookies(request, response):
+        # Ответ с Set-Cookie общему кэшу отдавать нельзя: он раздал бы всем
+        # посетителям без cookie одну и ту же CSRF-cookie и токен в формах
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # Гостевую страницу может хранить и общий кэш (обратный прокси), но
+        # только вместе с cookie: в формах CSRF-токен конкретного браузера
+        patch_cache_control(
+            response, public=True, max_age=0, s_maxage=_setting('CONDITIONAL_SHARED_MAX_AGE', 60),
+        )
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional(marker):
+    """
+    Отвечать 304 на If-None-Match/If-Modified-Since до работы view.
+
+    marker(request, *args, **kwargs) -> (ключ содержимого, datetime изменения)
+    или None, если проверка не нужна (например, объекта нет — 404 отдаст view).
+    """
+    def decorator(view_func):
+        def check(request, args, kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return None, None
+            validators = _validators(request, marker, args, kwargs)
+            if validators is None:
+                return None, None
+            etag, last_modified, _ = validators
+            return validators, get_conditional_response(
+                request, etag=etag, last_modified=int(last_modified.timestamp()),
+            )
+
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                # marker ходит в базу, а сессия в Django 4.2 читается только синхронно
+                validators, not_modified = await sync_to_async(check)(request, args, kwargs)
+                if validators is None:
+                    return await view_func(request, *args, **kwargs)
+                if not_modified is not None:
+                    return _respond(request, not_modified, validators)
+                return _respond(request, await view_func(request, *args, **kwargs), validators)
+        else:
+            @wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                validators, not_modified = check(request, args, kwargs)
+                if validators is None:
+                    return view_func(request, *args, **kwargs)
+                if not_modified is not None:
+                    return _respond(request, not_modified, validators)
+                return _respond(request, view_func(request, *args, **kwargs), validators)
+        return wrapper
+
+    return decorator
+
+
+def product_marker(request, product_id):
+    """Товар меняется вместе с Product.updated_at (остатки, цена, картинка)"""
+    updated_at = Product.objects.filter(pk=product_id).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return f'product:{product_id}:{updated_at.timestamp()}', updated_at
+
+
+def catalog_marker(request):
+    """Страница каталога: версия каталога и параметры (сортировка, фильтр, курсор)"""
+    return f'catalog:{catalog_version()}:{request.GET.urlencode()}', catalog_last_modified()
@@ -0,0 +1,133 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import acached_render, cached_render
+from .models import Campaign, Deal, Product
+
+DEAL_FIELDS = ['name', 'price', 'discount_percent', 'discounted_price', 'stock', 'image', 'image_variants']
+LISTING_TEMPLATE = 'includes/black_friday_products.html'
+PRERENDERED_KEY = 'deals:prerendered'
+CAMPAIGN_KEY = 'deals:campaign'
+
+
+def _deal(product, percent, price):
+    return Deal(
+        product_id=product.pk,
+        name=product.name,
+        price=product.price,
+        discount_percent=percent,
+        discounted_price=price,
+        stock=product.stock,
+        image=product.image.name if product.image else '',
+        image_variants=product.image_variants,
+    )
+
+
+def _upsert(deals):
+    Deal.objects.bulk_create(deals, update_conflicts=True, unique_fields=['product'], update_fields=DEAL_FIELDS)
+
+
+def sync_product(product):
+    """Обновить витрину по одному товару после save(), без чтения из базы"""
+    percent, price = product.get_discount_info()
+    if percent:
+        _upsert([_deal(product, percent, price)])
+    else:
+        Deal.objects.filter(product_id=product.pk).delete()
+
+
+def sync_deals(product_ids):
+    """Пересчитать витрину для товаров, изменённых в обход save() (UPDATE, импорт)"""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    products = list(
+        Product.objects.with_discount()
+        .filter(id__in=product_ids, discount_percent__gt=0)
+        .defer('description')
+    )
+    Deal.objects.filter(product_id__in=product_ids).exclude(product_id__in=[p.id for p in products]).delete()
+    if products:
+        _upsert([_deal(p, p.discount_percent, p.discounted_price) for p in products])
+
+
+def rebuild_deals(chunk_size=1000):
+    """Собрать витрину заново по всему каталогу"""
+    Deal.objects.all().delete()
+    products = (
+        Product.objects.with_discount()
+        .filter(discount_percent__gt=0)
+        .defer('description')
+        .order_by('id')
+    )
+    batch = []
+    for product in products.iterator(chunk_size=chunk_size):
+        batch.append(_deal(product, product.discount_percent, product.discounted_price))
+        if len(batch) >= chunk_size:
+            Deal.objects.bulk_create(batch)
+            batch = []
+    Deal.objects.bulk_create(batch)
+
+
+def listing():
+    # Один запрос по deal_listing_idx
+    return Deal.objects.order_by('-discount_percent', 'discounted_price', 'product')
+
+
+def prerender_deals():
+    """Отрендерить список скидок заранее — для режима пиковой нагрузки"""
+    html = render_to_string(LISTING_TEMPLATE, {'deals': listing()})
+    cache.set(PRERENDERED_KEY, html, None)
+    return html
+
+
+def deals_html():
+    """
+    HTML списка скидок.
+
+    Обычно — через кэш страниц (сбрасывается при изменении каталога).
+    В режиме DEALS_PEAK_MODE отдаётся заранее отрендеренный вариант,
+    который не зависит от версии каталога и обновляется командой
+    prerender_deals; база при этом не читается вовсе.
+    """
+    if getattr(settings, 'DEALS_PEAK_MODE', False):
+        html = cache.get(PRERENDERED_KEY)
+        if html is None:
+            html = prerender_deals()
+        return mark_safe(html)
+    return cached_render(LISTING_TEMPLATE, (), lambda: {'deals': listing()})
+
+
+async def adeals_html():
+    """deals_html() для async views"""
+    if getattr(settings, 'DEALS_PEAK_MODE', False):
+        html = cache.get(PRERENDERED_KEY)
+        if html is None:
+            html = render_to_string(LISTING_TEMPLATE, {'deals': [deal async for deal in listing()]})
+            cache.set(PRERENDERED_KEY, html, None)
+        return mark_safe(html)
+
+    async def get_context():
+        return {'deals': [deal async for deal in listing()]}
+
+    return await acached_render(LISTING_TEMPLATE, (), get_context)
+
+
+def current_campaign():
+    """Campaign.current() через кэш; сбрасывается при изменении распродаж"""
+    campaign = cache.get(CAMPAIGN_KEY)
+    if campaign is None:
+        # False — «распродаж нет», чтобы не ходить в базу и в этом случае
+        campaign = Campaign.current() or False
+        cache.set(CAMPAIGN_KEY, campaign, getattr(settings, 'CAMPAIGN_CACHE_SECONDS', 60))
+    return campaign or None
+
+
+async def acurrent_campaign():
+    campaign = cache.get(CAMPAIGN_KEY)
+    if campaign is None:
+        campaign = await Campaign.acurrent() or False
+        cache.set(CAMPAIGN_KEY, campaign, getattr(settings, 'CAMPAIGN_CACHE_SECONDS', 60))
+    return campaign or None
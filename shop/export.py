@@ -0,0 +1,82 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+# Одна строка выгрузки — одна позиция заказа с данными самого заказа
+EXPORT_FIELDS = [
+    ('order_id', 'order_id'),
+    ('created_at', 'order__created_at'),
+    ('status', 'order__status'),
+    ('username', 'order__user__username'),
+    ('order_total', 'order__total'),
+    ('tracking_number', 'order__tracking_number'),
+    ('product_id', 'product_id'),
+    ('name', 'name'),
+    ('price', 'price'),
+    ('discounted_price', 'discounted_price'),
+    ('quantity', 'quantity'),
+    ('line_total', 'total'),
+]
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson; charset=utf-8',
+}
+STATUSES = {code for code, _ in Order.STATUS_CHOICES}
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def export_rows(date_from=None, date_to=None, status=None, chunk_size=2000):
+    """
+    Позиции заказов кортежами в порядке EXPORT_FIELDS.
+
+    Читаются через values_list().iterator(), без моделей и без старого
+    JSON-поля Order.items, поэтому память не растёт с числом заказов.
+    date_to включается целиком.
+    """
+    items = OrderItem.objects.all()
+    if date_from:
+        items = items.filter(order__created_at__gte=_day_start(date_from))
+    if date_to:
+        items = items.filter(order__created_at__lt=_day_start(date_to + timedelta(days=1)))
+    if status:
+        items = items.filter(order__status=status)
+    columns = [column for _, column in EXPORT_FIELDS]
+    return items.order_by('order_id', 'id').values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None:
+        return None
+    return value if isinstance(value, (int, str)) else str(value)
+
+
+def iter_export(rows, fmt):
+    """Строки выгрузки по одной — для StreamingHttpResponse или файла"""
+    header = [name for name, _ in EXPORT_FIELDS]
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        # BOM, чтобы Excel сразу открыл файл в UTF-8
+        yield '﻿' + writer.writerow(header)
+        for row in rows:
+            yield writer.writerow([_value(value) for value in row])
+    elif fmt == 'jsonl':
+        for row in rows:
+            yield json.dumps(dict(zip(header, map(_value, row))), ensure_ascii=False) + '\n'
+    else:
+        raise ValueError(f'Неизвестный формат: {fmt}')
@@ -0,0 +1,76 @@
+import hashlib
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Ширина вариантов: карточка в сетке, страница товара и её версия для retina
+VARIANT_WIDTHS = {
+    'card': 320,
+    'detail': 700,
+    'retina': 1400,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+# Имена файлов содержат хэш исходника, поэтому их можно отдавать
+# с Cache-Control: immutable — новый файл всегда получит новое имя
+VARIANTS_DIR = 'products/variants'
+
+
+def render_variants(data):
+    """
+    Нарезать исходное изображение на варианты во всех форматах.
+
+    Возвращает (манифест, [(имя файла, содержимое)]). Ничего не пишет
+    на диск, поэтому может выполняться в отдельном процессе.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    manifest = {}
+    files = []
+    with Image.open(io.BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'A' in source.getbands() or source.mode == 'P' else 'RGB')
+        for variant, width in VARIANT_WIDTHS.items():
+            # Не растягиваем маленькие исходники
+            width = min(width, source.width)
+            height = max(1, round(source.height * width / source.width))
+            resized = source.resize((width, height), Image.LANCZOS)
+            entry = {'width': width}
+            for extension, (pil_format, options) in FORMATS.items():
+                image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                name = f'{VARIANTS_DIR}/{digest}-{variant}.{extension}'
+                files.append((name, buffer.getvalue()))
+                entry[extension] = name
+            manifest[variant] = entry
+    return manifest, files
+
+
+def store_files(files):
+    """Сохранить файлы вариантов; уже существующие (тот же хэш) пропускаются"""
+    for name, content in files:
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(content))
+
+
+def build_variants(image_field):
+    """Сгенерировать и сохранить варианты для Product.image; вернуть манифест"""
+    image_field.open('rb')
+    try:
+        data = image_field.read()
+    finally:
+        image_field.close()
+    manifest, files = render_variants(data)
+    store_files(files)
+    return manifest
+
+
+def render_variants_from_path(path):
+    """Обёртка для пула процессов: читает исходник с диска"""
+    with open(path, 'rb') as source:
+        return render_variants(source.read())
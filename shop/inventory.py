@@ -0,0 +1,218 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import bump_catalog_version_on_commit
+from .deals import sync_deals
+from .models import Product, RestockJob, StockReservation
+
+
+class InsufficientStock(Exception):
+    """Каких-то товаров не хватает; available — {product_id: сколько можно взять}"""
+
+    def __init__(self, available):
+        super().__init__(f'Недостаточно товара: {sorted(available)}')
+        self.available = available
+
+
+def _per_product(values):
+    return Case(
+        *[When(id=pid, then=Value(qty)) for pid, qty in values.items()],
+        default=Value(0),
+        output_field=models.IntegerField(),
+    )
+
+
+def adjust_stock(deltas, reserved=None):
+    """
+    Изменить остатки одним UPDATE: {product_id: сколько списать}.
+
+    Отрицательное значение возвращает товар на склад. Списание условное
+    (WHERE stock >= n), поэтому двум покупателям не продать одну вещь.
+    Если хоть по одному товару не хватило остатка, не меняется ничего.
+    reserved — {product_id: на сколько изменить Product.reserved} тем же UPDATE.
+    """
+    deltas = {pid: qty for pid, qty in deltas.items() if qty}
+    reserved = {pid: qty for pid, qty in (reserved or {}).items() if qty}
+    ids = set(deltas) | set(reserved)
+    if not ids:
+        return
+
+    condition = Q()
+    for pid in ids:
+        qty = deltas.get(pid, 0)
+        condition |= Q(id=pid, stock__gte=qty) if qty > 0 else Q(id=pid)
+    changes = {'stock': F('stock') - _per_product(deltas), 'updated_at': timezone.now()}
+    if reserved:
+        changes['reserved'] = F('reserved') + _per_product(reserved)
+
+    with transaction.atomic():
+        updated = Product.objects.filter(condition).update(**changes)
+        if updated != len(ids):
+            wanted = [pid for pid, qty in deltas.items() if qty > 0]
+            available = dict(Product.objects.filter(id__in=wanted).values_list('id', 'stock'))
+            shortage = {
+                pid: available.get(pid, 0)
+                for pid in wanted
+                if available.get(pid, 0) < deltas[pid]
+            }
+            # Несовпадение без нехватки — возврат на склад удалённого товара
+            if shortage:
+                raise InsufficientStock(shortage)
+        # Товар мог попасть в ступень скидки или выйти из неё
+        sync_deals(ids)
+        # Остатки и скидки видны на страницах каталога
+        bump_catalog_version_on_commit()
+
+
+def shift_stock(products, delta):
+    """
+    Изменить остаток всех товаров из queryset на delta одним UPDATE.
+
+    Для массовых правок из админки; остаток не уходит ниже нуля.
+    Возвращает число изменённых товаров.
+    """
+    with transaction.atomic():
+        ids = list(products.values_list('id', flat=True))
+        restocked = []
+        if delta > 0:
+            restocked = list(Product.objects.filter(id__in=ids, stock=0).values_list('id', flat=True))
+        updated = Product.objects.filter(id__in=ids).update(
+            stock=Greatest(F('stock') + delta, Value(0)),
+            updated_at=timezone.now(),
+        )
+        sync_deals(ids)
+        if restocked:
+            RestockJob.schedule(restocked)
+        bump_catalog_version_on_commit()
+    return updated
+
+
+def _reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_MINUTES', 15))
+
+
+def _locked_holds(user):
+    # Сначала блокируем самого покупателя: у нового покупателя строк резерва
+    # ещё нет, и без этого два параллельных reserve() вставили бы одни и те же
+    # (user, product) — IntegrityError вместо ожидания
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+    holds = StockReservation.objects.select_for_update().filter(user=user)
+    return dict(holds.values_list('product_id', 'quantity'))
+
+
+def _own_holds(user, products):
+    if not user.is_authenticated or not products:
+        return None
+    return StockReservation.objects.filter(
+        user=user, product_id__in=[product.id for product in products],
+    ).values_list('product_id', 'quantity')
+
+
+def _available(products, held):
+    return {product.id: product.stock + held.get(product.id, 0) for product in products}
+
+
+def available_for(user, products):
+    """
+    Сколько каждого товара может взять покупатель: {product_id: остаток + его резерв}.
+
+    Оформление заказа переносит товар из stock в резерв покупателя, но этот
+    резерв его же: confirm() засчитает его, пока release_expired() не вернул
+    товар на склад. Для гостя — просто остаток, без запроса к базе.
+    """
+    holds = _own_holds(user, products)
+    return _available(products, dict(holds) if holds is not None else {})
+
+
+async def aavailable_for(user, products):
+    """available_for() для async views; request.user должен быть загружен"""
+    holds = _own_holds(user, products)
+    return _available(products, {pid: qty async for pid, qty in holds} if holds is not None else {})
+
+
+def _apply_holds(held, quantities, keep=True):
+    """
+    Довести списанное под резерв с held до quantities.
+
+    keep=True — товар остаётся в резерве (Product.reserved), False — резерв
+    закрывается окончательной продажей.
+    """
+    deltas = {
+        pid: quantities.get(pid, 0) - held.get(pid, 0)
+        for pid in set(held) | set(quantities)
+    }
+    try:
+        adjust_stock(deltas, reserved=deltas if keep else {pid: -qty for pid, qty in held.items()})
+    except InsufficientStock as e:
+        # Свой же резерв покупателю тоже доступен
+        raise InsufficientStock({
+            pid: stock + held.get(pid, 0) for pid, stock in e.available.items()
+        })
+
+
+def reserve(user, quantities):
+    """
+    Зарезервировать корзину {product_id: qty} на время оформления.
+
+    Товар списывается со склада сразу, а если покупатель не дойдёт
+    до оплаты — вернётся через release_expired().
+    """
+    expires_at = timezone.now() + _reservation_ttl()
+    with transaction.atomic():
+        held = _locked_holds(user)
+        if held == quantities:
+            # Корзина не менялась — просто продлеваем резерв
+            StockReservation.objects.filter(user=user).update(expires_at=expires_at)
+            return
+        _apply_holds(held, quantities)
+        StockReservation.objects.filter(user=user).delete()
+        StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=pid, quantity=qty, expires_at=expires_at)
+            for pid, qty in quantities.items()
+        ])
+
+
+def confirm(user, quantities):
+    """
+    Превратить резерв в окончательное списание при оформлении заказа.
+
+    Если резерв истёк и был снят или корзина изменилась, недостающее
+    списывается тут же одним UPDATE. Вызывать внутри transaction.atomic()
+    вместе с созданием заказа.
+    """
+    held = _locked_holds(user)
+    _apply_holds(held, quantities, keep=False)
+    if held:
+        StockReservation.objects.filter(user=user).delete()
+
+
+def release_expired(batch_size=500, now=None):
+    """Пачками вернуть на склад просроченные резервы; возвращает их число"""
+    now = now or timezone.now()
+    released = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects
+                .select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not batch:
+                return released
+            deltas = defaultdict(int)
+            for _, pid, qty in batch:
+                deltas[pid] -= qty
+            adjust_stock(deltas, reserved=deltas)
+            StockReservation.objects.filter(id__in=[rid for rid, _, _ in batch]).delete()
+            # Вернувшийся товар мог снова появиться в наличии
+            RestockJob.schedule(list(deltas))
+        released += len(batch)
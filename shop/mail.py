@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+# Сколько держим письмо за воркером, прежде чем его сможет взять другой
+CLAIM_TIMEOUT = timedelta(minutes=5)
+
+
+class MailServerUnavailable(Exception):
+    """Не удалось подключиться к почтовому серверу; письма остались в очереди"""
+
+
+def _retry_delay(attempts):
+    """Экспоненциальная пауза перед повтором: 1, 2, 4, 8... минут"""
+    base = getattr(settings, 'EMAIL_OUTBOX_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 60 * 60))
+
+
+def _claim_batch(batch_size, now):
+    """Забрать пачку писем, не мешая другим воркерам"""
+    with transaction.atomic():
+        ids = list(
+            OutgoingEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        OutgoingEmail.objects.filter(id__in=ids).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(OutgoingEmail.objects.filter(id__in=ids).order_by('id'))
+
+
+def send_pending(batch_size=100, connection=None):
+    """
+    Отправить одну пачку писем из очереди по одному SMTP-соединению.
+
+    Возвращает (отправлено, отложено на повтор или провалено).
+    Если сервер недоступен, бросает MailServerUnavailable, не трогая попытки.
+    """
+    now = timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    max_attempts = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    connection = connection or get_connection(fail_silently=False)
+    sent = 0
+    try:
+        connection.open()
+    except Exception as e:
+        # Письма тут ни при чём: попытку не засчитываем и сразу возвращаем
+        # пачку в очередь, а паузу делает воркер (send_outbox --loop)
+        OutgoingEmail.objects.filter(id__in=[email.id for email in batch]).update(next_attempt_at=now)
+        raise MailServerUnavailable(f'{type(e).__name__}: {e}') from e
+    try:
+        for email in batch:
+            message = EmailMessage(
+                email.subject, email.body, email.from_email, email.to,
+                connection=connection,
+            )
+            try:
+                connection.send_messages([message])
+            except Exception as e:
+                _mark_failed(email, e, now, max_attempts)
+            else:
+                email.status = 'sent'
+                email.attempts += 1
+                email.sent_at = timezone.now()
+                sent += 1
+    finally:
+        connection.close()
+
+    OutgoingEmail.objects.bulk_update(
+        batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'],
+    )
+    return sent, len(batch) - sent
+
+
+def _mark_failed(email, error, now, max_attempts):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= max_attempts:
+        email.status = 'failed'
+    else:
+        email.next_attempt_at = now + _retry_delay(email.attempts)
@@ -0,0 +1,55 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+
+from shop.models import Order, OrderItem, Product
+
+
+def _decimal(value):
+    return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+
+
+class Command(BaseCommand):
+    help = 'Перенести состав старых заказов из JSON-поля items в таблицу OrderItem'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        # Заказы без строк; идём по id, поэтому команду можно прервать и запустить снова
+        pending = Order.objects.filter(lines__isnull=True).only('id', 'created_at', 'items').order_by('id')
+        last_id = 0
+        converted = 0
+        while True:
+            orders = list(pending.filter(id__gt=last_id)[:chunk_size])
+            if not orders:
+                break
+            last_id = orders[-1].id
+
+            product_ids = {
+                item.get('product_id') for order in orders for item in order.items
+            }
+            existing = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+
+            lines = []
+            for order in orders:
+                for item in order.items:
+                    quantity = item.get('quantity', 1)
+                    price = _decimal(item.get('price'))
+                    discounted_price = _decimal(item.get('discounted_price', item.get('price')))
+                    lines.append(OrderItem(
+                        order=order,
+                        product_id=item.get('product_id') if item.get('product_id') in existing else None,
+                        name=item.get('name', ''),
+                        price=price,
+                        discounted_price=discounted_price,
+                        quantity=quantity,
+                        total=_decimal(item.get('total', discounted_price * quantity)),
+                        created_at=order.created_at,
+                    ))
+            OrderItem.objects.bulk_create(lines)
+            converted += len(orders)
+            self.stdout.write(f'Обработано заказов: {converted}')
+
+        self.stdout.write(self.style.SUCCESS(f'Готово, перенесено заказов: {converted}'))
@@ -0,0 +1,136 @@
+import asyncio
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))]
+
+
+class ThreadCounter:
+    """Наибольшее число живых потоков за время замера"""
+
+    def __init__(self):
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сколько медленных клиентов держит один процесс: ASGI против WSGI. '
+        'Медленный клиент забирает каждый кусок ответа за --delay секунд; '
+        'WSGI-воркер держит на это время поток из пула --threads, ASGI — только корутину.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/')
+        parser.add_argument('--clients', type=int, default=200, help='Одновременных клиентов')
+        parser.add_argument('--delay', type=float, default=0.2, help='Секунд на отдачу ответа клиенту')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков WSGI-воркера (gunicorn --threads)')
+
+    def handle(self, *args, **options):
+        path, clients, delay = options['path'], options['clients'], options['delay']
+        self.stdout.write(
+            f'{path}: клиентов {clients}, отдача {delay} с; '
+            f'async views {"включены" if getattr(settings, "ASYNC_VIEWS", False) else "выключены (включить: SHOP_ASYNC_VIEWS=1)"}'
+        )
+        # Прогрев: кэш страниц и шаблонов, соединения с базой
+        self._wsgi_request(WSGIHandler(), path, 0)
+        asyncio.run(self._asgi_request(ASGIHandler(), path, 0))
+
+        self._report('WSGI', *self._bench_wsgi(path, clients, delay, options['threads']))
+        self._report('ASGI', *self._bench_asgi(path, clients, delay))
+
+    def _report(self, name, wall, latencies, statuses, threads):
+        errors = sum(1 for status in statuses if status >= 400)
+        self.stdout.write(
+            f'{name}: {len(latencies) / wall:.1f} запросов/с, всего {wall:.2f} с, '
+            f'p50 {_percentile(latencies, 50) * 1000:.0f} мс, p99 {_percentile(latencies, 99) * 1000:.0f} мс, '
+            f'потоков {threads}, ошибок {errors}'
+        )
+
+    def _wsgi_request(self, handler, path, delay):
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': 'localhost',
+            'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1', 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+        }
+        status = []
+        started = time.perf_counter()
+        response = handler(environ, lambda code, headers, exc_info=None: status.append(int(code.split()[0])))
+        try:
+            for _ in response:
+                # Поток сервера ждёт, пока клиент заберёт кусок ответа
+                time.sleep(delay)
+        finally:
+            response.close()
+        return time.perf_counter() - started, status[0]
+
+    def _bench_wsgi(self, path, clients, delay, threads):
+        handler = WSGIHandler()
+        with ThreadCounter() as counter, ThreadPoolExecutor(threads) as pool:
+            started = time.perf_counter()
+            results = list(pool.map(lambda _: self._wsgi_request(handler, path, delay), range(clients)))
+            wall = time.perf_counter() - started
+        return wall, [r[0] for r in results], [r[1] for r in results], counter.peak
+
+    async def _asgi_request(self, handler, path, delay):
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+            'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+        }
+        disconnected = asyncio.Event()
+        requested = []
+        status = []
+
+        async def receive():
+            if not requested:
+                requested.append(True)
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                # Сервер ждёт клиента (drain), но поток не занят
+                await asyncio.sleep(delay)
+
+        started = time.perf_counter()
+        await handler(scope, receive, send)
+        disconnected.set()
+        return time.perf_counter() - started, status[0]
+
+    def _bench_asgi(self, path, clients, delay):
+        handler = ASGIHandler()
+
+        async def run():
+            return await asyncio.gather(*(self._asgi_request(handler, path, delay) for _ in range(clients)))
+
+        with ThreadCounter() as counter:
+            started = time.perf_counter()
+            results = asyncio.run(run())
+            wall = time.perf_counter() - started
+        return wall, [r[0] for r in results], [r[1] for r in results], counter.peak
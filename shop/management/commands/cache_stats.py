@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop.cache import cache_stats, catalog_version
+
+
+class Command(BaseCommand):
+    help = 'Показать счётчики попаданий и промахов кэша страниц'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.stdout.write(f"Версия каталога: {catalog_version()}")
+        self.stdout.write(f"Попаданий: {stats['hits']}, промахов: {stats['misses']} ({ratio:.1f}% попаданий)")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from shop.export import FORMATS, STATUSES, export_rows, iter_export
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить позиции заказов в CSV или JSONL (потоково, память не растёт)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=_date, help='ГГГГ-ММ-ДД')
+        parser.add_argument('--to', dest='date_to', type=_date, help='ГГГГ-ММ-ДД, включительно')
+        parser.add_argument('--status', choices=sorted(STATUSES))
+        parser.add_argument('--output', '-o', help='Файл (по умолчанию stdout)')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            options['date_from'], options['date_to'], options['status'], chunk_size=options['chunk_size'],
+        )
+        chunks = iter_export(rows, options['format'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        try:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(chunks)
+        except OSError as error:
+            raise CommandError(error)
@@ -0,0 +1,72 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop.cache import bump_catalog_version
+from shop.deals import sync_deals
+from shop.images import render_variants_from_path, store_files
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Нарезать уменьшенные копии картинок для товаров, у которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Процессов для обработки картинок')
+        parser.add_argument('--chunk-size', type=int, default=100)
+        parser.add_argument('--force', action='store_true', help='Перегенерировать для всех товаров')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        pending = Product.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['force']:
+            pending = pending.filter(image_variants={})
+        pending = pending.only('id', 'image').order_by('id')
+
+        pool = ProcessPoolExecutor(options['workers']) if options['workers'] > 1 else None
+        last_id = 0
+        done = failed = 0
+        try:
+            while True:
+                products = list(pending.filter(id__gt=last_id)[:chunk_size])
+                if not products:
+                    break
+                last_id = products[-1].id
+
+                # Ресайз и кодирование — в процессах, запись файлов и базы — здесь
+                paths = [default_storage.path(product.image.name) for product in products]
+                if pool:
+                    futures = [pool.submit(render_variants_from_path, path) for path in paths]
+                    results = [self._result(future.result) for future in futures]
+                else:
+                    results = [self._result(render_variants_from_path, path) for path in paths]
+
+                for product, result in zip(products, results):
+                    if result is None:
+                        failed += 1
+                        self.stderr.write(f'Не удалось обработать товар {product.id}: {product.image.name}')
+                        continue
+                    manifest, files = result
+                    store_files(files)
+                    Product.objects.filter(pk=product.pk).update(image_variants=manifest, updated_at=timezone.now())
+                    done += 1
+                # Витрина скидок хранит копию вариантов
+                sync_deals([product.id for product in products])
+                self.stdout.write(f'Обработано товаров: {done}')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        if done:
+            # Обновляли через update(), сигналы не сработали — сбрасываем кэш страниц сами
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Готово: {done}, с ошибками: {failed}'))
+
+    @staticmethod
+    def _result(call, *args):
+        try:
+            return call(*args)
+        except (OSError, ValueError):
+            return None
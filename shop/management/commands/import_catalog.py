@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from shop.catalog_import import import_catalog
+
+
+class Command(BaseCommand):
+    help = 'Загрузить товары из JSON/JSONL (в том числе фикстур) пачками с upsert по ключу'
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--key', choices=['sku', 'id'], default='sku',
+            help='По какому полю искать существующие товары (для фикстур — id)',
+        )
+
+    def handle(self, *args, **options):
+        for path in options['files']:
+            with open(path, encoding='utf-8') as stream:
+                stats = import_catalog(
+                    stream,
+                    key=options['key'],
+                    batch_size=options['batch_size'],
+                    progress=lambda stats: self.stdout.write(f'{path}: {stats}'),
+                )
+            for error in stats.errors:
+                self.stderr.write(f'{path}: {error}')
+            self.stdout.write(self.style.SUCCESS(f'{path}: {stats}'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.deals import prerender_deals
+
+
+class Command(BaseCommand):
+    help = 'Заранее отрендерить список скидок для режима пиковой нагрузки (DEALS_PEAK_MODE)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Обновлять постоянно')
+        parser.add_argument('--interval', type=float, default=30, help='Пауза между обновлениями, сек.')
+
+    def handle(self, *args, **options):
+        while True:
+            html = prerender_deals()
+            self.stdout.write(f'Готово, {len(html)} байт')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop.cache import bump_catalog_version
+from shop.deals import prerender_deals, rebuild_deals
+from shop.models import Deal
+
+
+class Command(BaseCommand):
+    help = 'Собрать витрину скидок заново (после изменений остатков в обход приложения)'
+
+    def handle(self, *args, **options):
+        rebuild_deals()
+        bump_catalog_version()
+        prerender_deals()
+        self.stdout.write(self.style.SUCCESS(f'Товаров со скидкой: {Deal.objects.count()}'))
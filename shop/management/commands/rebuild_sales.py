@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_date
+
+from shop.sales import rebuild_sales
+
+
+def _date(value):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать дневные продажи (DailySales, DailyProductSales) по истории заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', type=_date, help='ГГГГ-ММ-ДД')
+        parser.add_argument('--to', dest='date_to', type=_date, help='ГГГГ-ММ-ДД, включительно')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild_sales(options['date_from'], options['date_to'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Готово, строк по товарам: {created}'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.restock import run_pending
+
+
+class Command(BaseCommand):
+    help = 'Поставить в очередь уведомления о поступлении товаров подписчикам'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Не выходить, а ждать новые рассылки')
+        parser.add_argument('--interval', type=float, default=10)
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = run_pending(
+                chunk_size=options['chunk_size'],
+                progress=self.report,
+            )
+            for job in jobs:
+                self.stdout.write(self.style.SUCCESS(
+                    f'«{job.product.name}»: готово, в очереди {job.sent} из {job.total}'
+                ))
+            if not options['loop']:
+                break
+            if not jobs:
+                time.sleep(options['interval'])
+
+    def report(self, job):
+        self.stdout.write(f'«{job.product.name}»: {job.sent}/{job.total}')
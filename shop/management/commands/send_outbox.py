@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.mail import MailServerUnavailable, send_pending
+
+
+class Command(BaseCommand):
+    help = 'Отправить письма из очереди (с --loop работает как фоновый воркер)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Не выходить, а ждать новые письма')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками очереди, сек.')
+
+    def handle(self, *args, **options):
+        outages = 0
+        while True:
+            try:
+                sent, failed = send_pending(batch_size=options['batch_size'])
+            except MailServerUnavailable as e:
+                if not options['loop']:
+                    raise CommandError(f'Почтовый сервер недоступен: {e}')
+                # Пока сервер лежит, не долбим его: пауза растёт до 5 минут
+                outages += 1
+                delay = min(options['interval'] * 2 ** outages, 300)
+                self.stderr.write(f'Почтовый сервер недоступен ({e}), повтор через {delay:g} с')
+                time.sleep(delay)
+                continue
+            outages = 0
+            if sent or failed:
+                self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
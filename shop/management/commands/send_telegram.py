@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.telegram import FakeBotAPI, dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        'Отправить сообщения Telegram из очереди с учётом лимитов Bot API '
+        '(с --loop работает как фоновый воркер)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--loop', action='store_true', help='Не выходить, а ждать новые сообщения')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между проверками очереди, сек.')
+        parser.add_argument(
+            '--fake', type=float, metavar='LATENCY', nargs='?', const=0.05,
+            help='Слать в поддельный Bot API с задержкой ответа LATENCY сек. (прогон без сети)',
+        )
+
+    def handle(self, *args, **options):
+        transport = None
+        if options['fake'] is not None:
+            transport = FakeBotAPI(latency=options['fake']).transport
+        elif not getattr(settings, 'TELEGRAM_BOT_TOKEN', ''):
+            raise CommandError('Не задан TELEGRAM_BOT_TOKEN (переменная окружения SHOP_TELEGRAM_BOT_TOKEN)')
+
+        def progress(sent, failed):
+            self.stdout.write(f'Отправлено: {sent}, с ошибкой: {failed}')
+
+        sent, failed = dispatch(
+            batch_size=options['batch_size'], loop=options['loop'], interval=options['interval'],
+            transport=transport, progress=progress,
+        )
+        self.stdout.write(f'Готово. Отправлено: {sent}, с ошибкой: {failed}')
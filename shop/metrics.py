@@ -0,0 +1,272 @@
+import atexit
+import contextvars
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+
+# Гистограммы: имя -> (описание, границы корзин)
+HISTOGRAMS = {
+    'shop_request_duration_seconds': ('Время обработки запроса', LATENCY_BUCKETS),
+    'shop_db_queries': ('Число SQL-запросов за запрос', QUERY_BUCKETS),
+    'shop_db_duration_seconds': ('Время SQL-запросов за запрос', LATENCY_BUCKETS),
+    'shop_template_render_seconds': ('Время рендеринга шаблонов за запрос', LATENCY_BUCKETS),
+    'shop_response_size_bytes': ('Размер ответа', SIZE_BUCKETS),
+}
+COUNTERS = {
+    'shop_requests_total': 'Число запросов по статусу ответа',
+}
+
+# имя метрики -> {метки в формате Prometheus: [счётчики...]}.
+# У гистограммы — счётчики по корзинам, корзина +Inf и сумма значений.
+_data = {}
+_lock = threading.Lock()
+_last_flush = 0.0
+_current = contextvars.ContextVar('shop_request_stats', default=None)
+
+
+class RequestStats:
+    """Счётчики одного запроса: SQL и рендеринг шаблонов"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка для connection.execute_wrapper
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def _count_query(execute, sql, params, many, context):
+    # Висит на каждом соединении постоянно: под ASGI запросы к базе идут
+    # из потоков sync_to_async, контекст запроса приходит туда через contextvars
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    if _count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_count_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+def _labels(**values):
+    return ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in values.items()
+    )
+
+
+def observe(metric, labels, value):
+    buckets = HISTOGRAMS[metric][1]
+    with _lock:
+        rows = _data.setdefault(metric, {})
+        row = rows.get(labels)
+        if row is None:
+            row = rows[labels] = [0] * (len(buckets) + 1) + [0.0]
+        row[bisect_left(buckets, value)] += 1
+        row[-1] += value
+
+
+def increment(metric, labels, amount=1):
+    with _lock:
+        rows = _data.setdefault(metric, {})
+        rows[labels] = [rows.get(labels, [0])[0] + amount]
+
+
+def reset():
+    with _lock:
+        _data.clear()
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def flush(force=False):
+    """
+    Сохранить счётчики процесса в METRICS_DIR (режим нескольких воркеров).
+
+    Каждый процесс пишет свой файл metrics-<pid>.json не чаще раза
+    в METRICS_FLUSH_SECONDS; /metrics складывает файлы всех процессов.
+    Каталог нужно очищать при перезапуске сервиса.
+    """
+    global _last_flush
+    directory = _metrics_dir()
+    if not directory:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < getattr(settings, 'METRICS_FLUSH_SECONDS', 5):
+        return
+    _last_flush = now
+    with _lock:
+        payload = json.dumps(_data)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'metrics-{os.getpid()}.json')
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as output:
+        output.write(payload)
+    os.replace(tmp_path, path)
+
+
+atexit.register(lambda: flush(force=True))
+
+
+def _merge(target, source):
+    for metric, rows in source.items():
+        merged = target.setdefault(metric, {})
+        for labels, row in rows.items():
+            if labels in merged:
+                merged[labels] = [a + b for a, b in zip(merged[labels], row)]
+            else:
+                merged[labels] = list(row)
+
+
+def collect():
+    """Счётчики этого процесса или, в режиме METRICS_DIR, всех процессов"""
+    directory = _metrics_dir()
+    if not directory:
+        with _lock:
+            return json.loads(json.dumps(_data))
+    flush(force=True)
+    result = {}
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('metrics-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as source:
+                _merge(result, json.load(source))
+        except (OSError, ValueError):
+            # Файл мог исчезнуть или ещё дописываться — пропускаем
+            continue
+    return result
+
+
+def render_prometheus(data=None):
+    """Текстовый формат Prometheus (text/plain; version=0.0.4)"""
+    data = collect() if data is None else data
+    lines = []
+    for metric, help_text in COUNTERS.items():
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+        for labels, row in sorted(data.get(metric, {}).items()):
+            lines.append(f'{metric}{{{labels}}} {row[0]}')
+    for metric, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+        for labels, row in sorted(data.get(metric, {}).items()):
+            cumulative = 0
+            for bound, count in zip(list(buckets) + ['+Inf'], row[:-1]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_sum{{{labels}}} {row[-1]}')
+            lines.append(f'{metric}_count{{{labels}}} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """
+    Метрики по каждому view: время ответа, SQL, рендеринг шаблонов, размер.
+
+    Ставится первым в MIDDLEWARE, чтобы время включало остальные middleware.
+    Работает и под WSGI, и под ASGI без перехода в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Соединения, открытые до загрузки middleware (connection_created уже прошёл)
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, stats, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        labels = _labels(view=view, method=request.method)
+        increment('shop_requests_total', _labels(view=view, method=request.method, status=response.status_code))
+        observe('shop_request_duration_seconds', labels, duration)
+        observe('shop_db_queries', labels, stats.queries)
+        observe('shop_db_duration_seconds', labels, stats.db_time)
+        observe('shop_template_render_seconds', labels, stats.template_time)
+        if not response.streaming:
+            observe('shop_response_size_bytes', labels, len(response.content))
+        flush()
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        # Вложенные рендеры (cached_render внутри view) не считаем дважды
+        if stats is None or stats.rendering:
+            return self._template.render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """Шаблонизатор Django, который засекает время рендеринга для метрик"""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
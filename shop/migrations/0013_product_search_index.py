@@ -0,0 +1,67 @@
+# Полнотекстовый поиск по товарам.
+# Postgres: колонка tsvector, которую заполняет триггер, и GIN-индекс по ней.
+# SQLite (локально и в тестах): отдельная FTS5-таблица, её обновляет shop.search.
+
+from django.db import migrations
+
+POSTGRES_FORWARD = [
+    "ALTER TABLE shop_product ADD COLUMN search_vector tsvector",
+    """
+    CREATE FUNCTION shop_product_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER shop_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON shop_product
+    FOR EACH ROW EXECUTE FUNCTION shop_product_search_vector_update()
+    """,
+    """
+    UPDATE shop_product SET search_vector =
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'B')
+    """,
+    "CREATE INDEX shop_product_search_vector_idx ON shop_product USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP TRIGGER shop_product_search_vector_trigger ON shop_product",
+    "DROP FUNCTION shop_product_search_vector_update()",
+    "ALTER TABLE shop_product DROP COLUMN search_vector",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE shop_product_fts USING fts5(name, description, tokenize='unicode61 remove_diacritics 2')",
+    "INSERT INTO shop_product_fts (rowid, name, description) SELECT id, name, description FROM shop_product",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TABLE shop_product_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0012_restockjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
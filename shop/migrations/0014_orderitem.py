@@ -0,0 +1,38 @@
+# Generated by Django 4.2.25 on 2026-10-18 16:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='items',
+            field=models.JSONField(blank=True, default=list, verbose_name='Товары'),
+        ),
+        migrations.CreateModel(
+            name='OrderItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('discounted_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена со скидкой')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('total', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма')),
+                ('created_at', models.DateTimeField(verbose_name='Дата заказа')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='shop.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'Строка заказа',
+                'verbose_name_plural': 'Строки заказов',
+                'indexes': [models.Index(fields=['product', 'created_at'], name='orderitem_product_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.25 on 2026-10-18 17:00
+
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Ступени скидок на момент миграции (см. shop.models.DISCOUNT_TIERS)
+DISCOUNT_TIERS = [(1, 1, 20), (2, 3, 10), (4, 5, 5)]
+
+
+def seed(apps, schema_editor):
+    Campaign = apps.get_model('shop', 'Campaign')
+    Deal = apps.get_model('shop', 'Deal')
+    Product = apps.get_model('shop', 'Product')
+
+    # Окно, которое раньше было зашито в black_friday_page
+    starts_at = datetime.datetime(2025, 11, 29, tzinfo=datetime.timezone.utc)
+    Campaign.objects.get_or_create(slug='black-friday-2025', defaults={
+        'title': 'Чёрная пятница',
+        'starts_at': starts_at,
+        'ends_at': starts_at + datetime.timedelta(days=3),
+    })
+
+    deals = []
+    for product in Product.objects.filter(stock__gte=1, stock__lte=5).iterator():
+        percent = next(p for low, high, p in DISCOUNT_TIERS if low <= product.stock <= high)
+        price = (product.price * (100 - percent) / 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+        deals.append(Deal(
+            product_id=product.id, name=product.name, price=product.price,
+            discount_percent=percent, discounted_price=price, stock=product.stock,
+            image=product.image, image_variants=product.image_variants,
+        ))
+    Deal.objects.bulk_create(deals, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0018_cart'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(unique=True, verbose_name='Код')),
+                ('title', models.CharField(max_length=200, verbose_name='Название')),
+                ('starts_at', models.DateTimeField(verbose_name='Начало')),
+                ('ends_at', models.DateTimeField(verbose_name='Окончание')),
+                ('is_enabled', models.BooleanField(default=True, verbose_name='Включена')),
+            ],
+            options={
+                'verbose_name': 'Распродажа',
+                'verbose_name_plural': 'Распродажи',
+            },
+        ),
+        migrations.CreateModel(
+            name='Deal',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='deal', serialize=False, to='shop.product', verbose_name='Товар')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена')),
+                ('discount_percent', models.PositiveSmallIntegerField(verbose_name='Скидка, %')),
+                ('discounted_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Цена со скидкой')),
+                ('stock', models.PositiveIntegerField(verbose_name='Остаток')),
+                ('image', models.ImageField(blank=True, null=True, upload_to='products/', verbose_name='Изображение')),
+                ('image_variants', models.JSONField(blank=True, default=dict, verbose_name='Варианты изображения')),
+            ],
+            options={
+                'verbose_name': 'Товар со скидкой',
+                'verbose_name_plural': 'Товары со скидкой',
+                'indexes': [models.Index(fields=['-discount_percent', 'discounted_price', 'product'], name='deal_listing_idx')],
+            },
+        ),
+        migrations.RunPython(seed, migrations.RunPython.noop),
+    ]
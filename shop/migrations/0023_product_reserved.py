@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-18 17:38
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def count_reserved(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    StockReservation = apps.get_model('shop', 'StockReservation')
+    held = StockReservation.objects.values('product_id').annotate(total=Sum('quantity'))
+    for row in held.iterator():
+        Product.objects.filter(id=row['product_id']).update(reserved=row['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0022_product_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В резерве'),
+        ),
+        migrations.RunPython(count_reserved, migrations.RunPython.noop),
+    ]
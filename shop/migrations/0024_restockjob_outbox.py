@@ -0,0 +1,22 @@
+# Generated by Django 4.2.25 on 2026-10-18 17:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_product_reserved'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='restockjob',
+            name='failed',
+        ),
+        migrations.AlterField(
+            model_name='restockjob',
+            name='sent',
+            field=models.PositiveIntegerField(default=0, verbose_name='Поставлено в очередь'),
+        ),
+    ]
@@ -1,59 +1,204 @@
-from django.db import models
+import copy
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import models, transaction
+from django.db.models import Case, ExpressionWrapper, F, Value, When
+from django.db.models.functions import Cast, Round
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+
+class ChangeTrackingMixin:
+    """
+    Запоминает значения полей при загрузке из базы (from_db).
+
+    save() без явного update_fields пишет только изменившиеся поля,
+    а если не изменилось ничего — не ходит в базу вовсе.
+    """
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._current_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        loaded = getattr(self, '_loaded_values', {})
+        loaded.update(self._current_values(fields))
+        self._loaded_values = loaded
+
+    def _current_values(self, fields=None):
+        deferred = self.get_deferred_fields()
+        values = {}
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname in deferred:
+                continue
+            if fields is not None and field.name not in fields and field.attname not in fields:
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(field, models.FileField):
+                value = value.name
+            elif isinstance(value, (list, dict)):
+                # JSONField правят на месте (order.items.append(...)): ссылка
+                # на тот же список изменилась бы вместе с ним и правка не записалась бы
+                value = copy.deepcopy(value)
+            values[field.attname] = value
+        return values
+
+    def loaded_value(self, attname):
+        """Значение поля на момент загрузки; None для новых объектов"""
+        return getattr(self, '_loaded_values', {}).get(attname)
+
+    def changed_fields(self):
+        loaded = getattr(self, '_loaded_values', {})
+        return [
+            name for name, value in self._current_values().items()
+            if name not in loaded or loaded[name] != value
+        ]
+
+    def save(self, *args, **kwargs):
+        tracked = (
+            getattr(self, '_loaded_values', None) is not None
+            and not self._state.adding
+            and not kwargs.get('force_insert')
+            and kwargs.get('update_fields') is None
+        )
+        if tracked:
+            changed = self.changed_fields()
+            if not changed:
+                return
+            # auto_now (Product.updated_at) Django выставляет только полям из update_fields
+            kwargs['update_fields'] = changed + [
+                field.attname for field in self._meta.concrete_fields
+                if getattr(field, 'auto_now', False) and field.attname not in changed
+            ]
+        super().save(*args, **kwargs)
+        loaded = getattr(self, '_loaded_values', {})
+        loaded.update(self._current_values(kwargs.get('update_fields')))
+        self._loaded_values = loaded
+
+
+# Скидки на малые остатки: (от, до, процент); 6 и больше — без скидки
+DISCOUNT_TIERS = [
+    (1, 1, 20),
+    (2, 3, 10),
+    (4, 5, 5),
+]
+CENT = Decimal('0.01')
+
 
+def discount_for_stock(stock):
+    for low, high, percent in DISCOUNT_TIERS:
+        if low <= stock <= high:
+            return percent
+    return 0
 
-class Product(models.Model):
+
+class ProductQuerySet(models.QuerySet):
+    def with_discount(self):
+        """
+        Посчитать скидку в базе: discount_percent и discounted_price.
+
+        Те же ступени, что и в get_discount_info, но через CASE по остатку
+        вместе с резервами (Product.on_hand), поэтому по цене со скидкой
+        можно фильтровать и сортировать в SQL.
+        """
+        return self.alias(on_hand=F('stock') + F('reserved')).annotate(
+            discount_percent=Case(
+                *[
+                    When(on_hand__gte=low, on_hand__lte=high, then=Value(percent))
+                    for low, high, percent in DISCOUNT_TIERS
+                ],
+                default=Value(0),
+                output_field=models.IntegerField(),
+            ),
+        ).annotate(
+            # В копейках и целыми числами: ROUND по дробным числам в SQLite
+            # (там NUMERIC — это float) мог разойтись на копейку с ROUND_HALF_UP
+            # из get_discount_info. Цена в сотых долях копейки, +50 и целочисленное
+            # деление на 100 — то же округление половины вверх для цен >= 0.
+            discounted_price=Cast(
+                ExpressionWrapper(
+                    (
+                        Cast(Round(F('price') * Value(100)), models.BigIntegerField())
+                        * (Value(100) - F('discount_percent'))
+                        + Value(50)
+                    ) / Value(100),
+                    output_field=models.BigIntegerField(),
+                ) * Value(CENT),
+                models.DecimalField(max_digits=10, decimal_places=2),
+            ),
+        )
+
+
+class Product(ChangeTrackingMixin, models.Model):
+    # Артикул — ключ для import_catalog; у старых товаров может быть пустым
+    sku = models.CharField('Артикул', max_length=64, unique=True, null=True, blank=True)
     name = models.CharField('Название', max_length=200)
     description = models.TextField('Описание', blank=True)
     price = models.DecimalField('Цена', max_digits=10, decimal_places=2)
     image = models.ImageField('Изображение', upload_to='products/', blank=True, null=True)
     stock = models.PositiveIntegerField('Остаток на складе')
+    # Сколько сейчас держат резервы оформления (уже вычтено из stock)
+    reserved = models.PositiveIntegerField('В резерве', default=0, editable=False)
+    # Уменьшенные копии image: {'card': {'width': 320, 'webp': ..., 'jpeg': ...}, ...}
+    image_variants = models.JSONField('Варианты изображения', default=dict, blank=True, editable=False)
+    # Для ETag/Last-Modified страницы товара. UPDATE мимо save() (остатки,
+    # импорт, миниатюры) должны выставлять его сами
+    updated_at = models.DateTimeField('Изменён', auto_now=True, db_index=True)
+
+    objects = ProductQuerySet.as_manager()
 
     def save(self, *args, **kwargs):
-        # Проверяем, изменился ли stock с 0 на >0
-        old_instance = None
-        if self.pk:  # если объект уже существует
-            old_instance = Product.objects.get(pk=self.pk)
-        
+        # Остаток и картинку до сохранения берём из снимка, без лишнего SELECT
+        old_stock = self.loaded_value('stock')
+        old_image = self.loaded_value('image')
         super().save(*args, **kwargs)
 
-        # Если остаток стал >0, а раньше был 0 — отправляем уведомления
-        if old_instance and old_instance.stock == 0 and self.stock > 0:
-            emails = StockNotification.objects.filter(product=self).values_list('email', flat=True)
-            for email in emails:
-                self.notify_of_stock(email)
-            # Удаляем уведомления, чтобы не слать снова
-            StockNotification.objects.filter(product=self).delete()
+        new_image = self.image.name if self.image else ''
+        if new_image != (old_image or ''):
+            self.refresh_image_variants()
+
+        # Если остаток стал >0, а раньше был 0 — отправляем уведомления,
+        # но только после коммита, чтобы не держать транзакцию
+        if old_stock == 0 and self.stock > 0:
+            transaction.on_commit(self.notify_subscribers)
+
+    def refresh_image_variants(self):
+        """Нарезать варианты картинки заново (или очистить, если картинки нет)"""
+        from .images import build_variants
+        self.image_variants = build_variants(self.image) if self.image else {}
+        self.save(update_fields=['image_variants'])
 
+    def notify_subscribers(self):
+        """Запустить рассылку о поступлении (её выполняет run_restock_jobs)"""
+        RestockJob.schedule([self.pk])
+
+    @property
+    def on_hand(self):
+        """
+        Остаток вместе с резервами: по нему считается скидка.
+
+        Резерв покупателя не должен менять ему цену между страницей
+        оформления и заказом, а другим — давать скидку «на малый остаток».
+        """
+        return self.stock + self.reserved
 
     def get_discount_info(self):
         """Скидка только на малые остатки"""
-        stock = self.stock
-        if stock == 0:
-            discount = 0
-        elif stock == 1:
-            discount = 20
-        elif 2 <= stock <= 3:
-            discount = 10
-        elif 4 <= stock <= 5:
-            discount = 5
-        else:
-            discount = 0  # 6 и больше — без скидки
-        new_price = float(self.price) * (1 - discount / 100)
-        return discount, round(new_price, 2)
-    
-    def notify_of_stock(self, user_email):
-        """Отправить уведомление о поступлении"""
-        from django.core.mail import send_mail
-        from django.conf import settings
-        send_mail(
+        discount = discount_for_stock(self.on_hand)
+        new_price = Decimal(str(self.price)) * (100 - discount) / 100
+        return discount, new_price.quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def stock_notification_text(self):
+        """Тема и текст письма о поступлении"""
+        return (
             'Товар снова в наличии!',
             f'Здравствуйте! Товар "{self.name}" снова в наличии на складе. Заходите за покупками!',
-            settings.DEFAULT_FROM_EMAIL,
-            [user_email],
-            fail_silently=True,
         )
 
     def __str__(self):
@@ -62,6 +207,45 @@ class Product(models.Model):
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        indexes = [
+            # Keyset-пагинация каталога по цене
+            models.Index(fields=['price', 'id'], name='product_price_id_idx'),
+        ]
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog_cache(sender, **kwargs):
+    from .cache import bump_catalog_version_on_commit
+    bump_catalog_version_on_commit()
+
+@receiver(post_save, sender=Product)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not {'name', 'description'} & set(update_fields):
+        return
+    from .search import index_products
+    index_products([instance.pk])
+
+@receiver(post_delete, sender=Product)
+def remove_from_search_index(sender, instance, **kwargs):
+    from .search import unindex_products
+    unindex_products([instance.pk])
+
+
+# Поля товара, которые копируются в витрину скидок (Deal)
+DEAL_SOURCE_FIELDS = {'name', 'price', 'stock', 'image', 'image_variants'}
+
+@receiver(post_save, sender=Product)
+def update_deal(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields and not DEAL_SOURCE_FIELDS & set(update_fields):
+        return
+    # Витрину трогаем, только если товар был или стал товаром со скидкой
+    old_stock = None if created else instance.loaded_value('stock')
+    if (created or old_stock is not None) and not discount_for_stock((old_stock or 0) + instance.reserved) \
+            and not discount_for_stock(instance.on_hand):
+        return
+    from .deals import sync_product
+    sync_product(instance)
 
 
 class StockNotification(models.Model):
@@ -77,6 +261,59 @@ class StockNotification(models.Model):
         verbose_name_plural = "Уведомления о поступлении"
         unique_together = ('product', 'email')
 
+class StockReservation(models.Model):
+    """Временный резерв товара на время оформления заказа"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Покупатель")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
+    quantity = models.PositiveIntegerField("Количество")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создан")
+    expires_at = models.DateTimeField("Действует до", db_index=True)
+
+    def __str__(self):
+        return f"{self.user} → {self.product.name} × {self.quantity}"
+
+    class Meta:
+        verbose_name = "Резерв товара"
+        verbose_name_plural = "Резервы товаров"
+        unique_together = ('user', 'product')
+
+class RestockJob(models.Model):
+    """Рассылка подписчикам о поступлении товара; можно продолжить после сбоя"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает'),
+        ('running', 'Выполняется'),
+        ('done', 'Завершена'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name="Товар")
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField("Подписчиков", default=0)
+    # Доставку и повторы ведёт очередь писем (send_outbox) и Telegram (send_telegram)
+    sent = models.PositiveIntegerField("Поставлено в очередь", default=0)
+    # id последней обработанной подписки — с него продолжаем после сбоя
+    last_notification_id = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создана")
+    finished_at = models.DateTimeField("Завершена", blank=True, null=True)
+
+    @classmethod
+    def schedule(cls, product_ids):
+        """Создать рассылки для товаров, у которых есть подписчики и нет незавершённой рассылки"""
+        waiting = (
+            StockNotification.objects
+            .filter(product_id__in=product_ids, product__stock__gt=0)
+            .exclude(product__restockjob__status__in=['pending', 'running'])
+            .values_list('product_id', flat=True)
+            .distinct()
+        )
+        return cls.objects.bulk_create([cls(product_id=pid) for pid in waiting])
+
+    def __str__(self):
+        return f"Рассылка «{self.product.name}»: {self.sent}/{self.total}"
+
+    class Meta:
+        verbose_name = "Рассылка о поступлении"
+        verbose_name_plural = "Рассылки о поступлении"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     phone = models.CharField("Телефон", max_length=20, blank=True)
@@ -91,7 +328,32 @@ def create_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
 
-class Order(models.Model):
+class Cart(models.Model):
+    """
+    Копия корзины в базе на случай потери кэша (см. shop.cart.CartStore).
+
+    Ключ: u<id пользователя> или a<токен из cookie> для гостей.
+    """
+    key = models.CharField("Ключ", max_length=80, unique=True)
+    # Компактно: "id:количество,id:количество"
+    data = models.TextField("Товары", blank=True)
+    updated_at = models.DateTimeField("Обновлена", db_index=True)
+
+    def __str__(self):
+        return f"Корзина {self.key}"
+
+    class Meta:
+        verbose_name = "Корзина"
+        verbose_name_plural = "Корзины"
+
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is None:
+        return
+    from .cart import merge_anonymous_cart
+    merge_anonymous_cart(request, user)
+
+class Order(ChangeTrackingMixin, models.Model):
     STATUS_CHOICES = [
         ('new', 'Новый'),
         ('processing', 'В обработке'),
@@ -103,7 +365,8 @@ class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Пользователь")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата заказа")
     total = models.DecimalField("Итого", max_digits=10, decimal_places=2)
-    items = models.JSONField("Товары", default=list)
+    # Состав заказов до появления OrderItem; новые заказы сюда не пишутся
+    items = models.JSONField("Товары", default=list, blank=True)
     status = models.CharField("Статус", max_length=20, choices=STATUS_CHOICES, default='new')
     tracking_number = models.CharField("Трек-номер", max_length=100, blank=True, null=True)
 
@@ -119,4 +382,251 @@ class Order(models.Model):
     class Meta:
         verbose_name = "Заказ"
         verbose_name_plural = "Заказы"
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # История заказов в ЛК: WHERE user_id = ... ORDER BY created_at DESC, id DESC
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ]
+
+
+class OrderItem(models.Model):
+    """Строка заказа; название и цены копируются на случай удаления товара"""
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='lines', verbose_name="Заказ")
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Товар")
+    name = models.CharField("Название", max_length=200)
+    price = models.DecimalField("Цена", max_digits=10, decimal_places=2)
+    discounted_price = models.DecimalField("Цена со скидкой", max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField("Количество")
+    total = models.DecimalField("Сумма", max_digits=10, decimal_places=2)
+    # Копия order.created_at, чтобы считать продажи товара за период по индексу
+    created_at = models.DateTimeField("Дата заказа")
+
+    def __str__(self):
+        return f"{self.name} × {self.quantity}"
+
+    class Meta:
+        verbose_name = "Строка заказа"
+        verbose_name_plural = "Строки заказов"
+        indexes = [
+            models.Index(fields=['product', 'created_at'], name='orderitem_product_date_idx'),
+        ]
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_status(sender, instance, created, update_fields=None, **kwargs):
+    # Новые заказы учитывает checkout (shop.sales.record_order) — уже со строками
+    if created or (update_fields is not None and 'status' not in update_fields):
+        return
+    old_status = instance.loaded_value('status')
+    if old_status and old_status != instance.status:
+        from .sales import move_orders
+        from .telegram import notify_order_status
+        move_orders([instance.pk], instance.status, old_status=old_status)
+        notify_order_status([instance.pk])
+
+
+@receiver(pre_delete, sender=Order)
+def remove_from_sales(sender, instance, **kwargs):
+    # pre_delete: строки заказа ещё на месте, их можно вычесть
+    from .sales import move_orders
+    move_orders([instance.pk], None)
+
+
+class OutgoingEmail(models.Model):
+    """Письмо в очереди на отправку (отправляет команда send_outbox)"""
+    STATUS_CHOICES = [
+        ('pending', 'Ожидает отправки'),
+        ('sent', 'Отправлено'),
+        ('failed', 'Не удалось отправить'),
+    ]
+
+    subject = models.CharField("Тема", max_length=255)
+    body = models.TextField("Текст")
+    from_email = models.CharField("Отправитель", max_length=254)
+    to = models.JSONField("Получатели", default=list)
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField("Отправлено", blank=True, null=True)
+
+    @classmethod
+    def enqueue(cls, subject, body, recipient_list, from_email=None):
+        """Положить письмо в очередь вместо отправки прямо из запроса"""
+        from django.conf import settings
+        return cls.objects.create(
+            subject=subject,
+            body=body,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+            to=list(recipient_list),
+        )
+
+    @classmethod
+    def enqueue_many(cls, subject, body, recipients, from_email=None):
+        """Одно и то же письмо каждому получателю отдельно, одним INSERT"""
+        from django.conf import settings
+        from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        return cls.objects.bulk_create(
+            [cls(subject=subject, body=body, from_email=from_email, to=[email]) for email in recipients],
+            batch_size=1000,
+        )
+
+    def __str__(self):
+        return f"{self.subject} → {', '.join(self.to)}"
+
+    class Meta:
+        verbose_name = "Исходящее письмо"
+        verbose_name_plural = "Исходящие письма"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_status_next_idx'),
+        ]
+
+
+class TelegramMessage(models.Model):
+    """Сообщение в Telegram в очереди на отправку (отправляет команда send_telegram)"""
+    STATUS_CHOICES = OutgoingEmail.STATUS_CHOICES
+
+    chat_id = models.CharField("Чат", max_length=50)
+    text = models.TextField("Текст")
+    status = models.CharField("Статус", max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    next_attempt_at = models.DateTimeField("Следующая попытка", default=timezone.now)
+    last_error = models.TextField("Последняя ошибка", blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
+    sent_at = models.DateTimeField("Отправлено", blank=True, null=True)
+
+    @classmethod
+    def enqueue_many(cls, messages):
+        """Положить в очередь пары (chat_id, текст) одним INSERT"""
+        return cls.objects.bulk_create(
+            [cls(chat_id=chat_id, text=text) for chat_id, text in messages], batch_size=1000,
+        )
+
+    def __str__(self):
+        return f"{self.chat_id}: {self.text[:50]}"
+
+    class Meta:
+        verbose_name = "Сообщение Telegram"
+        verbose_name_plural = "Сообщения Telegram"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='telegram_status_next_idx'),
+        ]
+
+
+class Campaign(models.Model):
+    """Распродажа с окном проведения (например, Чёрная пятница)"""
+    slug = models.SlugField("Код", unique=True)
+    title = models.CharField("Название", max_length=200)
+    starts_at = models.DateTimeField("Начало")
+    ends_at = models.DateTimeField("Окончание")
+    is_enabled = models.BooleanField("Включена", default=True)
+
+    @classmethod
+    def _started(cls, now=None):
+        now = now or timezone.now()
+        # У идущей распродажи окончание позже, чем у любой завершённой
+        return cls.objects.filter(is_enabled=True, starts_at__lte=now).order_by('-ends_at', '-starts_at')
+
+    @classmethod
+    def current(cls, now=None):
+        """Идущая распродажа, а если такой нет — последняя начавшаяся"""
+        return cls._started(now).first()
+
+    @classmethod
+    async def acurrent(cls, now=None):
+        return await cls._started(now).afirst()
+
+    def is_active(self, now=None):
+        now = now or timezone.now()
+        return self.is_enabled and self.starts_at <= now <= self.ends_at
+
+    def __str__(self):
+        return self.title
+
+    class Meta:
+        verbose_name = "Распродажа"
+        verbose_name_plural = "Распродажи"
+
+
+class Deal(models.Model):
+    """
+    Витрина скидок: товары со скидкой с уже посчитанной ценой.
+
+    Обновляется по мере изменения остатков (shop.deals), страница
+    Чёрной пятницы читает её одним запросом по индексу без JOIN.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='deal', verbose_name="Товар",
+    )
+    name = models.CharField("Название", max_length=200)
+    price = models.DecimalField("Цена", max_digits=10, decimal_places=2)
+    discount_percent = models.PositiveSmallIntegerField("Скидка, %")
+    discounted_price = models.DecimalField("Цена со скидкой", max_digits=10, decimal_places=2)
+    stock = models.PositiveIntegerField("Остаток")
+    image = models.ImageField("Изображение", upload_to='products/', blank=True, null=True)
+    image_variants = models.JSONField("Варианты изображения", default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.name} −{self.discount_percent}%"
+
+    class Meta:
+        verbose_name = "Товар со скидкой"
+        verbose_name_plural = "Товары со скидкой"
+        indexes = [
+            models.Index(fields=['-discount_percent', 'discounted_price', 'product'], name='deal_listing_idx'),
+        ]
+
+
+@receiver(post_save, sender=Campaign)
+@receiver(post_delete, sender=Campaign)
+def reset_campaign_cache(sender, **kwargs):
+    from django.core.cache import cache
+    from .deals import CAMPAIGN_KEY
+    cache.delete(CAMPAIGN_KEY)
+
+
+class DailySales(models.Model):
+    """Продажи за день по статусу заказа (день — дата оформления заказа)"""
+    day = models.DateField("День")
+    status = models.CharField("Статус", max_length=20, choices=Order.STATUS_CHOICES)
+    orders = models.IntegerField("Заказов", default=0)
+    units = models.IntegerField("Единиц товара", default=0)
+    revenue = models.DecimalField("Выручка", max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.get_status_display()}: {self.revenue}"
+
+    class Meta:
+        verbose_name = "Продажи за день"
+        verbose_name_plural = "Продажи по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'status'], name='dailysales_day_status_uniq'),
+        ]
+
+
+class DailyProductSales(models.Model):
+    """
+    Продажи товара за день без отменённых заказов.
+
+    Связь с товаром без внешнего ключа в базе: после удаления товара
+    статистика остаётся, название хранится здесь же.
+    """
+    day = models.DateField("День")
+    product = models.ForeignKey(
+        Product, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+', verbose_name="Товар",
+    )
+    name = models.CharField("Название", max_length=200)
+    orders = models.IntegerField("Заказов", default=0)
+    units = models.IntegerField("Единиц товара", default=0)
+    revenue = models.DecimalField("Выручка", max_digits=14, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.day} {self.name}: {self.units}"
+
+    class Meta:
+        verbose_name = "Продажи товара за день"
+        verbose_name_plural = "Продажи товаров по дням"
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='dailyproductsales_day_product_uniq'),
+        ]
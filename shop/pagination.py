@@ -0,0 +1,159 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """Одна страница keyset-пагинации"""
+
+    def __init__(self, object_list, next_cursor=None, prev_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Пагинация по курсору (WHERE (a, b) > (x, y) ORDER BY a, b LIMIT n).
+
+    В отличие от OFFSET, стоимость страницы не зависит от того,
+    насколько далеко пролистал пользователь. Последнее поле в ordering
+    должно быть уникальным (обычно id), иначе порядок нестабилен.
+    """
+
+    def __init__(self, queryset, ordering, page_size):
+        self.queryset = queryset
+        self.fields = [(f.lstrip('-'), f.startswith('-')) for f in ordering]
+        self.page_size = page_size
+
+    def page(self, cursor=None):
+        key, backwards = self.decode_cursor(cursor)
+        rows = list(self._rows(key, backwards))
+        return self._page(rows, key, backwards)
+
+    async def apage(self, cursor=None):
+        """page() через async ORM"""
+        key, backwards = self.decode_cursor(cursor)
+        rows = [obj async for obj in self._rows(key, backwards)]
+        return self._page(rows, key, backwards)
+
+    def _rows(self, key, backwards):
+        qs = self.queryset.order_by(*self._order_by(reverse=backwards))
+        if key is not None:
+            qs = qs.filter(self._after(key, reverse=backwards))
+        # Берём на одну запись больше, чтобы понять, есть ли следующая страница
+        return qs[:self.page_size + 1]
+
+    def _page(self, rows, key, backwards):
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+
+        if backwards:
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, key is not None
+
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            prev_cursor=self.encode_cursor(rows[0], backwards=True) if has_prev else None,
+        )
+
+    def _order_by(self, reverse=False):
+        return [
+            ('-' if desc != reverse else '') + name
+            for name, desc in self.fields
+        ]
+
+    def _after(self, key, reverse=False):
+        """Условие «строго после key» для составного ключа сортировки"""
+        condition = Q()
+        for i, (name, desc) in enumerate(self.fields):
+            lookup = 'lt' if desc != reverse else 'gt'
+            step = Q(**{f'{name}__{lookup}': key[i]})
+            for j, (prev_name, _) in enumerate(self.fields[:i]):
+                step &= Q(**{prev_name: key[j]})
+            condition |= step
+        return condition
+
+    def encode_cursor(self, obj, backwards=False):
+        key = []
+        for name, _ in self.fields:
+            value = getattr(obj, name)
+            key.append(value if isinstance(value, int) else str(value))
+        payload = json.dumps({'k': key, 'b': int(backwards)}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (ключ, назад?); битый курсор — это первая страница"""
+        if not cursor:
+            return None, False
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            key = payload['k']
+            backwards = bool(payload.get('b'))
+        except (ValueError, TypeError, KeyError):
+            return None, False
+        key = self._clean_key(key)
+        if key is None:
+            return None, False
+        return key, backwards
+
+    def cache_key(self, cursor):
+        """
+        Курсор в каноничном виде для ключа кэша: '' — первая страница,
+        None — курсор битый. Разные записи одного ключа дают одну строку.
+        """
+        if not cursor:
+            return ''
+        key, backwards = self.decode_cursor(cursor)
+        if key is None:
+            return None
+        parts = [format(value.normalize(), 'f') if isinstance(value, Decimal) else str(value) for value in key]
+        return json.dumps({'k': parts, 'b': int(backwards)}, separators=(',', ':'))
+
+    def _output_field(self, name):
+        annotation = self.queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(name)
+
+    def _clean_key(self, key):
+        """Привести значения ключа к типам полей; None, если курсор подделан"""
+        if not isinstance(key, list) or len(key) != len(self.fields):
+            return None
+        cleaned = []
+        for (name, _), value in zip(self.fields, key):
+            if not isinstance(value, (int, str)) or isinstance(value, bool):
+                return None
+            try:
+                value = self._output_field(name).to_python(value)
+            except (ValidationError, TypeError, ValueError, ArithmeticError):
+                return None
+            if value is None or (isinstance(value, Decimal) and not value.is_finite()):
+                return None
+            cleaned.append(value)
+        return cleaned
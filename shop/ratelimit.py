@@ -0,0 +1,165 @@
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse
+
+# Правила по умолчанию: область -> [(ключ, запросов, за сколько секунд)].
+# Ключи: ip — адрес клиента, email — поле формы, user — вошедший пользователь.
+# Переопределяются в settings.RATE_LIMITS.
+DEFAULT_RATE_LIMITS = {
+    'register': [('ip', 10, 3600), ('email', 3, 3600)],
+    'password_reset': [('ip', 10, 600), ('email', 3, 600)],
+    'stock_notification': [('ip', 60, 3600), ('user', 20, 3600)],
+}
+KEY_PREFIX = 'rl'
+
+
+def _cache():
+    return caches[getattr(settings, 'RATELIMIT_CACHE', 'default')]
+
+
+def _client_ip(request):
+    """
+    Адрес клиента. За прокси — из заголовка, который он ставит (RATELIMIT_IP_META).
+
+    В X-Forwarded-For начало списка пишет сам клиент, поэтому берём адрес,
+    добавленный нашими прокси: RATELIMIT_PROXY_COUNT-й с конца.
+    """
+    value = request.META.get(getattr(settings, 'RATELIMIT_IP_META', 'REMOTE_ADDR'), '')
+    parts = [part.strip() for part in value.split(',')]
+    proxies = getattr(settings, 'RATELIMIT_PROXY_COUNT', 1)
+    return parts[-proxies] if len(parts) >= proxies else parts[0]
+
+
+def _identity(request, key, field):
+    """Значение ключа для запроса или None, если по этому ключу не ограничиваем"""
+    if key == 'ip':
+        return _client_ip(request) or None
+    if key == 'email':
+        value = request.POST.get(field or 'email', '').strip().lower()
+        return value or None
+    if key == 'user':
+        # Из сессии, без запроса пользователя из базы
+        return request.session.get(SESSION_KEY)
+    raise ValueError(f'Неизвестный ключ ограничения: {key}')
+
+
+def hit(scope, key, identity, limit, period, now=None):
+    """
+    Засчитать запрос в скользящем окне; вернуть 0 или сколько секунд ждать.
+
+    Окно приближается двумя соседними фиксированными окнами: счётчик
+    прошлого окна берётся с весом оставшейся доли. Счётчики — атомарные
+    cache.add/cache.incr, поэтому работают и на нескольких воркерах
+    с общим кэшем (Redis, Memcached).
+    """
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    digest = hashlib.sha256(str(identity).encode()).hexdigest()[:32]
+    prefix = f'{KEY_PREFIX}:{scope}:{key}:{digest}'
+    current_key = f'{prefix}:{int(window)}'
+
+    cache = _cache()
+    # Окно должно дожить до конца следующего, где оно станет «прошлым»
+    cache.add(current_key, 0, timeout=period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Ключ вытеснили между add и incr
+        cache.set(current_key, 1, timeout=period * 2)
+        current = 1
+    previous = cache.get(f'{prefix}:{int(window) - 1}', 0)
+
+    if previous * (1 - elapsed / period) + current <= limit:
+        return 0
+    return max(1, int(period - elapsed))
+
+
+def check(request, scope, field=None):
+    """Проверить запрос по правилам области; вернуть 0 или Retry-After в секундах"""
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return 0
+    rules = getattr(settings, 'RATE_LIMITS', DEFAULT_RATE_LIMITS).get(scope, ())
+    for key, limit, period in rules:
+        identity = _identity(request, key, field)
+        if identity is None:
+            continue
+        # Правила идут от дешёвых к дорогим: при отказе по ip сессию не читаем
+        retry_after = hit(scope, key, identity, limit, period)
+        if retry_after:
+            return retry_after
+    return 0
+
+
+def too_many_requests(retry_after):
+    # Без шаблона: base.html ходит в сессию и базу, а ответ должен быть дешёвым
+    response = HttpResponse(
+        'Слишком много запросов. Попробуйте позже.', status=429, content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _limited(request, view_func):
+    if getattr(request, '_ratelimit_checked', False):
+        return None
+    scope, field, methods = view_func.ratelimit
+    request._ratelimit_checked = True
+    if request.method not in methods:
+        return None
+    retry_after = check(request, scope, field)
+    return too_many_requests(retry_after) if retry_after else None
+
+
+def ratelimit(scope, field=None, methods=('POST',)):
+    """
+    Ограничить частоту запросов к view по правилам RATE_LIMITS[scope].
+
+    field — поле формы для ключа email. С RateLimitMiddleware проверка
+    делается раньше (до process_view остальных middleware), без неё —
+    в самом декораторе.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def wrapper(request, *args, **kwargs):
+                # Ключ user читает сессию из базы — проверка идёт в потоке
+                if not getattr(request, '_ratelimit_checked', False):
+                    response = await sync_to_async(_limited)(request, wrapper)
+                    if response:
+                        return response
+                return await view_func(request, *args, **kwargs)
+        else:
+            @wraps(view_func)
+            def wrapper(request, *args, **kwargs):
+                return _limited(request, wrapper) or view_func(request, *args, **kwargs)
+
+        wrapper.ratelimit = (scope, field, tuple(methods))
+        return wrapper
+
+    return decorator
+
+
+class RateLimitMiddleware:
+    """Отдаёт 429 для view с @ratelimit до CSRF-проверки и любой работы view"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            # Под ASGI __call__ просто возвращает корутину следующего слоя
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(view_func, 'ratelimit'):
+            return None
+        return _limited(request, view_func)
@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutgoingEmail, RestockJob, StockNotification, TelegramMessage
+from .telegram import chats_for_emails
+
+
+def _run_chunk(job_id, chunk_size, subject, body):
+    """
+    Обработать следующий кусок подписчиков под блокировкой рассылки.
+
+    Письма и сообщения ставятся в очереди, подписки удаляются, а позиция
+    сохраняется в одной транзакции: после сбоя кусок либо обработан
+    целиком, либо не тронут. Возвращает обновлённую рассылку или None,
+    если кусок сейчас обрабатывает другой воркер.
+    """
+    with transaction.atomic():
+        job = (
+            RestockJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(pk=job_id, status__in=['pending', 'running'])
+            .first()
+        )
+        if job is None:
+            return None
+        subscribers = StockNotification.objects.filter(product_id=job.product_id, id__gt=job.last_notification_id)
+        if job.status == 'pending':
+            job.status = 'running'
+            job.total = job.sent + subscribers.count()
+            job.save(update_fields=['status', 'total'])
+
+        chunk = list(subscribers.order_by('id').values_list('id', 'email')[:chunk_size])
+        if not chunk:
+            job.status = 'done'
+            job.finished_at = timezone.now()
+            job.save(update_fields=['status', 'finished_at'])
+            return job
+
+        chats = chats_for_emails({email for _, email in chunk})
+        TelegramMessage.enqueue_many((chats[email], f'{subject}\n\n{body}') for _, email in chunk if email in chats)
+        OutgoingEmail.enqueue_many(subject, body, [email for _, email in chunk if email not in chats])
+        StockNotification.objects.filter(id__in=[nid for nid, _ in chunk]).delete()
+        RestockJob.objects.filter(pk=job.pk).update(
+            sent=F('sent') + len(chunk), last_notification_id=chunk[-1][0],
+        )
+        job.refresh_from_db(fields=['sent', 'last_notification_id'])
+        return job
+
+
+def run_job(job, chunk_size=500, progress=None):
+    """
+    Разослать уведомления по одной рассылке.
+
+    Подписчики берутся кусками по chunk_size. Каждому ставится письмо в
+    очередь OutgoingEmail, а тем, у кого привязан Telegram, — сообщение в
+    TelegramMessage: доставку и повторы при ошибках ведут send_outbox и
+    send_telegram. Кусок обрабатывается под select_for_update(skip_locked)
+    на рассылке, поэтому несколько воркеров с --loop не шлют дубли, а
+    прерванную рассылку можно просто запустить снова.
+
+    Возвращает рассылку, если этот вызов её завершил, иначе None.
+    """
+    subject, body = job.product.stock_notification_text()
+    while True:
+        current = _run_chunk(job.pk, chunk_size, subject, body)
+        if current is None:
+            return None
+        job.status, job.total, job.sent = current.status, current.total, current.sent
+        job.last_notification_id, job.finished_at = current.last_notification_id, current.finished_at
+        if job.status == 'done':
+            return job
+        if progress:
+            progress(job)
+
+
+def run_pending(chunk_size=500, progress=None):
+    """Выполнить все незавершённые рассылки (в том числе прерванные); вернуть завершённые"""
+    jobs = RestockJob.objects.filter(status__in=['pending', 'running']).select_related('product')
+    finished = (run_job(job, chunk_size, progress) for job in jobs.order_by('id'))
+    return [job for job in finished if job is not None]
@@ -0,0 +1,95 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Включается на время view с @use_replica. ContextVar, а не threading.local:
+# под ASGI значение видно и в sync_to_async-потоках, где async ORM делает запросы.
+_replica_reads = ContextVar('replica_reads', default=False)
+
+# На реплики уходят только модели магазина: сессии и пользователи читаются
+# с основной базы, иначе отставание реплики «разлогинит» только что вошедшего
+REPLICA_APPS = {'shop'}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _pinned(request):
+    return _setting('REPLICA_PIN_COOKIE', 'db_primary') in request.COOKIES
+
+
+def pin_primary(response):
+    """
+    После записи (оформления заказа) читать с основной базы REPLICA_STICKY_SECONDS.
+
+    Иначе редирект в ЛК может прийти на реплику раньше нового заказа.
+    """
+    response.set_cookie(
+        _setting('REPLICA_PIN_COOKIE', 'db_primary'), '1',
+        max_age=_setting('REPLICA_STICKY_SECONDS', 15), httponly=True, samesite='Lax',
+    )
+    return response
+
+
+def use_replica(view_func):
+    """
+    Разрешить view читать с реплик (только GET/HEAD и если клиент не закреплён за основной базой).
+
+    Запись и select_for_update всё равно идут в default (ReplicaRouter.db_for_write).
+    """
+    def allowed(request):
+        return request.method in ('GET', 'HEAD') and not _pinned(request)
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if not allowed(request):
+                return await view_func(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    else:
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not allowed(request):
+                return view_func(request, *args, **kwargs)
+            token = _replica_reads.set(True)
+            try:
+                return view_func(request, *args, **kwargs)
+            finally:
+                _replica_reads.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Чтение внутри @use_replica — со случайной реплики из DATABASE_REPLICAS,
+    всё остальное — с default. Без реплик в настройках ничего не меняется.
+    """
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Связанные объекты читаем оттуда же, откуда пришёл сам объект
+            return instance._state.db
+        replicas = _setting('DATABASE_REPLICAS', ())
+        if not replicas or not _replica_reads.get() or model._meta.app_label not in REPLICA_APPS:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики — копии default, объекты из них можно связывать между собой
+        databases = {DEFAULT_DB_ALIAS, *_setting('DATABASE_REPLICAS', ())}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
@@ -0,0 +1,257 @@
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailyProductSales, DailySales, Order, OrderItem
+from .telegram import notify_order_status
+
+CANCELLED = 'cancelled'
+UPSERT_CHUNK = 150
+ZERO = Decimal('0.00')
+
+
+def _upsert(model, key_fields, rows, replace_fields=()):
+    """
+    Прибавить счётчики к строкам rollup-таблицы одним запросом на пачку.
+
+    rows: {ключ: {поле: значение}}. Поля replace_fields перезаписываются,
+    остальные складываются с тем, что уже лежит в таблице
+    (INSERT ... ON CONFLICT DO UPDATE — есть и в Postgres, и в SQLite).
+    """
+    if not rows:
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    value_fields = list(next(iter(rows.values())))
+    fields = [model._meta.get_field(name) for name in key_fields + value_fields]
+    columns = [connection.ops.quote_name(field.column) for field in fields]
+    assignments = ', '.join(
+        f'{column} = excluded.{column}' if field.name in replace_fields
+        else f'{column} = {table}.{column} + excluded.{column}'
+        for field, column in zip(fields[len(key_fields):], columns[len(key_fields):])
+    )
+    placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+    conflict = ', '.join(columns[:len(key_fields)])
+
+    items = list(rows.items())
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_CHUNK):
+            chunk = items[start:start + UPSERT_CHUNK]
+            params = []
+            for key, values in chunk:
+                raw = list(key) + [values[name] for name in value_fields]
+                params += [field.get_db_prep_save(value, connection) for field, value in zip(fields, raw)]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(columns)}) VALUES {", ".join([placeholder] * len(chunk))} '
+                f'ON CONFLICT ({conflict}) DO UPDATE SET {assignments}',
+                params,
+            )
+
+
+def _drop_empty(model, days, **filters):
+    """Удалить строки rollup'а, из которых ушли все заказы (как после rebuild_sales)"""
+    if days:
+        model.objects.filter(day__in=days, orders=0, **filters).delete()
+
+
+def record_order(order, lines):
+    """Учесть только что оформленный заказ: два запроса независимо от числа строк"""
+    day = timezone.localdate(order.created_at)
+    _upsert(DailySales, ['day', 'status'], {
+        (day, order.status): {
+            'orders': 1,
+            'units': sum(line.quantity for line in lines),
+            'revenue': order.total,
+        },
+    })
+    if order.status == CANCELLED:
+        return
+    products = {}
+    for line in lines:
+        if line.product_id is None:
+            continue
+        row = products.setdefault((day, line.product_id), {'name': line.name, 'orders': 1, 'units': 0, 'revenue': ZERO})
+        row['units'] += line.quantity
+        row['revenue'] += line.total
+    _upsert(DailyProductSales, ['day', 'product_id'], products, replace_fields=['name'])
+
+
+def move_orders(order_ids, status, old_status=None):
+    """
+    Перенести заказы в rollup'ах из текущего статуса в status.
+
+    Вызывается до UPDATE, пока в базе старый статус, либо с old_status,
+    если статус уже записан. status=None — убрать заказы из статистики
+    (удаление). Переход в «Отменён» и обратно вычитает/возвращает продажи товаров.
+    """
+    order_ids = list(order_ids)
+    if not order_ids:
+        return
+
+    def current(values):
+        return old_status or values['status']
+
+    totals = (
+        Order.objects.filter(id__in=order_ids)
+        .values('status', day=TruncDate('created_at'))
+        .annotate(orders=Count('id'), revenue=Sum('total'))
+    )
+    units = (
+        OrderItem.objects.filter(order_id__in=order_ids)
+        .values(status=F('order__status'), day=TruncDate('created_at'))
+        .annotate(units=Sum('quantity'))
+    )
+    units = {(row['day'], current(row)): row['units'] for row in units}
+
+    deltas = defaultdict(lambda: {'orders': 0, 'units': 0, 'revenue': ZERO})
+    # Заказы, у которых меняется «учитывается ли в продажах товаров»: знак поправки
+    product_sign = {}
+    for row in totals:
+        old = current(row)
+        if old == status:
+            continue
+        key = (row['day'], old)
+        moved = {'orders': row['orders'], 'units': units.get(key, 0), 'revenue': row['revenue']}
+        for name, value in moved.items():
+            deltas[key][name] -= value
+            if status is not None:
+                deltas[(row['day'], status)][name] += value
+        was_counted, is_counted = old != CANCELLED, status not in (None, CANCELLED)
+        if was_counted != is_counted:
+            product_sign[old] = 1 if is_counted else -1
+    _upsert(DailySales, ['day', 'status'], dict(deltas))
+    _drop_empty(DailySales, {day for day, _ in deltas})
+
+    for old, sign in product_sign.items():
+        lines = OrderItem.objects.filter(order_id__in=order_ids, product__isnull=False)
+        if not old_status:
+            lines = lines.filter(order__status=old)
+        rows = (
+            lines.values('product_id', day=TruncDate('created_at'))
+            .annotate(name=Max('name'), orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum('total'))
+        )
+        changes = {
+            (row['day'], row['product_id']): {
+                'name': row['name'],
+                'orders': sign * row['orders'],
+                'units': sign * row['units'],
+                'revenue': sign * row['revenue'],
+            }
+            for row in rows
+        }
+        _upsert(DailyProductSales, ['day', 'product_id'], changes, replace_fields=['name'])
+        if sign < 0:
+            _drop_empty(
+                DailyProductSales, {day for day, _ in changes},
+                product_id__in={product_id for _, product_id in changes},
+            )
+
+
+def set_status(queryset, status):
+    """Сменить статус заказам одним UPDATE и поправить rollup'ы; вернуть число заказов"""
+    with transaction.atomic():
+        ids = list(queryset.exclude(status=status).select_for_update().values_list('id', flat=True))
+        move_orders(ids, status)
+        updated = Order.objects.filter(id__in=ids).update(status=status)
+        notify_order_status(ids)
+    return updated
+
+
+def _day_bounds(date_from, date_to):
+    filters = {}
+    if date_from:
+        filters['created_at__gte'] = timezone.make_aware(datetime.combine(date_from, time.min))
+    if date_to:
+        filters['created_at__lt'] = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min))
+    return filters
+
+
+def rebuild_sales(date_from=None, date_to=None, batch_size=1000):
+    """
+    Пересчитать rollup'ы по заказам за период (по умолчанию — за всё время).
+
+    Единицы товара и продажи по товарам берутся из OrderItem: старые заказы
+    нужно сначала перенести командой backfill_order_items.
+    """
+    bounds = _day_bounds(date_from, date_to)
+    days = {}
+    if date_from:
+        days['day__gte'] = date_from
+    if date_to:
+        days['day__lte'] = date_to
+
+    with transaction.atomic():
+        DailySales.objects.filter(**days).delete()
+        DailyProductSales.objects.filter(**days).delete()
+
+        units = {
+            (row['day'], row['status']): row['units']
+            for row in OrderItem.objects.filter(**bounds)
+            .values(status=F('order__status'), day=TruncDate('created_at'))
+            .annotate(units=Sum('quantity'))
+        }
+        DailySales.objects.bulk_create([
+            DailySales(
+                day=row['day'], status=row['status'], orders=row['orders'],
+                units=units.get((row['day'], row['status']), 0), revenue=row['revenue'],
+            )
+            for row in Order.objects.filter(**bounds)
+            .values('status', day=TruncDate('created_at'))
+            .annotate(orders=Count('id'), revenue=Sum('total'))
+        ], batch_size=batch_size)
+
+        products = (
+            OrderItem.objects.filter(product__isnull=False, **bounds)
+            .exclude(order__status=CANCELLED)
+            .values('product_id', day=TruncDate('created_at'))
+            .annotate(name=Max('name'), orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum('total'))
+            .order_by()
+        )
+        batch = []
+        created = 0
+        for row in products.iterator(chunk_size=batch_size):
+            batch.append(DailyProductSales(**row))
+            if len(batch) >= batch_size:
+                DailyProductSales.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        DailyProductSales.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def report(date_from, date_to, top=50):
+    """Данные для дашборда: только rollup'ы, O(дней × товаров) за период"""
+    by_day = defaultdict(lambda: {'orders': 0, 'units': 0, 'revenue': ZERO, 'cancelled': 0})
+    by_status = defaultdict(lambda: {'orders': 0, 'units': 0, 'revenue': ZERO})
+    for row in DailySales.objects.filter(day__gte=date_from, day__lte=date_to):
+        status = by_status[row.status]
+        status['orders'] += row.orders
+        status['units'] += row.units
+        status['revenue'] += row.revenue
+        day = by_day[row.day]
+        if row.status == CANCELLED:
+            day['cancelled'] += row.orders
+            continue
+        day['orders'] += row.orders
+        day['units'] += row.units
+        day['revenue'] += row.revenue
+
+    products = (
+        DailyProductSales.objects.filter(day__gte=date_from, day__lte=date_to)
+        .values('product_id')
+        .annotate(name=Max('name'), orders=Sum('orders'), units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'product_id')[:top]
+    )
+    labels = dict(Order.STATUS_CHOICES)
+    return {
+        'days': [{'day': day, **by_day[day]} for day in sorted(by_day)],
+        'statuses': [
+            {'status': code, 'label': labels[code], **by_status[code]}
+            for code, _ in Order.STATUS_CHOICES if code in by_status
+        ],
+        'products': list(products),
+    }
@@ -0,0 +1,100 @@
+import re
+
+from django.db import connection, connections, router
+
+from .models import Product
+
+# Выражение для tsvector в Postgres: название весит больше описания.
+# Колонку shop_product.search_vector заполняет триггер (см. миграцию 0013).
+POSTGRES_VECTOR = (
+    "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('russian', coalesce(description, '')), 'B')"
+)
+
+# В SQLite вместо tsvector — отдельная FTS5-таблица с rowid = id товара
+SQLITE_TABLE = 'shop_product_fts'
+
+
+def _fts5_query(query):
+    """Превратить ввод пользователя в запрос FTS5: все слова, по префиксу"""
+    words = re.findall(r'\w+', query.lower())
+    return ' '.join('"%s"*' % word for word in words)
+
+
+def _ranked_ids(query, limit):
+    # Сырой SQL сам роутер не видит: берём ту же базу, что и ORM для
+    # Product (в view с @use_replica — реплику)
+    connection = connections[router.db_for_read(Product)]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT id FROM shop_product, websearch_to_tsquery('russian', %s) AS q "
+                "WHERE search_vector @@ q "
+                "ORDER BY ts_rank(search_vector, q) DESC, id LIMIT %s",
+                [query, limit],
+            )
+        elif connection.vendor == 'sqlite':
+            match = _fts5_query(query)
+            if not match:
+                return []
+            cursor.execute(
+                f"SELECT rowid FROM {SQLITE_TABLE} WHERE {SQLITE_TABLE} MATCH %s "
+                f"ORDER BY bm25({SQLITE_TABLE}, 10.0, 1.0), rowid LIMIT %s",
+                [match, limit],
+            )
+        else:
+            return list(
+                Product.objects.filter(name__icontains=query)
+                .values_list('id', flat=True)[:limit]
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_products(query, limit=48):
+    """Найти товары по названию и описанию, самые подходящие — первыми"""
+    query = query.strip()
+    if not query:
+        return []
+    ids = _ranked_ids(query, limit)
+    products = Product.objects.with_discount().in_bulk(ids)
+    return [products[pid] for pid in ids if pid in products]
+
+
+def index_products(product_ids):
+    """
+    Обновить поисковый индекс для товаров.
+
+    В Postgres индекс поддерживает триггер, а в SQLite FTS5-таблицу
+    обновляем сами после сохранения товара.
+    """
+    if connection.vendor != 'sqlite' or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})", list(product_ids))
+        cursor.execute(
+            f"INSERT INTO {SQLITE_TABLE} (rowid, name, description) "
+            f"SELECT id, name, description FROM shop_product WHERE id IN ({placeholders})",
+            list(product_ids),
+        )
+
+
+def unindex_products(product_ids):
+    if connection.vendor != 'sqlite' or not product_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})", list(product_ids))
+
+
+def rebuild_index():
+    """Пересобрать индекс целиком (после массовых изменений в обход save)"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f"UPDATE shop_product SET search_vector = {POSTGRES_VECTOR}")
+        elif connection.vendor == 'sqlite':
+            cursor.execute(f"DELETE FROM {SQLITE_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {SQLITE_TABLE} (rowid, name, description) "
+                f"SELECT id, name, description FROM shop_product"
+            )
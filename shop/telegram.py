@@ -0,0 +1,265 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, Profile, TelegramMessage
+
+# Сколько держим сообщение за воркером, прежде чем его сможет взять другой
+CLAIM_TIMEOUT = timedelta(minutes=10)
+# Ответы Bot API, после которых повторять бесполезно: чат не найден, бот заблокирован
+PERMANENT_ERRORS = {400, 403}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _retry_delay(attempts):
+    """Экспоненциальная пауза перед повтором, как у очереди писем"""
+    base = _setting('TELEGRAM_RETRY_SECONDS', 60)
+    return timedelta(seconds=min(base * 2 ** (attempts - 1), 6 * 60 * 60))
+
+
+def chats_for_emails(emails):
+    """{email: chat_id} для пользователей с привязанным Telegram"""
+    return dict(
+        Profile.objects.filter(user__email__in=emails, telegram_id__isnull=False)
+        .exclude(telegram_id='')
+        .values_list('user__email', 'telegram_id')
+    )
+
+
+def notify_order_status(order_ids):
+    """Сообщить покупателям с привязанным Telegram о новом статусе заказов"""
+    rows = (
+        Order.objects.filter(id__in=order_ids, user__profile__telegram_id__isnull=False)
+        .exclude(user__profile__telegram_id='')
+        .values_list('id', 'status', 'tracking_number', 'user__profile__telegram_id')
+    )
+    labels = dict(Order.STATUS_CHOICES)
+    messages = []
+    for order_id, status, tracking_number, chat_id in rows.iterator():
+        text = f'Заказ #{order_id}: {labels[status]}'
+        if tracking_number:
+            text += f'\nОтследить: https://1track.ru/tracking/{tracking_number}'
+        messages.append((chat_id, text))
+    TelegramMessage.enqueue_many(messages)
+
+
+class TokenBucket:
+    """
+    Ведро токенов: rate запросов в секунду, всплеск до capacity.
+
+    acquire() ждёт токен без блокировки цикла событий; pause() — ответ
+    429 от Telegram: до конца паузы токены не выдаются.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.updated = clock()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    @property
+    def full(self):
+        self._refill(self.clock())
+        return self.tokens >= self.capacity and not self._lock.locked()
+
+    async def acquire(self):
+        # Lock — очередь ожидающих: токены выдаются по порядку
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self._refill(now)
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+
+class Dispatcher:
+    """
+    Отправка сообщений через Bot API с ограничениями Telegram.
+
+    Общее ведро — лимит бота (по умолчанию 30 сообщений/с), ведро на чат —
+    не чаще раза в секунду в один чат. Одновременных HTTP-запросов —
+    не больше concurrency. Объект живёт между пачками, чтобы лимиты
+    учитывались и на их стыке.
+    """
+
+    def __init__(self, client, token=None, global_rate=None, chat_rate=None, concurrency=None):
+        self.client = client
+        self.url = '%s/bot%s/sendMessage' % (
+            _setting('TELEGRAM_API_URL', 'https://api.telegram.org'),
+            token if token is not None else _setting('TELEGRAM_BOT_TOKEN', ''),
+        )
+        self.chat_rate = chat_rate or _setting('TELEGRAM_CHAT_RATE', 1)
+        self.global_bucket = TokenBucket(global_rate or _setting('TELEGRAM_GLOBAL_RATE', 30))
+        self.chat_buckets = {}
+        self.semaphore = asyncio.Semaphore(concurrency or _setting('TELEGRAM_CONCURRENCY', 20))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, capacity=1)
+        return bucket
+
+    async def send(self, message):
+        """Отправить одно сообщение; вернуть (ok, ошибка, пауза в секундах или None)"""
+        await self._chat_bucket(message.chat_id).acquire()
+        await self.global_bucket.acquire()
+        async with self.semaphore:
+            try:
+                response = await self.client.post(self.url, json={'chat_id': message.chat_id, 'text': message.text})
+            except httpx.HTTPError as e:
+                return False, f'{type(e).__name__}: {e}', None
+        if response.status_code == 200:
+            return True, '', None
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {}
+        error = f'{response.status_code}: {payload.get("description", response.reason_phrase)}'
+        if response.status_code == 429:
+            retry_after = payload.get('parameters', {}).get('retry_after', 1)
+            # Flood control действует на весь бот — притормаживаем все отправки
+            self.global_bucket.pause(retry_after)
+            return False, error, retry_after
+        if response.status_code in PERMANENT_ERRORS:
+            return False, error, 0
+        return False, error, None
+
+    async def send_batch(self, batch, now=None):
+        """Отправить пачку параллельно и записать результат в объекты (без save)"""
+        now = now or timezone.now()
+        max_attempts = _setting('TELEGRAM_MAX_ATTEMPTS', 5)
+        results = await asyncio.gather(*(self.send(message) for message in batch))
+        sent = 0
+        for message, (ok, error, retry_after) in zip(batch, results):
+            message.attempts += 1
+            if ok:
+                message.status = 'sent'
+                message.sent_at = timezone.now()
+                sent += 1
+                continue
+            message.last_error = error
+            if retry_after == 0 or message.attempts >= max_attempts:
+                message.status = 'failed'
+            elif retry_after:
+                message.next_attempt_at = now + timedelta(seconds=retry_after)
+            else:
+                message.next_attempt_at = now + _retry_delay(message.attempts)
+        # Вёдра чатов, которые успели наполниться, больше не нужны
+        for chat_id in [chat_id for chat_id, bucket in self.chat_buckets.items() if bucket.full]:
+            del self.chat_buckets[chat_id]
+        return sent
+
+
+def _claim_batch(batch_size, now):
+    """Забрать пачку сообщений, не мешая другим воркерам"""
+    with transaction.atomic():
+        ids = list(
+            TelegramMessage.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        TelegramMessage.objects.filter(id__in=ids).update(next_attempt_at=now + CLAIM_TIMEOUT)
+    return list(TelegramMessage.objects.filter(id__in=ids).order_by('id'))
+
+
+def dispatch(batch_size=500, loop=False, interval=5, transport=None, progress=None):
+    """
+    Разослать очередь TelegramMessage; вернуть (отправлено, не отправлено).
+
+    База — синхронно в этом потоке (claim, bulk_update), сеть — в одном
+    цикле событий, который живёт всю рассылку вместе с вёдрами лимитов.
+    transport — httpx-транспорт (FakeBotAPI для офлайн-прогонов).
+    """
+    event_loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(transport=transport, timeout=_setting('TELEGRAM_TIMEOUT', 10))
+    sent = total = 0
+    try:
+        dispatcher = event_loop.run_until_complete(_make_dispatcher(client))
+        while True:
+            now = timezone.now()
+            batch = _claim_batch(batch_size, now)
+            if not batch:
+                if not loop:
+                    break
+                time.sleep(interval)
+                continue
+            sent += event_loop.run_until_complete(dispatcher.send_batch(batch, now))
+            total += len(batch)
+            TelegramMessage.objects.bulk_update(
+                batch, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'],
+            )
+            if progress:
+                progress(sent, total - sent)
+    finally:
+        event_loop.run_until_complete(client.aclose())
+        event_loop.close()
+    return sent, total - sent
+
+
+async def _make_dispatcher(client):
+    # Semaphore и Lock создаются внутри цикла событий, в котором будут работать
+    return Dispatcher(client)
+
+
+class FakeBotAPI:
+    """
+    Поддельный Bot API для тестов и офлайн-прогонов (httpx.MockTransport).
+
+    Запоминает доставленные сообщения, может отвечать 403 для blocked
+    чатов, 429 на первые flood_errors запросов и задерживать ответ на latency.
+    """
+
+    def __init__(self, latency=0.0, blocked=(), flood_errors=0, retry_after=1):
+        self.latency = latency
+        self.blocked = set(blocked)
+        self.flood_errors = flood_errors
+        self.retry_after = retry_after
+        self.delivered = []
+
+    async def __call__(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        data = json.loads(request.content)
+        if self.flood_errors > 0:
+            self.flood_errors -= 1
+            return httpx.Response(429, json={
+                'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                'parameters': {'retry_after': self.retry_after},
+            })
+        if str(data['chat_id']) in self.blocked:
+            return httpx.Response(403, json={
+                'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user',
+            })
+        self.delivered.append((str(data['chat_id']), data['text'], time.monotonic()))
+        return httpx.Response(200, json={'ok': True, 'result': {'message_id': len(self.delivered)}})
+
+    @property
+    def transport(self):
+        return httpx.MockTransport(self)
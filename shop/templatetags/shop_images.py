@@ -0,0 +1,47 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from ..images import VARIANT_WIDTHS
+
+register = template.Library()
+
+# Ширина картинки на странице для каждого места вывода (атрибут sizes)
+SIZES = {
+    'card': '(max-width: 600px) 100vw, 300px',
+    'detail': '(max-width: 600px) 100vw, 350px',
+}
+
+
+def _srcset(variants, extension):
+    # У маленьких исходников несколько вариантов одной ширины — берём по одному
+    by_width = {entry['width']: entry[extension] for entry in variants.values()}
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w' for width, name in sorted(by_width.items())
+    )
+
+
+@register.simple_tag
+def product_picture(product, slot='card', style=''):
+    """
+    <picture> с WebP и JPEG-вариантами; браузер сам выберет размер по sizes.
+
+    Если варианты ещё не нарезаны — обычный <img> на оригинал.
+    """
+    variants = product.image_variants or {}
+    if not set(VARIANT_WIDTHS) <= set(variants):
+        return format_html(
+            '<img src="{}" alt="{}" style="{}" loading="lazy">',
+            product.image.url, product.name, style,
+        )
+    sizes = SIZES.get(slot, SIZES['card'])
+    fallback = variants['detail' if slot == 'detail' else 'card']
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" style="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        _srcset(variants, 'webp'), sizes,
+        default_storage.url(fallback['jpeg']), _srcset(variants, 'jpeg'), sizes,
+        product.name, style,
+    )
@@ -0,0 +1,192 @@
+"""
+Бюджеты SQL-запросов и замеры времени для всех страниц магазина.
+
+Запуск без Postgres:  SHOP_DB=sqlite pytest -m perf  (пропустить: -m 'not perf')
+JSON-отчёт для сравнения коммитов:  PERF_REPORT=perf.json SHOP_DB=sqlite pytest -m perf
+Объёмы данных и число повторов: PERF_PRODUCTS, PERF_ITERATIONS.
+"""
+import json
+import os
+import platform
+import time
+from collections import namedtuple
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from shop.cart import CartStore
+from shop.models import Order, OrderItem, Product
+from shop.search import rebuild_index
+
+pytestmark = pytest.mark.perf
+
+PRODUCTS = int(os.environ.get('PERF_PRODUCTS', 3000))
+ITERATIONS = int(os.environ.get('PERF_ITERATIONS', 10))
+CART_LINES = 40
+ORDERS = 300
+LINES_PER_ORDER = 3
+
+# name из shop/urls.py -> (метод, нужен вход, нужна корзина, бюджет запросов).
+# Бюджет считается на холодный запрос (кэш страниц пуст) и не должен
+# зависеть от объёма данных: рост числа товаров в корзине или заказов
+# не должен добавлять запросов.
+Case = namedtuple('Case', 'method login cart budget')
+CASES = {
+    'home': Case('get', False, False, 0),
+    'about': Case('get', False, False, 0),
+    'catalog': Case('get', False, False, 2),
+    'search': Case('get', False, False, 2),
+    'product_detail': Case('get', False, False, 2),
+    'cart': Case('get', True, True, 5),
+    'add_to_cart': Case('post', True, True, 6),
+    'update_cart': Case('post', True, True, 6),
+    'register': Case('get', False, False, 0),
+    'confirm_email': Case('get', False, False, 0),
+    'login': Case('get', False, False, 0),
+    'logout': Case('post', True, False, 4),
+    'cabinet': Case('get', True, False, 4),
+    'edit_profile': Case('get', True, False, 3),
+    'order_items': Case('get', True, False, 4),
+    'checkout_page': Case('post', True, True, 20),
+    'black_friday': Case('get', False, False, 2),
+    'metrics': Case('get', True, False, 2),
+    'orders_export': Case('get', True, False, 2),
+    'sales_report': Case('get', True, False, 2),
+    'password_reset_code_request': Case('get', False, False, 0),
+    'password_reset_code_verify': Case('get', False, False, 0),
+}
+
+
+@pytest.fixture(scope='session')
+def perf_report():
+    """Результаты всех замеров; пишутся в PERF_REPORT, если он задан"""
+    results = {}
+    yield results
+    path = os.environ.get('PERF_REPORT')
+    if path and results:
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'volumes': {
+                'products': PRODUCTS,
+                'cart_lines': CART_LINES,
+                'orders': ORDERS,
+                'lines_per_order': LINES_PER_ORDER,
+            },
+            'iterations': ITERATIONS,
+            'views': dict(sorted(results.items())),
+        }
+        with open(path, 'w', encoding='utf-8') as output:
+            json.dump(report, output, ensure_ascii=False, indent=2)
+
+
+@pytest.fixture
+def shop_data(db):
+    """Каталог, покупатель с длинной историей заказов и товары для корзины"""
+    Product.objects.bulk_create([
+        Product(
+            sku=f'PERF-{i}',
+            name=f'Товар {i}',
+            description='Футболка для бега' if i % 10 == 0 else 'Спортивная одежда',
+            price=100 + i % 5000,
+            stock=i % 30,
+        )
+        for i in range(PRODUCTS)
+    ])
+    rebuild_index()
+    # Для корзины — товары с запасом, чтобы повторные добавления проходили
+    cart_products = list(Product.objects.order_by('id')[:CART_LINES])
+    Product.objects.filter(id__in=[p.id for p in cart_products]).update(stock=100000)
+
+    user = User.objects.create_user('perf', 'perf@test.com', 'password123')
+    orders = Order.objects.bulk_create([Order(user=user, total=300) for _ in range(ORDERS)])
+    OrderItem.objects.bulk_create([
+        OrderItem(
+            order=order, product=product, name=product.name, price=100, discounted_price=100,
+            quantity=1, total=100, created_at=order.created_at,
+        )
+        for order in orders
+        for product in cart_products[:LINES_PER_ORDER]
+    ])
+    return {
+        'user': user,
+        'product': cart_products[0],
+        'cart_products': cart_products,
+        'order': orders[-1],
+    }
+
+
+def _fill_cart(user, products):
+    cart = CartStore.for_user(user)
+    for product in products:
+        cart.set(product.id, 1)
+    cart.save()
+
+
+def _request(client, name, case, data):
+    kwargs = {}
+    if name in ('product_detail', 'add_to_cart', 'update_cart'):
+        kwargs['product_id'] = data['product'].id
+    if name == 'order_items':
+        kwargs['order_id'] = data['order'].id
+    url = reverse(name, kwargs=kwargs)
+    params = {
+        'search': {'q': 'футболка'},
+        'add_to_cart': {'quantity': 1},
+        'update_cart': {'action': 'increase'},
+        'checkout_page': {'phone': '+70000000000', 'address': 'Москва'},
+    }.get(name, {})
+    return getattr(client, case.method)(url, params)
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def test_every_url_has_budget():
+    """Тест: у каждой страницы из shop/urls.py есть бюджет запросов"""
+    names = {name for name in get_resolver('shop.urls').reverse_dict if isinstance(name, str)}
+    assert names == set(CASES)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_view_query_budget(name, client, shop_data, perf_report):
+    """Тест: страница укладывается в бюджет запросов на больших объёмах данных"""
+    case = CASES[name]
+    timings = []
+    queries = None
+    for _ in range(ITERATIONS):
+        # Подготовка не входит в замер
+        if case.login:
+            client.force_login(shop_data['user'])
+        if case.cart:
+            _fill_cart(shop_data['user'], shop_data['cart_products'])
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = _request(client, name, case, shop_data)
+            timings.append((time.perf_counter() - started) * 1000)
+        assert response.status_code < 400, response.status_code
+        if queries is None:
+            queries = len(captured)
+            sql = '\n'.join(query['sql'] for query in captured.captured_queries)
+            assert queries <= case.budget, f'{name}: {queries} запросов при бюджете {case.budget}\n{sql}'
+
+    perf_report[name] = {
+        'queries': queries,
+        'budget': case.budget,
+        'p50_ms': round(_percentile(timings, 50), 2),
+        'p90_ms': round(_percentile(timings, 90), 2),
+        'p99_ms': round(_percentile(timings, 99), 2),
+        'max_ms': round(max(timings), 2),
+    }
@@ -1,3 +1,4 @@
+import io
 import pytest
 from shop.models import Product
 
@@ -85,11 +86,10 @@ def test_add_to_cart_authorized(client, django_user_model):
     response = client.post(f'/cart/add/{product.id}/', {'quantity': 2})
     assert response.status_code == 302
     
-    # Проверка сессии
-    session = client.session
-    cart = session.get('cart', {})
-    assert str(product.id) in cart
-    assert cart[str(product.id)]['quantity'] == 2
+    # Проверка корзины
+    cart = CartStore.for_user(user)
+    assert cart.quantity(product.id) == 2
+    assert 'cart' not in client.session
 
 @pytest.mark.django_db
 def test_checkout_updates_stock(client, django_user_model):
@@ -123,4 +123,1228 @@ def test_checkout_updates_stock(client, django_user_model):
     
     # Проверяем обновление остатка
     product.refresh_from_db()
-    assert product.stock == 7  # было 10, купили 3
\ No newline at end of file
+    assert product.stock == 7  # было 10, купили 3
+
+import base64
+import json
+from shop.pagination import KeysetPaginator
+
+@pytest.mark.django_db
+def test_keyset_paginator_walks_forward_and_back():
+    """Тест прохода по страницам курсором вперёд и назад"""
+    for price in [500, 100, 300, 100, 200]:
+        Product.objects.create(name=f'Товар {price}', price=price, stock=1)
+    paginator = KeysetPaginator(Product.objects.all(), ('price', 'id'), 2)
+
+    first = paginator.page()
+    assert [p.price for p in first] == [100, 100]
+    assert not first.has_previous and first.has_next
+
+    second = paginator.page(first.next_cursor)
+    assert [p.price for p in second] == [200, 300]
+
+    third = paginator.page(second.next_cursor)
+    assert [p.price for p in third] == [500]
+    assert not third.has_next
+
+    back = paginator.page(third.prev_cursor)
+    assert [p.id for p in back] == [p.id for p in second]
+    assert [p.id for p in paginator.page(back.prev_cursor)] == [p.id for p in first]
+
+@pytest.mark.django_db
+def test_catalog_page_is_paginated(client, settings):
+    """Тест: каталог отдаёт не больше CATALOG_PAGE_SIZE товаров за раз"""
+    settings.CATALOG_PAGE_SIZE = 2
+    for i in range(3):
+        Product.objects.create(name=f'Товар {i}', price=1000 + i, stock=5)
+    response = client.get('/каталог товаров/', {'sort': '-price'})
+    assert [p.name for p in response.context['products']] == ['Товар 2', 'Товар 1']
+
+    response = client.get('/каталог товаров/', {
+        'sort': '-price',
+        'cursor': response.context['page'].next_cursor,
+    })
+    assert [p.name for p in response.context['products']] == ['Товар 0']
+
+def _cursor(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+@pytest.mark.django_db
+def test_tampered_cursor_is_first_page(client, django_user_model):
+    """Тест: подделанный курсор — это первая страница, а не ошибка 500"""
+    for i in range(3):
+        Product.objects.create(name=f'Товар {i}', price=1000 + i, stock=5)
+    # «Новинки» — сначала последние добавленные
+    newest = [p.name for p in client.get('/каталог товаров/', {'sort': 'new'}).context['products']]
+    assert newest == ['Товар 2', 'Товар 1', 'Товар 0']
+
+    for sort, key in [('new', ['abc']), ('price', [None, None]), ('price', ['x', 'y']),
+                      ('price', [[1], 2]), ('price', ['NaN', 1]), ('deals', [True, 'x', 1])]:
+        response = client.get('/каталог товаров/', {'sort': sort, 'cursor': _cursor({'k': key})})
+        assert response.status_code == 200
+        assert len(response.context['products']) == 3
+    assert client.get('/каталог товаров/', {'cursor': _cursor(['k'])}).status_code == 200
+
+    client.force_login(django_user_model.objects.create(username='buyer'))
+    response = client.get('/cabinet/', {'cursor': _cursor({'k': ['вчера', 1]})})
+    assert response.status_code == 200
+
+
+from shop.cart import CartStore, price_cart
+
+@pytest.mark.django_db
+def test_price_cart_single_query(django_assert_num_queries):
+    """Тест: вся корзина считается одним запросом"""
+    products = [Product.objects.create(name=f'Товар {i}', price=1000, stock=i + 1) for i in range(5)]
+    cart = {p.id: 1 for p in products}
+    with django_assert_num_queries(1):
+        priced = price_cart(cart)
+    assert len(priced) == 5
+    # Скидки: 20% при остатке 1, 10% при 2-3, 5% при 4-5
+    assert priced.total == 800 + 900 + 900 + 950 + 950
+
+@pytest.mark.django_db
+def test_cart_view_skips_deleted_products(client):
+    """Тест: удалённый товар не ломает корзину, а убирается из неё"""
+    kept = Product.objects.create(name='Футболка', price=2000, stock=10)
+    deleted = Product.objects.create(name='Кепка', price=500, stock=10)
+    client.post(f'/cart/add/{kept.id}/', {'quantity': 1})
+    client.post(f'/cart/add/{deleted.id}/', {'quantity': 1})
+    deleted_id = deleted.id
+    deleted.delete()
+
+    response = client.get('/cart/')
+    assert response.status_code == 200
+    assert response.context['total'] == 2000
+    assert deleted_id not in CartStore(f"a{client.cookies['cart_id'].value}")
+
+
+from datetime import timedelta
+from django.utils import timezone
+from shop import inventory
+from shop.models import Order, StockReservation
+
+@pytest.mark.django_db
+def test_checkout_reserves_stock_until_confirmed(client, django_user_model):
+    """Тест: открытие оформления резервирует товар, подтверждение его списывает"""
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    product = Product.objects.create(name='Шорты', price=3000, stock=10)
+    client.post(f'/cart/add/{product.id}/', {'quantity': 3})
+
+    client.get('/checkout/')
+    product.refresh_from_db()
+    assert product.stock == 7
+    assert StockReservation.objects.filter(user=user, quantity=3).exists()
+
+    client.post('/checkout/', {'phone': '+79991234567', 'address': 'Москва'})
+    product.refresh_from_db()
+    assert product.stock == 7
+    assert not StockReservation.objects.exists()
+
+@pytest.mark.django_db
+def test_reserve_is_all_or_nothing(django_user_model):
+    """Тест: если одного товара не хватает, не резервируется ничего"""
+    first = django_user_model.objects.create(username='first')
+    second = django_user_model.objects.create(username='second')
+    shirt = Product.objects.create(name='Футболка', price=2000, stock=5)
+    cap = Product.objects.create(name='Кепка', price=500, stock=1)
+
+    inventory.reserve(first, {cap.id: 1})
+    with pytest.raises(inventory.InsufficientStock) as exc:
+        inventory.reserve(second, {shirt.id: 2, cap.id: 1})
+    assert exc.value.available == {cap.id: 0}
+    shirt.refresh_from_db()
+    assert shirt.stock == 5
+
+@pytest.mark.django_db
+def test_release_expired_returns_stock(django_user_model):
+    """Тест: просроченные резервы возвращаются на склад"""
+    user = django_user_model.objects.create(username='buyer')
+    product = Product.objects.create(name='Кроссовки', price=5000, stock=4)
+    inventory.reserve(user, {product.id: 3})
+
+    assert inventory.release_expired(now=timezone.now()) == 0
+    assert inventory.release_expired(now=timezone.now() + timedelta(hours=1)) == 1
+    product.refresh_from_db()
+    assert product.stock == 4
+    assert product.reserved == 0
+
+@pytest.mark.django_db
+def test_reservation_does_not_change_price(client, django_user_model):
+    """Тест: свой резерв не меняет цену — сумма на оформлении равна сумме заказа"""
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    product = Product.objects.create(name='Шорты', price=1000, stock=6)
+    client.post(f'/cart/add/{product.id}/', {'quantity': 2})
+
+    shown = client.get('/checkout/').context['total']
+    product.refresh_from_db()
+    assert (product.stock, product.reserved) == (4, 2)
+    # Другим покупателям резерв тоже не даёт скидку «на малый остаток»
+    assert Product.objects.with_discount().get().discount_percent == 0
+
+    client.post('/checkout/', {'phone': '+79991234567', 'address': 'Москва'})
+    assert Order.objects.get().total == shown == 2000
+    product.refresh_from_db()
+    assert (product.stock, product.reserved) == (4, 0)
+
+@pytest.mark.django_db
+def test_own_reservation_stays_available_to_buyer(client, django_user_model):
+    """Тест: после открытия оформления свой резерв можно уменьшить и вернуть обратно"""
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    product = Product.objects.create(name='Шорты', price=1000, stock=2)
+    client.post(f'/cart/add/{product.id}/', {'quantity': 2})
+    client.get('/checkout/')
+    product.refresh_from_db()
+    assert (product.stock, product.reserved) == (0, 2)
+
+    item = client.get('/cart/').context['cart_items'].lines[0]
+    assert (item.available, item.in_stock) == (2, True)
+    response = client.get(f'/товар/{product.id}/')
+    assert response.context['available'] == 2
+    assert 'Нет в наличии' not in response.content.decode()
+
+    client.post(f'/cart/update/{product.id}/', {'action': 'decrease'})
+    client.post(f'/cart/update/{product.id}/', {'action': 'increase'})
+    assert client.get('/cart/').context['cart_items'].lines[0].quantity == 2
+    client.post(f'/cart/update/{product.id}/', {'action': 'increase'})
+    assert client.get('/cart/').context['cart_items'].lines[0].quantity == 2
+
+    # Другому покупателю чужой резерв недоступен
+    client.force_login(django_user_model.objects.create(username='other'))
+    assert client.get(f'/товар/{product.id}/').context['available'] == 0
+
+
+from unittest.mock import patch
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from shop.models import StockNotification, OutgoingEmail, RestockJob
+from shop.restock import run_pending, run_job
+from shop.mail import send_pending
+
+@pytest.mark.django_db
+def test_product_save_writes_only_changed_fields(django_assert_num_queries):
+    """Тест: сохранение без изменений не ходит в базу, с изменениями — один UPDATE"""
+    Product.objects.create(name='Футболка', price=2000, stock=10)
+    product = Product.objects.get()
+    with django_assert_num_queries(0):
+        product.save()
+
+    product.name = 'Футболка Nike'
+    with CaptureQueriesContext(connection) as captured:
+        product.save()
+    updates = [q['sql'] for q in captured.captured_queries if q['sql'].startswith('UPDATE "shop_product"')]
+    assert len(updates) == 1
+    assert '"name"' in updates[0] and '"stock"' not in updates[0]
+    assert not any(q['sql'].startswith('SELECT') for q in captured.captured_queries)
+
+@pytest.mark.django_db
+def test_save_writes_jsonfield_changed_in_place(django_user_model):
+    """Тест: правка JSONField на месте (append, ключ словаря) тоже сохраняется"""
+    order = Order.objects.create(user=django_user_model.objects.create(username='buyer'), total=500)
+    order = Order.objects.get()
+    order.items.append({'name': 'Кепка', 'quantity': 1})
+    order.save()
+    assert Order.objects.get().items == [{'name': 'Кепка', 'quantity': 1}]
+
+    product = Product.objects.create(name='Кепка', price=500, stock=3)
+    product = Product.objects.get()
+    product.image_variants['card'] = {'webp': 'card.webp'}
+    product.save()
+    assert Product.objects.get().image_variants == {'card': {'webp': 'card.webp'}}
+
+@pytest.mark.django_db
+def test_restock_notifies_after_commit(django_capture_on_commit_callbacks, mailoutbox):
+    """Тест: уведомления о поступлении уходят только после коммита"""
+    Product.objects.create(name='Кепка', price=500, stock=0)
+    product = Product.objects.get()
+    StockNotification.objects.create(product=product, email='fan@test.com')
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.stock = 5
+        product.save()
+        assert not RestockJob.objects.exists()
+    assert RestockJob.objects.get().product == product
+
+    run_pending()
+    assert not mailoutbox
+    assert send_pending() == (1, 0)
+    assert mailoutbox[0].to == ['fan@test.com']
+    assert not StockNotification.objects.exists()
+
+
+from smtplib import SMTPException
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from shop.mail import MailServerUnavailable
+
+class FlakyBackend(EmailBackend):
+    """Почтовый бэкенд, который отказывает первому получателю"""
+    opened = 0
+
+    def open(self):
+        FlakyBackend.opened += 1
+
+    def send_messages(self, messages):
+        if messages[0].to == ['bad@test.com']:
+            raise SMTPException('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+@pytest.mark.django_db
+def test_views_only_enqueue_mail(client, mailoutbox):
+    """Тест: регистрация не отправляет письмо сама, а ставит его в очередь"""
+    client.post('/accounts/register/', {
+        'username': 'testuser',
+        'email': 'test@example.com',
+        'password': 'securepass123',
+        'password2': 'securepass123',
+    })
+    assert len(mailoutbox) == 0
+    assert OutgoingEmail.objects.get().to == ['test@example.com']
+
+    assert send_pending() == (1, 0)
+    assert mailoutbox[0].subject == 'Код подтверждения'
+    assert OutgoingEmail.objects.get().status == 'sent'
+
+@pytest.mark.django_db
+def test_outbox_retries_with_backoff_over_one_connection():
+    """Тест: ошибка отправки откладывает письмо, остальные уходят по тому же соединению"""
+    FlakyBackend.opened = 0
+    OutgoingEmail.enqueue('Тема', 'Текст', ['bad@test.com'])
+    OutgoingEmail.enqueue('Тема', 'Текст', ['good@test.com'])
+    OutgoingEmail.enqueue('Тема', 'Текст', ['good2@test.com'])
+
+    assert send_pending(connection=FlakyBackend()) == (2, 1)
+    assert FlakyBackend.opened == 1
+    failed = OutgoingEmail.objects.get(to=['bad@test.com'])
+    assert failed.status == 'pending'
+    assert failed.attempts == 1
+    assert failed.next_attempt_at > timezone.now()
+    assert 'SMTPException' in failed.last_error
+    # До истечения паузы повторной попытки не будет
+    assert send_pending(connection=FlakyBackend()) == (0, 0)
+
+class DownBackend(EmailBackend):
+    """Почтовый сервер, к которому не подключиться"""
+
+    def open(self):
+        raise ConnectionRefusedError('connection refused')
+
+@pytest.mark.django_db
+def test_outbox_server_down_does_not_spend_attempts():
+    """Тест: недоступный сервер не тратит попытки писем, а останавливает воркер"""
+    OutgoingEmail.enqueue('Тема', 'Текст', ['good@test.com'])
+    with pytest.raises(MailServerUnavailable):
+        send_pending(connection=DownBackend())
+    email = OutgoingEmail.objects.get()
+    assert (email.status, email.attempts) == ('pending', 0)
+    assert email.next_attempt_at <= timezone.now()
+    with pytest.raises(CommandError, match='недоступен'):
+        with patch('shop.mail.get_connection', return_value=DownBackend()):
+            call_command('send_outbox')
+    assert send_pending(connection=FlakyBackend()) == (1, 0)
+
+
+@pytest.mark.django_db
+def test_restock_fanout_goes_through_outbox():
+    """Тест: рассылка идёт кусками через очередь писем, недоставленное письмо ждёт повтора"""
+    FlakyBackend.opened = 0
+    product = Product.objects.create(name='Кроссовки', price=5000, stock=0)
+    emails = [f'fan{i}@test.com' for i in range(7)] + ['bad@test.com']
+    StockNotification.objects.bulk_create([StockNotification(product=product, email=e) for e in emails])
+    job = RestockJob.objects.create(product=product)
+
+    progress = []
+    run_job(job, chunk_size=3, progress=lambda j: progress.append(j.sent))
+
+    job.refresh_from_db()
+    assert (job.status, job.total, job.sent) == ('done', 8, 8)
+    assert progress == [3, 6, 8]
+    assert not StockNotification.objects.exists()
+    # Повторный запуск завершённой рассылки ничего не дублирует
+    assert run_job(job) is None
+    assert OutgoingEmail.objects.count() == 8
+
+    assert send_pending(connection=FlakyBackend()) == (7, 1)
+    assert OutgoingEmail.objects.get(status='pending').to == ['bad@test.com']
+
+@pytest.mark.django_db
+def test_restock_skips_job_locked_by_another_worker():
+    """Тест: рассылку, которую держит другой воркер, не берём"""
+    product = Product.objects.create(name='Мяч', price=900, stock=3)
+    StockNotification.objects.create(product=product, email='fan@test.com')
+    job = RestockJob.objects.create(product=product)
+    with patch.object(RestockJob.objects, 'select_for_update') as select_for_update:
+        select_for_update.return_value.filter.return_value.first.return_value = None
+        assert run_pending() == []
+    select_for_update.assert_called_with(skip_locked=True)
+    assert not OutgoingEmail.objects.exists()
+    assert run_pending() == [job]
+
+
+@pytest.mark.django_db
+def test_with_discount_matches_get_discount_info():
+    """Тест: скидка из базы совпадает со скидкой, посчитанной в Python"""
+    for stock in range(8):
+        Product.objects.create(name=f'Товар {stock}', price='999.99', stock=stock)
+    # Цены, у которых цена со скидкой попадает ровно на полкопейки (x.xx5)
+    for price, stock in [('10.05', 2), ('10.10', 4), ('0.05', 3), ('12345678.95', 1)]:
+        Product.objects.create(name=f'Товар {price}', price=price, stock=stock)
+    for product in Product.objects.with_discount():
+        discount, new_price = product.get_discount_info()
+        assert product.discount_percent == discount
+        assert product.discounted_price == new_price
+    prices = dict(Product.objects.with_discount().values_list('name', 'discounted_price'))
+    assert prices['Товар 10.05'] == Decimal('9.05')  # 9.045 -> 9.05
+    assert prices['Товар 10.10'] == Decimal('9.60')  # 9.595 -> 9.60
+
+@pytest.mark.django_db
+def test_catalog_filters_and_sorts_by_discounted_price(client):
+    """Тест: каталог фильтрует и сортирует по цене со скидкой"""
+    Product.objects.create(name='Последняя', price=1000, stock=1)  # 800 со скидкой
+    Product.objects.create(name='Обычная', price=900, stock=50)
+    Product.objects.create(name='Дорогая', price=5000, stock=2)  # 4500
+    response = client.get('/каталог товаров/', {'sort': 'deals', 'max_price': '850'})
+    assert [p.name for p in response.context['products']] == ['Последняя']
+
+    response = client.get('/каталог товаров/', {'sort': 'deals'})
+    assert [p.name for p in response.context['products']] == ['Последняя', 'Дорогая', 'Обычная']
+
+
+from shop.search import search_products
+
+@pytest.mark.django_db
+def test_search_ranks_name_matches_first(client):
+    """Тест: совпадение в названии важнее совпадения в описании"""
+    Product.objects.create(name='Шорты беговые', description='Лёгкие, под кроссовки', price=1500, stock=5)
+    Product.objects.create(name='Кроссовки Puma', description='Для бега', price=5990, stock=5)
+    Product.objects.create(name='Кепка', description='От солнца', price=500, stock=5)
+
+    response = client.get('/search/', {'q': 'кроссовк'})
+    assert [p.name for p in response.context['products']] == ['Кроссовки Puma', 'Шорты беговые']
+
+@pytest.mark.django_db
+def test_search_index_follows_saves_and_deletes():
+    """Тест: индекс обновляется при сохранении и удалении товара"""
+    product = Product.objects.create(name='Футболка', price=2000, stock=5)
+    assert search_products('футболка') == [product]
+
+    product.name = 'Толстовка'
+    product.save()
+    assert search_products('футболка') == []
+    assert search_products('толстовка') == [product]
+
+    product.delete()
+    assert search_products('толстовка') == []
+
+
+from django.core.management import call_command
+from shop.models import Order, OrderItem
+
+@pytest.mark.django_db
+def test_checkout_creates_order_items(client, django_user_model):
+    """Тест: заказ сохраняется строками OrderItem"""
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    product = Product.objects.create(name='Шорты', price=3000, stock=2)
+    client.post(f'/cart/add/{product.id}/', {'quantity': 2})
+    client.post('/checkout/', {'phone': '+79991234567', 'address': 'Москва'})
+
+    line = OrderItem.objects.get()
+    assert (line.product, line.quantity, line.discounted_price, line.total) == (product, 2, 2700, 5400)
+    assert line.order.total == 5400
+    assert line.created_at == line.order.created_at
+
+@pytest.mark.django_db
+def test_backfill_order_items_from_json(django_user_model):
+    """Тест: старые заказы с JSON-составом переносятся в OrderItem"""
+    user = django_user_model.objects.create(username='buyer')
+    product = Product.objects.create(name='Кепка', price=500, stock=5)
+    Order.objects.create(user=user, total=1450, items=[
+        {'product_id': product.id, 'name': 'Кепка', 'price': 500.0,
+         'discounted_price': 475.0, 'quantity': 2, 'total': 950.0},
+        {'product_id': 999999, 'name': 'Удалённый товар', 'price': 500.0,
+         'discounted_price': 500.0, 'quantity': 1, 'total': 500.0},
+    ])
+    call_command('backfill_order_items', chunk_size=1, stdout=io.StringIO())
+    call_command('backfill_order_items', stdout=io.StringIO())
+
+    lines = list(OrderItem.objects.order_by('id'))
+    assert [(l.product_id, l.name, l.total) for l in lines] == [
+        (product.id, 'Кепка', 950), (None, 'Удалённый товар', 500),
+    ]
+
+def _order_with_line(user, name):
+    order = Order.objects.create(user=user, total=100)
+    OrderItem.objects.create(order=order, name=name, price=100, discounted_price=100,
+                             quantity=1, total=100, created_at=order.created_at)
+    return order
+
+@pytest.mark.django_db
+def test_cabinet_history_is_paginated(client, django_user_model, settings, django_assert_max_num_queries):
+    """Тест: ЛК показывает одну страницу заказов, не загружая их состав"""
+    settings.CABINET_ORDERS_PAGE_SIZE = 3
+    user = django_user_model.objects.create(username='buyer')
+    client.force_login(user)
+    orders = [_order_with_line(user, f'Товар {i}') for i in range(7)]
+
+    with django_assert_max_num_queries(5):
+        response = client.get('/cabinet/')
+    assert [o.id for o in response.context['orders']] == [o.id for o in orders[::-1][:3]]
+    assert 'Товар' not in response.content.decode()
+
+    response = client.get('/cabinet/', {'cursor': response.context['page'].next_cursor})
+    assert [o.id for o in response.context['orders']] == [o.id for o in orders[::-1][3:6]]
+
+@pytest.mark.django_db
+def test_order_items_endpoint(client, django_user_model):
+    """Тест: состав заказа отдаётся JSON-ом и только владельцу"""
+    owner = django_user_model.objects.create(username='buyer')
+    order = _order_with_line(owner, 'Кепка')
+    client.force_login(owner)
+    response = client.get(f'/cabinet/orders/{order.id}/items/')
+    assert response.json()['items'][0]['name'] == 'Кепка'
+
+    client.force_login(django_user_model.objects.create(username='other'))
+    assert client.get(f'/cabinet/orders/{order.id}/items/').status_code == 404
+
+
+from shop.cache import cache_stats
+
+@pytest.mark.django_db
+def test_catalog_page_is_served_from_cache(client, django_assert_num_queries, django_capture_on_commit_callbacks):
+    """Тест: повторный запрос каталога не ходит в базу, а изменение товара сбрасывает кэш"""
+    product = Product.objects.create(name='Футболка', price=2000, stock=10)
+    client.get('/каталог товаров/')
+    with django_assert_num_queries(0):
+        response = client.get('/каталог товаров/')
+    assert 'Футболка' in response.content.decode()
+    assert cache_stats() == {'hits': 1, 'misses': 1}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        product.name = 'Футболка Nike'
+        product.save()
+    assert 'Футболка Nike' in client.get('/каталог товаров/').content.decode()
+
+@pytest.mark.django_db
+def test_catalog_cache_key_uses_parsed_params(client):
+    """Тест: одинаковые по смыслу параметры — одна запись в кэше, битые не кэшируются"""
+    product = Product.objects.create(name='Футболка', price=2000, stock=10)
+    for max_price in ['2000', '2000.00', '2000.001']:
+        client.get('/каталог товаров/', {'max_price': max_price})
+    for cursor in [_cursor({'k': [product.id + 1]}), _cursor({'k': [str(product.id + 1)], 'b': 0})]:
+        client.get('/каталог товаров/', {'cursor': cursor})
+    assert cache_stats() == {'hits': 3, 'misses': 2}
+
+    for params in [{'max_price': 'abc'}, {'max_price': 'Infinity'}, {'cursor': 'garbage'}, {'cursor': _cursor({'k': ['x']})}]:
+        response = client.get('/каталог товаров/', params)
+        assert 'Футболка' in response.content.decode()
+    assert cache_stats() == {'hits': 3, 'misses': 2}
+
+@pytest.mark.django_db
+def test_cached_pages_keep_per_user_parts(client, django_user_model):
+    """Тест: шапка и сообщения не попадают в кэш"""
+    Product.objects.create(name='Кепка', price=500, stock=3)
+    assert 'Войти' in client.get('/black-friday/').content.decode()
+
+    client.force_login(django_user_model.objects.create(username='buyer'))
+    content = client.get('/black-friday/').content.decode()
+    assert 'Кепка' in content
+    assert 'Войти' not in content
+
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template import Context, Template
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+    return tmp_path
+
+
+def _jpeg(width=1600, height=1200, color='red'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, 'JPEG')
+    return SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+@pytest.mark.django_db
+def test_image_variants_generated_on_upload(media_root):
+    """Тест: при загрузке картинки нарезаются варианты с хэшем в имени"""
+    product = Product.objects.create(name='Кроссовки', price=5000, stock=5, image=_jpeg())
+    variants = Product.objects.get(pk=product.pk).image_variants
+    assert {name: entry['width'] for name, entry in variants.items()} == {'card': 320, 'detail': 700, 'retina': 1400}
+    for entry in variants.values():
+        with Image.open(media_root / entry['webp']) as webp:
+            assert webp.format == 'WEBP' and webp.width == entry['width']
+        assert (media_root / entry['jpeg']).exists()
+
+    # Тот же файл — те же имена; другая картинка — новые
+    product.image = _jpeg()
+    product.save()
+    assert product.image_variants == variants
+    product.image = _jpeg(color='blue')
+    product.save()
+    assert product.image_variants['card']['jpeg'] != variants['card']['jpeg']
+
+    # Сохранение без смены картинки варианты не трогает
+    product.stock = 3
+    product.save()
+    assert Product.objects.get(pk=product.pk).image_variants == product.image_variants
+
+@pytest.mark.django_db
+def test_product_picture_renders_srcset(media_root):
+    """Тест: шаблонный тег выдаёт WebP и JPEG со srcset, а без вариантов — оригинал"""
+    product = Product.objects.create(name='Кепка', price=500, stock=5, image=_jpeg(width=500, height=500))
+    html = Template('{% load shop_images %}{% product_picture product "detail" %}').render(Context({'product': product}))
+    assert 'type="image/webp"' in html
+    # Маленький исходник не растягиваем
+    assert '320w' in html and '500w' in html and '1400w' not in html
+
+    Product.objects.filter(pk=product.pk).update(image_variants={})
+    product.refresh_from_db()
+    html = Template('{% load shop_images %}{% product_picture product %}').render(Context({'product': product}))
+    assert '<picture>' not in html and product.image.url in html
+
+@pytest.mark.django_db
+def test_generate_thumbnails_command(media_root):
+    """Тест: команда дорезает варианты для старых товаров"""
+    product = Product.objects.create(name='Шорты', price=1000, stock=5, image=_jpeg())
+    Product.objects.filter(pk=product.pk).update(image_variants={})
+    Product.objects.create(name='Без фото', price=1000, stock=5)
+
+    call_command('generate_thumbnails', workers=1, stdout=io.StringIO())
+    assert set(Product.objects.get(pk=product.pk).image_variants) == {'card', 'detail', 'retina'}
+
+
+import json
+from decimal import Decimal
+from shop import catalog_import
+from shop.catalog_import import import_catalog, iter_json_records
+
+def test_iter_json_records_streams_arrays(monkeypatch):
+    """Тест: массив разбирается потоком, даже если объект не влезает в буфер"""
+    monkeypatch.setattr(catalog_import, 'READ_SIZE', 7)
+    records = [{'sku': str(i), 'name': 'Товар, "в кавычках" ]' * i} for i in range(5)]
+    assert list(iter_json_records(io.StringIO(json.dumps(records, indent=2)))) == records
+    jsonl = '\n'.join(json.dumps(record) for record in records) + '\n'
+    assert list(iter_json_records(io.StringIO(jsonl))) == records
+
+@pytest.mark.django_db
+def test_import_catalog_upserts_by_sku(django_assert_max_num_queries):
+    """Тест: импорт создаёт и обновляет товары пачками, а не по одному"""
+    Product.objects.create(sku='A-1', name='Старое название', price=100, stock=0)
+    StockNotification.objects.create(product=Product.objects.get(sku='A-1'), email='a@test.com')
+    rows = [{'sku': 'A-1', 'name': 'Футболка', 'price': '1990.00', 'stock': 5}]
+    rows += [{'sku': f'B-{i}', 'name': f'Товар {i}', 'price': 100 + i, 'stock': i} for i in range(50)]
+    rows += [{'sku': 'B-0', 'stock': 7}, {'sku': 'нет-такого', 'stock': 1}, {'sku': 'C-1', 'price': 'abc'}]
+    stream = io.StringIO('\n'.join(json.dumps(row) for row in rows))
+
+    with django_assert_max_num_queries(40):
+        stats = import_catalog(stream, batch_size=20)
+    assert (stats.created, stats.updated, stats.skipped, len(stats.errors)) == (50, 2, 1, 1)
+
+    product = Product.objects.get(sku='A-1')
+    assert (product.name, product.price, product.stock) == ('Футболка', Decimal('1990.00'), 5)
+    assert Product.objects.get(sku='B-0').stock == 7
+    # Остаток вырос с 0 — рассылка поставлена в очередь
+    assert RestockJob.objects.filter(product=product, status='pending').count() == 1
+    assert [p.name for p in search_products('Футболка')] == ['Футболка']
+
+@pytest.mark.django_db
+def test_import_catalog_command_loads_fixture():
+    """Тест: фикстуру products.json можно загрузить по id"""
+    call_command('import_catalog', 'products.json', key='id', stdout=io.StringIO())
+    with open('products.json', encoding='utf-8') as fixture:
+        expected = [row for row in json.load(fixture) if row['model'] == 'shop.product']
+    assert Product.objects.count() == len(expected)
+    assert Product.objects.get(pk=expected[0]['pk']).name == expected[0]['fields']['name']
+    # После загрузки с явными id новые товары создаются без конфликтов
+    assert Product.objects.create(name='Новый', price=1, stock=1).pk > max(row['pk'] for row in expected)
+
+
+from shop import metrics
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, django_user_model):
+    """Тест: /metrics считает запросы по view и доступен только персоналу"""
+    metrics.reset()
+    Product.objects.create(name='Футболка', price=2000, stock=10)
+    client.get('/каталог товаров/')
+    client.get('/каталог товаров/')
+
+    assert client.get('/metrics/').status_code == 302
+    client.force_login(django_user_model.objects.create(username='admin', is_staff=True))
+    response = client.get('/metrics/')
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.content.decode()
+    assert 'shop_requests_total{view="catalog",method="GET",status="200"} 2' in text
+    assert 'shop_request_duration_seconds_count{view="catalog",method="GET"} 2' in text
+    assert 'shop_db_queries_bucket{view="catalog",method="GET",le="0"} 1' in text
+    assert 'shop_template_render_seconds_sum{view="catalog",method="GET"}' in text
+    assert 'shop_response_size_bytes_bucket{view="catalog",method="GET",le="+Inf"} 2' in text
+
+def test_metrics_multiprocess(settings, tmp_path):
+    """Тест: в режиме METRICS_DIR счётчики всех процессов складываются"""
+    settings.METRICS_DIR = str(tmp_path)
+    metrics.reset()
+    labels = 'view="catalog",method="GET"'
+    metrics.increment('shop_requests_total', labels)
+    other = {'shop_requests_total': {labels: [4]}}
+    (tmp_path / 'metrics-999999.json').write_text(json.dumps(other))
+    assert f'shop_requests_total{{{labels}}} 5' in metrics.render_prometheus()
+
+
+from django.core.cache import cache
+from shop.models import Cart
+
+@pytest.mark.django_db
+def test_cart_store_does_not_touch_session(client, django_assert_num_queries):
+    """Тест: гостевая корзина живёт по cookie, без сессии, и пишет только изменения"""
+    product = Product.objects.create(name='Футболка', price=2000, stock=10)
+    with django_assert_num_queries(0):
+        client.get('/cart/')
+    assert 'cart_id' not in client.cookies
+
+    client.post(f'/cart/add/{product.id}/', {'quantity': 2})
+    assert Cart.objects.get().data == f'{product.id}:2'
+    assert 'sessionid' not in client.cookies or not client.session.get('cart')
+
+    # Каждое изменение сразу пишется в базу: кэш можно потерять
+    client.post(f'/cart/update/{product.id}/', {'action': 'increase'})
+    assert Cart.objects.get().data == f'{product.id}:3'
+    cache.clear()
+    assert client.get('/cart/').context['total'] == 6000
+
+    # Чтение корзины ничего не пишет
+    with django_assert_num_queries(1):
+        client.get('/cart/')
+
+@pytest.mark.django_db
+def test_cart_merges_on_login(client, django_user_model):
+    """Тест: при входе гостевая корзина сливается с корзиной пользователя"""
+    first = Product.objects.create(name='Футболка', price=2000, stock=10)
+    second = Product.objects.create(name='Кепка', price=500, stock=10)
+    user = django_user_model.objects.create_user('buyer', 'buyer@test.com', 'password123')
+    saved = CartStore.for_user(user)
+    saved.set(first.id, 1)
+    saved.save()
+
+    client.post(f'/cart/add/{first.id}/', {'quantity': 2})
+    client.post(f'/cart/add/{second.id}/', {'quantity': 1})
+    client.post('/accounts/login/', {'username': 'buyer', 'password': 'password123'})
+
+    cart = CartStore.for_user(user)
+    assert dict(cart.items()) == {first.id: 3, second.id: 1}
+    assert Cart.objects.get().key == f'u{user.id}'
+    assert client.cookies['cart_id'].value == ''
+
+
+from shop.models import Campaign, Deal
+from shop.deals import prerender_deals
+
+@pytest.mark.django_db
+def test_deals_follow_stock_tiers():
+    """Тест: витрина скидок обновляется, когда остаток переходит между ступенями"""
+    product = Product.objects.create(name='Кепка', price=1000, stock=10)
+    assert not Deal.objects.exists()
+
+    product.stock = 3
+    product.save()
+    deal = Deal.objects.get()
+    assert (deal.discount_percent, deal.discounted_price, deal.stock) == (10, Decimal('900.00'), 3)
+
+    inventory.adjust_stock({product.id: 2})
+    deal.refresh_from_db()
+    assert (deal.discount_percent, deal.discounted_price, deal.stock) == (20, Decimal('800.00'), 1)
+
+    inventory.adjust_stock({product.id: 1})
+    assert not Deal.objects.exists()
+
+@pytest.mark.django_db
+def test_product_save_outside_tiers_skips_deals():
+    """Тест: изменение товара без скидки не трогает витрину"""
+    product = Product.objects.create(name='Куртка', price=5000, stock=50)
+    product = Product.objects.get()
+    product.name = 'Куртка Nike'
+    with CaptureQueriesContext(connection) as captured:
+        product.save()
+    assert not any('shop_deal' in q['sql'] for q in captured.captured_queries)
+
+@pytest.mark.django_db
+def test_black_friday_reads_deals(client, settings, django_assert_num_queries):
+    """Тест: страница берёт окно из Campaign, а товары — из витрины; в пик — готовый HTML"""
+    Campaign.objects.all().delete()
+    Campaign.objects.create(
+        slug='bf', title='Киберпонедельник',
+        starts_at=timezone.now() - timedelta(days=1), ends_at=timezone.now() + timedelta(days=1),
+    )
+    Product.objects.create(name='Шорты', price=1000, stock=1)
+    Product.objects.create(name='Футболка', price=2000, stock=50)
+
+    with django_assert_num_queries(2):
+        response = client.get('/black-friday/')
+    content = response.content.decode()
+    assert response.context['is_active']
+    assert 'КИБЕРПОНЕДЕЛЬНИК' in content
+    assert 'Шорты' in content and '800.00' in content and 'Футболка' not in content
+
+    settings.DEALS_PEAK_MODE = True
+    prerender_deals()
+    Product.objects.create(name='Носки', price=300, stock=2)
+    with django_assert_num_queries(0):
+        content = client.get('/black-friday/').content.decode()
+    assert 'Шорты' in content and 'Носки' not in content
+
+
+from shop.admin import parse_tracking_numbers
+
+@pytest.mark.django_db
+def test_order_changelist_scales(admin_client, django_user_model, django_assert_max_num_queries):
+    """Тест: список заказов не зависит от числа строк и пользователей по числу запросов"""
+    users = [django_user_model.objects.create(username=f'user{i}') for i in range(30)]
+    for user in users:
+        Order.objects.create(user=user, total=100)
+
+    with django_assert_max_num_queries(12):
+        response = admin_client.get('/admin/shop/order/')
+    content = response.content.decode()
+    assert response.status_code == 200
+    assert 'user29' in content
+    # Вместо списка всех пользователей — поле ввода
+    assert 'placeholder="логин или id"' in content
+    assert not response.context['cl'].list_editable
+
+    response = admin_client.get('/admin/shop/order/', {'user': 'user3'})
+    assert [order.user.username for order in response.context['cl'].result_list] == ['user3']
+
+@pytest.mark.django_db
+def test_order_bulk_actions(admin_client, django_user_model, django_assert_num_queries):
+    """Тест: статусы и трек-номера меняются одним UPDATE"""
+    user = django_user_model.objects.create(username='buyer')
+    orders = [Order.objects.create(user=user, total=100) for _ in range(3)]
+    Order.objects.filter(pk=orders[2].pk).update(status='delivered')
+
+    admin_client.post('/admin/shop/order/', {
+        'action': 'mark_shipped', '_selected_action': [o.pk for o in orders[:2]],
+    })
+    assert list(Order.objects.order_by('id').values_list('status', flat=True)) == ['shipped', 'shipped', 'delivered']
+
+    numbers, errors = parse_tracking_numbers(f'{orders[0].pk} RA123RU\n#{orders[2].pk};RB456RU\nмусор\n999999 X\n')
+    assert errors == ['мусор']
+    Order.objects.filter(pk=orders[0].pk).update(status='new')
+    response = admin_client.post('/admin/shop/order/tracking/', {
+        'numbers': '\n'.join(f'{pk} {number}' for pk, number in numbers.items()),
+    })
+    assert response.status_code == 302
+    tracked = dict(Order.objects.values_list('id', 'tracking_number'))
+    assert tracked[orders[0].pk] == 'RA123RU' and tracked[orders[2].pk] == 'RB456RU'
+    # Новый заказ ушёл в доставку, доставленный остался доставленным
+    assert Order.objects.get(pk=orders[0].pk).status == 'shipped'
+    assert Order.objects.get(pk=orders[2].pk).status == 'delivered'
+
+@pytest.mark.django_db
+def test_product_adjust_stock_action(admin_client, django_capture_on_commit_callbacks):
+    """Тест: массовое изменение остатка — один UPDATE, без ухода в минус и с рассылкой"""
+    empty = Product.objects.create(name='Кепка', price=500, stock=0)
+    full = Product.objects.create(name='Футболка', price=2000, stock=2)
+    StockNotification.objects.create(product=empty, email='fan@test.com')
+
+    response = admin_client.post('/admin/shop/product/', {
+        'action': 'adjust_stock', '_selected_action': [empty.pk, full.pk],
+    })
+    assert 'Изменить остаток на' in response.content.decode()
+
+    admin_client.post('/admin/shop/product/', {
+        'action': 'adjust_stock', '_selected_action': [empty.pk, full.pk], 'apply': '1', 'delta': '3',
+    })
+    assert dict(Product.objects.values_list('name', 'stock')) == {'Кепка': 3, 'Футболка': 5}
+    assert RestockJob.objects.filter(product=empty).exists()
+    assert Deal.objects.get(product=empty).discount_percent == 10
+
+    admin_client.post('/admin/shop/product/', {
+        'action': 'adjust_stock', '_selected_action': [empty.pk, full.pk], 'apply': '1', 'delta': '-4',
+    })
+    assert dict(Product.objects.values_list('name', 'stock')) == {'Кепка': 0, 'Футболка': 1}
+
+
+import csv
+
+@pytest.mark.django_db
+def test_orders_export_streams_csv(admin_client, client, django_user_model):
+    """Тест: выгрузка заказов потоковая, с фильтрами по дате и статусу"""
+    user = django_user_model.objects.create(username='buyer')
+    old = _order_with_line(user, 'Старый товар')
+    Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=10))
+    _order_with_line(user, 'Футболка')
+    shipped = _order_with_line(user, 'Кепка')
+    Order.objects.filter(pk=shipped.pk).update(status='shipped')
+
+    assert client.get('/export/orders/').status_code == 302
+    response = admin_client.get('/export/orders/', {'from': timezone.localdate().isoformat()})
+    assert response.streaming
+    rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode('utf-8-sig'))))
+    assert sorted(row['name'] for row in rows) == ['Кепка', 'Футболка']
+    assert rows[0]['username'] == 'buyer' and rows[0]['line_total'] == '100.00'
+
+    response = admin_client.get('/export/orders/', {'format': 'jsonl', 'status': 'shipped'})
+    lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [line['name'] for line in lines] == ['Кепка']
+    assert admin_client.get('/export/orders/', {'to': '2025-13-01'}).status_code == 400
+
+@pytest.mark.django_db
+def test_export_orders_command(django_user_model, tmp_path):
+    """Тест: команда пишет JSONL в файл"""
+    user = django_user_model.objects.create(username='buyer')
+    _order_with_line(user, 'Футболка')
+    path = tmp_path / 'orders.jsonl'
+    call_command('export_orders', format='jsonl', output=str(path))
+    assert json.loads(path.read_text(encoding='utf-8'))['name'] == 'Футболка'
+
+from shop.models import DailyProductSales, DailySales
+from shop.sales import set_status
+
+def _sales_snapshot():
+    return (
+        sorted(DailySales.objects.values_list('status', 'orders', 'units', 'revenue')),
+        sorted(DailyProductSales.objects.values_list('product_id', 'orders', 'units', 'revenue')),
+    )
+
+@pytest.mark.django_db
+def test_sales_rollups_follow_checkout_and_status(client, django_user_model):
+    """Тест: дневные продажи обновляются при оформлении, смене статуса и совпадают с пересчётом"""
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    shorts = Product.objects.create(name='Шорты', price=3000, stock=10)
+    cap = Product.objects.create(name='Кепка', price=500, stock=10)
+    for quantity in (2, 1):
+        client.post(f'/cart/add/{shorts.id}/', {'quantity': quantity})
+        client.post(f'/cart/add/{cap.id}/', {'quantity': 1})
+        client.post('/checkout/', {'phone': '+79991234567', 'address': 'Москва'})
+    first, second = Order.objects.order_by('id')
+
+    assert _sales_snapshot() == (
+        [('new', 2, 5, Decimal('10000.00'))],
+        sorted([(shorts.id, 2, 3, Decimal('9000.00')), (cap.id, 2, 2, Decimal('1000.00'))]),
+    )
+
+    assert set_status(Order.objects.filter(id=first.id), 'cancelled') == 1
+    second.status = 'delivered'
+    second.save()
+    expected = (
+        [('cancelled', 1, 3, Decimal('6500.00')), ('delivered', 1, 2, Decimal('3500.00'))],
+        sorted([(shorts.id, 1, 1, Decimal('3000.00')), (cap.id, 1, 1, Decimal('500.00'))]),
+    )
+    assert _sales_snapshot() == expected
+
+    call_command('rebuild_sales', stdout=io.StringIO())
+    assert _sales_snapshot() == expected
+
+    # Отмена и возврат не оставляют пустых строк: как после пересчёта
+    set_status(Order.objects.filter(id=second.id), 'cancelled')
+    set_status(Order.objects.filter(id=second.id), 'delivered')
+    assert _sales_snapshot() == expected
+
+    second.delete()
+    assert _sales_snapshot() == ([('cancelled', 1, 3, Decimal('6500.00'))], [])
+
+@pytest.mark.django_db
+def test_sales_report_reads_rollups(admin_client, client, django_assert_max_num_queries):
+    """Тест: дашборд продаж только для персонала и читает только rollup'ы"""
+    product = Product.objects.create(name='Мяч', price=1000, stock=5)
+    DailySales.objects.create(day=timezone.localdate(), status='new', orders=3, units=4, revenue=4000)
+    DailyProductSales.objects.create(day=timezone.localdate(), product=product, name='Мяч', orders=3, units=4, revenue=4000)
+
+    assert client.get('/reports/sales/').status_code == 302
+    admin_client.get('/reports/sales/')
+    with django_assert_max_num_queries(4):
+        response = admin_client.get('/reports/sales/')
+    assert response.context['products'][0]['units'] == 4
+    assert response.context['days'][0]['revenue'] == 4000
+    assert 'Мяч' in response.content.decode()
+    assert admin_client.get('/reports/sales/', {'from': 'вчера'}).status_code == 400
+
+from django.http import HttpResponse
+from django.test import RequestFactory
+from shop.ratelimit import hit, ratelimit
+
+def test_sliding_window_counts_previous_window():
+    """Тест: прошлое окно учитывается с весом оставшейся доли"""
+    assert hit('test', 'ip', '1.2.3.4', 2, 60, now=0) == 0
+    assert hit('test', 'ip', '1.2.3.4', 2, 60, now=1) == 0
+    assert hit('test', 'ip', '1.2.3.4', 2, 60, now=2) == 58
+    # 3 запроса прошлого окна × 50/60 + 1 > 2
+    assert hit('test', 'ip', '1.2.3.4', 2, 60, now=70) == 50
+    assert hit('test', 'ip', '1.2.3.5', 2, 60, now=70) == 0
+    assert hit('test', 'ip', '1.2.3.4', 2, 60, now=130) == 0
+
+@pytest.mark.django_db
+def test_password_reset_is_rate_limited_by_email(client, django_user_model, settings, django_assert_num_queries):
+    """Тест: лишние запросы кода получают 429 без обращения к базе"""
+    settings.RATE_LIMITS = {'password_reset': [('ip', 100, 600), ('email', 2, 600)]}
+    django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    for _ in range(2):
+        assert client.post('/password-reset-code/', {'identifier': 'buyer@test.com'}).status_code == 302
+
+    with django_assert_num_queries(0):
+        response = client.post('/password-reset-code/', {'identifier': ' BUYER@test.com'})
+    assert response.status_code == 429
+    assert int(response['Retry-After']) > 0
+    assert OutgoingEmail.objects.count() == 2
+    assert client.post('/password-reset-code/', {'identifier': 'other@test.com'}).status_code == 200
+    assert client.get('/password-reset-code/').status_code == 200
+
+def test_ratelimit_decorator_without_middleware(settings):
+    """Тест: декоратор ограничивает и без RateLimitMiddleware"""
+    settings.RATE_LIMITS = {'register': [('ip', 1, 60)]}
+    view = ratelimit('register')(lambda request: HttpResponse('ok'))
+    factory = RequestFactory()
+    assert view(factory.post('/', REMOTE_ADDR='10.0.0.1')).status_code == 200
+    assert view(factory.post('/', REMOTE_ADDR='10.0.0.1')).status_code == 429
+    assert view(factory.post('/', REMOTE_ADDR='10.0.0.2')).status_code == 200
+    settings.RATELIMIT_ENABLED = False
+    assert view(factory.post('/', REMOTE_ADDR='10.0.0.1')).status_code == 200
+
+def test_ratelimit_ignores_spoofed_forwarded_for(settings):
+    """Тест: за прокси адрес берётся справа в X-Forwarded-For, подделка слева не помогает"""
+    settings.RATE_LIMITS = {'register': [('ip', 1, 60)]}
+    settings.RATELIMIT_IP_META = 'HTTP_X_FORWARDED_FOR'
+    view = ratelimit('register')(lambda request: HttpResponse('ok'))
+    factory = RequestFactory()
+    assert view(factory.post('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 10.0.0.7')).status_code == 200
+    assert view(factory.post('/', HTTP_X_FORWARDED_FOR='2.2.2.2, 10.0.0.7')).status_code == 429
+    assert view(factory.post('/', HTTP_X_FORWARDED_FOR='10.0.0.8')).status_code == 200
+    settings.RATELIMIT_PROXY_COUNT = 2
+    assert view(factory.post('/', HTTP_X_FORWARDED_FOR='3.3.3.3, 10.0.0.9, 192.168.0.1')).status_code == 200
+    assert view(factory.post('/', HTTP_X_FORWARDED_FOR='4.4.4.4, 10.0.0.9, 192.168.0.1')).status_code == 429
+
+import importlib
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory
+from django.http import Http404
+from django.urls import clear_url_caches, resolve
+from shop import async_views
+
+def _reload_urls():
+    import shop.urls
+    import sportshop.urls
+    importlib.reload(shop.urls)
+    importlib.reload(sportshop.urls)
+    clear_url_caches()
+
+async def _aget(client, url):
+    return await client.get(url)
+
+@pytest.fixture
+def async_urls(settings):
+    """Маршруты как под ASGI: страницы чтения — async views"""
+    settings.ASYNC_VIEWS = True
+    _reload_urls()
+    yield
+    settings.ASYNC_VIEWS = False
+    _reload_urls()
+
+@pytest.mark.django_db
+def test_async_read_views(async_urls, async_client, django_user_model):
+    """Тест: async views отдают те же страницы, что и синхронные"""
+    assert resolve('/').func is async_views.index_page
+    product = Product.objects.create(name='Гантели', price=2000, stock=1)
+    user = django_user_model.objects.create(username='buyer')
+    async_client.force_login(user)
+    cart = CartStore.for_user(user)
+    cart.set(product.id, 2)
+    cart.save()
+    cache.clear()
+
+    get = async_to_sync(_aget)
+    assert get(async_client, '/').status_code == 200
+    for url in ('/black-friday/', '/cart/'):
+        response = get(async_client, url)
+        assert response.status_code == 200, url
+        assert 'Гантели' in response.content.decode(), url
+    assert '👤 ЛК' in response.content.decode()
+    assert response.context['total'] == 3200
+
+    # AsyncClient в Django 4.2 портит не-ASCII пути: каталог и товар вызываем напрямую
+    factory = AsyncRequestFactory()
+    request = factory.get('/', {'sort': 'price'})
+    request.user = AnonymousUser()
+    assert 'Гантели' in async_to_sync(async_views.catalog_page)(request).content.decode()
+    request = factory.get('/')
+    request.user = AnonymousUser()
+    assert 'Гантели' in async_to_sync(async_views.product_detail)(request, product.id).content.decode()
+    with pytest.raises(Http404):
+        async_to_sync(async_views.product_detail)(request, 999999)
+
+
+import asyncio
+import time as _time
+from shop import telegram
+from shop.models import TelegramMessage
+from shop.sales import set_status
+
+def test_token_bucket_spaces_requests():
+    """Тест: ведро токенов выдаёт не больше rate запросов в секунду после всплеска"""
+    async def run():
+        bucket = telegram.TokenBucket(rate=20, capacity=2)
+        started = _time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return _time.monotonic() - started
+
+    # Два токена сразу, ещё четыре — по 1/20 секунды
+    assert 0.18 <= asyncio.run(run()) < 1
+
+@pytest.mark.django_db
+def test_telegram_dispatch_respects_limits(settings):
+    """Тест: рассылка через поддельный Bot API — лимит на чат, блокировки, 429"""
+    settings.TELEGRAM_GLOBAL_RATE = 1000
+    settings.TELEGRAM_CHAT_RATE = 10
+    TelegramMessage.enqueue_many([('1', 'раз'), ('1', 'два'), ('1', 'три'), ('2', 'привет'), ('3', 'блок')])
+    api = telegram.FakeBotAPI(blocked={'3'})
+
+    assert telegram.dispatch(transport=api.transport) == (4, 1)
+    first_chat = [at for chat_id, _, at in api.delivered if chat_id == '1']
+    assert [text for chat_id, text, _ in api.delivered if chat_id == '1'] == ['раз', 'два', 'три']
+    assert all(b - a >= 0.09 for a, b in zip(first_chat, first_chat[1:]))
+    blocked = TelegramMessage.objects.get(chat_id='3')
+    assert blocked.status == 'failed' and '403' in blocked.last_error
+    assert TelegramMessage.objects.filter(status='sent').count() == 4
+
+    # Flood control: сообщение остаётся в очереди до retry_after
+    TelegramMessage.enqueue_many([('4', 'позже')])
+    api = telegram.FakeBotAPI(flood_errors=1, retry_after=30)
+    assert telegram.dispatch(transport=api.transport) == (0, 1)
+    message = TelegramMessage.objects.get(chat_id='4')
+    assert message.status == 'pending' and message.attempts == 1
+    assert message.next_attempt_at > timezone.now() + timedelta(seconds=25)
+    assert telegram.dispatch(transport=api.transport) == (0, 0)
+
+@pytest.mark.django_db
+def test_restock_routes_bound_users_to_telegram(django_user_model, mailoutbox):
+    """Тест: подписчикам с привязанным Telegram уведомление уходит туда, а не письмом"""
+    user = django_user_model.objects.create(username='fan', email='tg@test.com')
+    Profile.objects.filter(user=user).update(telegram_id='777')
+    product = Product.objects.create(name='Кепка', price=500, stock=5)
+    StockNotification.objects.create(product=product, email='tg@test.com')
+    StockNotification.objects.create(product=product, email='mail@test.com')
+
+    job = run_job(RestockJob.objects.create(product=product))
+    assert job.sent == 2
+    assert OutgoingEmail.objects.get().to == ['mail@test.com']
+    assert TelegramMessage.objects.get().chat_id == '777'
+    assert not StockNotification.objects.exists()
+
+@pytest.mark.django_db
+def test_order_status_change_enqueues_telegram(django_user_model):
+    """Тест: смена статуса заказа ставит сообщение покупателю с Telegram"""
+    user = django_user_model.objects.create(username='buyer')
+    Profile.objects.filter(user=user).update(telegram_id='42')
+    order = _order_with_line(user, 'Кепка')
+    _order_with_line(django_user_model.objects.create(username='no_tg'), 'Мяч')
+
+    Order.objects.filter(pk=order.pk).update(tracking_number='RA123')
+    assert set_status(Order.objects.all(), 'shipped') == 2
+    message = TelegramMessage.objects.get()
+    assert message.chat_id == '42'
+    assert f'#{order.id}' in message.text and 'RA123' in message.text
+
+    order.refresh_from_db()
+    order.status = 'delivered'
+    order.save()
+    assert TelegramMessage.objects.count() == 2
+
+
+from django.db import connections
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_read_views_use_replica_until_checkout(client, settings, django_user_model):
+    """Тест: страницы чтения идут на реплику, после заказа клиент читает с основной базы"""
+    settings.DATABASE_REPLICAS = ['replica']
+    user = django_user_model.objects.create(username='buyer', email='buyer@test.com')
+    client.force_login(user)
+    product = Product.objects.create(name='Шорты', price=3000, stock=2)
+
+    # Реплика — зеркало default, поэтому проверяем, в какое соединение ушли запросы
+    with CaptureQueriesContext(connections['replica']) as replica:
+        assert client.get(f'/товар/{product.id}/').status_code == 200
+    assert replica.captured_queries
+    # Поиск сырым SQL идёт туда же, куда и ORM
+    with CaptureQueriesContext(connections['replica']) as replica:
+        assert [p.name for p in client.get('/search/', {'q': 'шорты'}).context['products']] == ['Шорты']
+    assert any('shop_product_fts' in q['sql'] for q in replica.captured_queries)
+
+    client.post(f'/cart/add/{product.id}/', {'quantity': 1})
+    with CaptureQueriesContext(connections['replica']) as replica:
+        response = client.post('/checkout/', {'phone': '+79991234567', 'address': 'Москва'})
+    assert response.cookies['db_primary']['max-age'] == settings.REPLICA_STICKY_SECONDS
+    assert not replica.captured_queries
+
+    with CaptureQueriesContext(connections['replica']) as replica:
+        assert len(client.get('/cabinet/').context['orders']) == 1
+    assert not replica.captured_queries
+    del client.cookies['db_primary']
+    with CaptureQueriesContext(connections['replica']) as replica:
+        assert len(client.get('/cabinet/').context['orders']) == 1
+    assert any('"shop_order"' in q['sql'] for q in replica.captured_queries)
+    # FTS-таблицу flush после теста не очищает
+    product.delete()
+
+
+from shop.cache import bump_catalog_version
+
+@pytest.mark.django_db
+def test_product_page_answers_304_until_product_changes(client, django_user_model, django_assert_num_queries):
+    """Тест: повторный запрос страницы товара — 304 по ETag одним запросом к базе"""
+    product = Product.objects.create(name='Шорты', price=3000, stock=10)
+    url = f'/товар/{product.id}/'
+    # Первый ответ ставит CSRF-cookie (от неё зависит ETag), общему кэшу его хранить нельзя
+    response = client.get(url)
+    assert 'csrftoken' in response.cookies
+    assert 'private' in response['Cache-Control'] and 'public' not in response['Cache-Control']
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'public' in response['Cache-Control'] and 'Cookie' in response['Vary']
+    etag = response['ETag']
+
+    with django_assert_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304 and response['ETag'] == etag
+
+    inventory.adjust_stock({product.id: 1})
+    assert Product.objects.get().updated_at > product.updated_at
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    # Обычный save() (правка в админке) тоже меняет ETag
+    response = client.get(url)
+    product = Product.objects.get()
+    product.price = 500
+    product.save()
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+    # Вошедший пользователь получает свою версию страницы, не из общего кэша
+    client.force_login(django_user_model.objects.create(username='buyer'))
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200 and 'private' in response['Cache-Control']
+
+@pytest.mark.django_db
+def test_catalog_answers_304_until_catalog_changes(client, django_assert_num_queries):
+    """Тест: каталог отвечает 304 без запросов к базе, пока каталог не менялся"""
+    Product.objects.create(name='Шорты', price=3000, stock=10)
+    url = '/каталог товаров/'
+    response = client.get(url, {'sort': 'price'})
+    assert response.status_code == 200
+
+    with django_assert_num_queries(0):
+        assert client.get(url, {'sort': 'price'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+        assert client.get(url, {'sort': 'price'}, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code == 304
+    assert client.get(url, {'sort': 'new'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+    bump_catalog_version()
+    assert client.get(url, {'sort': 'price'}, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
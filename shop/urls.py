@@ -1,13 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import async_views, views
+
+# Под ASGI (sportshop/asgi.py включает SHOP_ASYNC_VIEWS) страницы чтения — асинхронные
+read_views = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 urlpatterns = [
-    path('', views.index_page, name='home'),
+    path('', read_views.index_page, name='home'),
     path('about/', views.about_page, name='about'),
-    path('каталог товаров/', views.catalog_page, name='catalog'),
-    path('товар/<int:product_id>/', views.product_detail, name='product_detail'),
-    path('cart/', views.cart_view, name='cart'),
+    path('каталог товаров/', read_views.catalog_page, name='catalog'),
+    path('search/', views.search_page, name='search'),
+    path('товар/<int:product_id>/', read_views.product_detail, name='product_detail'),
+    path('cart/', read_views.cart_view, name='cart'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/update/<int:product_id>/', views.update_cart, name='update_cart'),
 
@@ -21,9 +26,13 @@ urlpatterns = [
     # ЛК
     path('cabinet/', views.personal_cabinet, name='cabinet'),
     path('cabinet/edit/', views.edit_profile, name='edit_profile'),
+    path('cabinet/orders/<int:order_id>/items/', views.order_items, name='order_items'),
     path('checkout/', views.checkout_page, name='checkout_page'),
 
-    path('black-friday/', views.black_friday_page, name='black_friday'),
+    path('black-friday/', read_views.black_friday_page, name='black_friday'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('export/orders/', views.orders_export, name='orders_export'),
+    path('reports/sales/', views.sales_report, name='sales_report'),
 
     path('password-reset-code/', views.password_reset_code_request, name='password_reset_code_request'),
     path('password-reset-code/verify/', views.password_reset_code_verify, name='password_reset_code_verify'),
@@ -1,35 +1,115 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.mail import send_mail
 from django.utils.crypto import get_random_string
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from .models import Product, Profile, Order
-from django.utils import timezone
-from datetime import datetime, timedelta
-from .models import Product, StockNotification
+from .models import Product, Profile, Order, OrderItem, OutgoingEmail
+from datetime import timedelta
+from decimal import Decimal, ROUND_DOWN
+from .models import CENT, Product, StockNotification
+from .pagination import KeysetPaginator
+from .cart import price_cart
+from . import inventory
+from .search import search_products
+from .cache import cached_render, catalog_version
+from .metrics import render_prometheus
+from .deals import current_campaign, deals_html
+from . import export, sales
+from .ratelimit import ratelimit
+from .routers import pin_primary, use_replica
+from .conditional import catalog_marker, conditional, product_marker
+
+# Варианты сортировки каталога; последним всегда идёт уникальный id
+CATALOG_ORDERINGS = {
+    'new': ('-id',),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    # Цена со скидкой считается в базе (with_discount), по индексу не идёт
+    'deals': ('-discount_percent', 'discounted_price', 'id'),
+}
 
 # Главные страницы
+@use_replica
 def index_page(request):
-    products = Product.objects.all()[:6]
-    return render(request, 'index.html', {'products': products})
+    body_html = cached_render('includes/index_body.html', (), lambda: {
+        'products': Product.objects.all()[:6],
+    })
+    return render(request, 'index.html', {'body_html': body_html})
 
 def about_page(request):
     return render(request, 'about.html')
 
+def _catalog_params(request):
+    """
+    Разобрать параметры каталога: (sort, max_price, paginator, cursor, части ключа кэша).
+
+    Ключ кэша строится из разобранных значений (цена до копеек, курсор в
+    каноничном виде), а не из строки запроса. Если цена или курсор битые,
+    части ключа — None: такую страницу отдаём без кэша.
+    """
+    valid = True
+    sort = request.GET.get('sort', 'new')
+    if sort not in CATALOG_ORDERINGS:
+        sort = 'new'
+    # Фильтр по цене с учётом скидки; цены в каталоге с точностью до копеек
+    max_price = None
+    if request.GET.get('max_price'):
+        try:
+            max_price = Decimal(request.GET['max_price']).quantize(CENT, rounding=ROUND_DOWN)
+        except ArithmeticError:
+            valid = False
+        else:
+            if not max_price.is_finite():
+                max_price, valid = None, False
+    products = Product.objects.with_discount()
+    if max_price is not None:
+        products = products.filter(discounted_price__lte=max_price)
+    paginator = KeysetPaginator(
+        products,
+        CATALOG_ORDERINGS[sort],
+        getattr(settings, 'CATALOG_PAGE_SIZE', 24),
+    )
+    cursor = request.GET.get('cursor')
+    cursor_key = paginator.cache_key(cursor)
+    key_parts = (sort, str(max_price), cursor_key) if valid and cursor_key is not None else None
+    return sort, max_price, paginator, cursor, key_parts
+
+@use_replica
+@conditional(catalog_marker)
 def catalog_page(request):
-    products = Product.objects.all()
-    return render(request, 'catalog.html', {'products': products})
+    sort, max_price, paginator, cursor, key_parts = _catalog_params(request)
+
+    def get_context():
+        page = paginator.page(cursor)
+        return {'products': page.object_list, 'page': page, 'sort': sort, 'max_price': max_price}
 
+    products_html = cached_render('includes/catalog_products.html', key_parts, get_context)
+    return render(request, 'catalog.html', {'products_html': products_html, 'sort': sort})
+
+@use_replica
+def search_page(request):
+    query = request.GET.get('q', '')
+    products = search_products(query, limit=getattr(settings, 'SEARCH_RESULTS_LIMIT', 48))
+    return render(request, 'search.html', {'products': products, 'query': query})
+
+@ratelimit('stock_notification')
+@use_replica
+@conditional(product_marker)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(Product.objects.with_discount(), id=product_id)
+    # Свой резерв (открытое оформление заказа) покупателю тоже доступен
+    available = inventory.available_for(request.user, [product])[product.id]
 
     # Обработка запроса на уведомление
     if request.method == 'POST' and request.user.is_authenticated:
-        if product.stock <= 0:
+        if available <= 0:
             email = request.user.email
             if not StockNotification.objects.filter(product=product, email=email).exists():
                 StockNotification.objects.create(product=product, email=email)
@@ -38,35 +118,32 @@ def product_detail(request, product_id):
                 messages.info(request, 'Вы уже подписаны на уведомление.')
             return redirect('product_detail', product_id=product_id)
 
-    return render(request, 'product.html', {'product': product})
+    return render(request, 'product.html', {
+        'product': product, 'available': available, 'catalog_version': catalog_version(),
+    })
+
+# Корзина (request.cart, см. shop.cart.CartStore; сохраняет CartMiddleware)
+def _drop_missing_products(request, cart, priced):
+    """Убрать из корзины товары, которые удалили из каталога"""
+    if not priced.missing:
+        return
+    cart.remove(*priced.missing)
+    messages.warning(request, 'Некоторые товары больше не продаются и были удалены из корзины.')
 
-# Корзина (в сессии)
 def cart_view(request):
-    cart = request.session.get('cart', {})
-    cart_items = []
-    total = 0
-    for product_id, item in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        qty = item.get('quantity', 1)
-        # Применяем скидку
-        _, discounted_price = product.get_discount_info()
-        item_total = discounted_price * qty
-        total += item_total
-        cart_items.append({
-            'product': product,
-            'quantity': qty,
-            'total': round(item_total, 2)
-        })
-    return render(request, 'cart.html', {'cart_items': cart_items, 'total': round(total, 2)})
+    cart = request.cart
+    priced = price_cart(cart, request.user)
+    _drop_missing_products(request, cart, priced)
+    return render(request, 'cart.html', {'cart_items': priced, 'total': priced.total})
 
 def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    if product.stock <= 0:
+    available = inventory.available_for(request.user, [product])[product.id]
+    if available <= 0:
         messages.error(request, 'Товар закончился!')
         return redirect('product_detail', product_id=product_id)
 
-    cart = request.session.get('cart', {})
-    pid = str(product_id)
+    cart = request.cart
 
     if request.method == 'POST':
         try:
@@ -75,27 +152,20 @@ def add_to_cart(request, product_id):
             quantity = 1
 
         # Ограничиваем количеством на складе
-        if quantity > product.stock:
-            messages.error(request, f'Нельзя добавить больше {product.stock} шт. (в наличии только {product.stock})')
+        if quantity > available:
+            messages.error(request, f'Нельзя добавить больше {available} шт. (в наличии только {available})')
             return redirect('product_detail', product_id=product_id)
 
-        if pid in cart:
-            new_qty = cart[pid]['quantity'] + quantity
-            if new_qty > product.stock:
-                messages.warning(request, f'В корзине уже есть товары. Максимум можно добавить ещё {product.stock - cart[pid]["quantity"]} шт.')
-                return redirect('product_detail', product_id=product_id)
-            cart[pid]['quantity'] = new_qty
-        else:
-            cart[pid] = {'quantity': quantity}
-
-        request.session['cart'] = cart
+        in_cart = cart.quantity(product_id)
+        if in_cart + quantity > available:
+            messages.warning(request, f'В корзине уже есть товары. Максимум можно добавить ещё {available - in_cart} шт.')
+            return redirect('product_detail', product_id=product_id)
+        cart.add(product_id, quantity)
         messages.success(request, f'"{product.name}" ({quantity} шт.) добавлен в корзину!')
     else:
         # Старый способ (без количества) — для совместимости
-        cart[pid] = cart.get(pid, {'quantity': 0})
-        if cart[pid]['quantity'] < product.stock:
-            cart[pid]['quantity'] += 1
-            request.session['cart'] = cart
+        if cart.quantity(product_id) < available:
+            cart.add(product_id)
             messages.success(request, f'"{product.name}" добавлен в корзину!')
 
     return redirect('product_detail', product_id=product_id)
@@ -103,31 +173,28 @@ def add_to_cart(request, product_id):
 def update_cart(request, product_id):
     if request.method == 'POST':
         action = request.POST.get('action')
-        cart = request.session.get('cart', {})
-        pid = str(product_id)
+        cart = request.cart
         product = get_object_or_404(Product, id=product_id)
 
-        if pid in cart:
-            current_qty = cart[pid]['quantity']
+        if product_id in cart:
+            current_qty = cart.quantity(product_id)
 
             if action == 'increase':
-                if current_qty < product.stock:
-                    cart[pid]['quantity'] += 1
+                available = inventory.available_for(request.user, [product])[product.id]
+                if current_qty < available:
+                    cart.set(product_id, current_qty + 1)
                 else:
-                    messages.warning(request, f'Нельзя добавить больше {product.stock} шт.')
+                    messages.warning(request, f'Нельзя добавить больше {available} шт.')
             elif action == 'decrease':
-                if current_qty > 1:
-                    cart[pid]['quantity'] -= 1
-                else:
-                    del cart[pid]
+                # При 1 шт. товар просто убирается
+                cart.set(product_id, current_qty - 1)
             elif action == 'remove':
-                del cart[pid]
-
-            request.session['cart'] = cart
+                cart.remove(product_id)
 
     return redirect('cart')
 
 # Регистрация
+@ratelimit('register', field='email')
 def register(request):
     if request.method == 'POST':
         username = request.POST['username']
@@ -147,7 +214,7 @@ def register(request):
         code = get_random_string(6, '0123456789')
         request.session['confirmation_code'] = code
         request.session['user_id'] = user.id
-        send_mail('Код подтверждения', f'Ваш код: {code}', settings.DEFAULT_FROM_EMAIL, [email])
+        OutgoingEmail.enqueue('Код подтверждения', f'Ваш код: {code}', [email])
         messages.success(request, 'Проверьте email и введите код.')
         return redirect('confirm_email')
     return render(request, 'registration/register.html')
@@ -165,14 +232,36 @@ def confirm_email(request):
 
 # ЛК
 @login_required
+@use_replica
 def personal_cabinet(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
+    # Состав заказов подгружается отдельно (order_items), здесь только шапки
+    paginator = KeysetPaginator(
+        Order.objects.filter(user=request.user).defer('items'),
+        ('-created_at', '-id'),
+        getattr(settings, 'CABINET_ORDERS_PAGE_SIZE', 10),
+    )
+    page = paginator.page(request.GET.get('cursor'))
     return render(request, 'cabinet.html', {
         'profile': profile,
-        'orders': orders
+        'orders': page.object_list,
+        'page': page,
     })
 
+@login_required
+@use_replica
+def order_items(request, order_id):
+    """Состав заказа для ЛК (JSON, грузится при раскрытии заказа)"""
+    order = get_object_or_404(Order.objects.defer('items'), id=order_id, user=request.user)
+    items = [{
+        'name': line.name,
+        'quantity': line.quantity,
+        'price': str(line.price),
+        'discounted_price': str(line.discounted_price),
+        'total': str(line.total),
+    } for line in order.lines.all()]
+    return JsonResponse({'items': items})
+
 @login_required
 def edit_profile(request):
     profile, created = Profile.objects.get_or_create(user=request.user)
@@ -193,12 +282,18 @@ def edit_profile(request):
 
 @login_required
 def checkout_page(request):
-    cart = request.session.get('cart', {})
+    cart = request.cart
     if not cart:
         messages.error(request, 'Корзина пуста!')
         return redirect('cart')
 
     profile, created = Profile.objects.get_or_create(user=request.user)
+    priced = price_cart(cart)
+    _drop_missing_products(request, cart, priced)
+    if not priced:
+        return redirect('cart')
+
+    quantities = {line.product.id: line.quantity for line in priced}
 
     if request.method == 'POST':
         # Обновляем данные профиля
@@ -206,88 +301,61 @@ def checkout_page(request):
         profile.address = request.POST.get('address', profile.address)
         profile.save()
 
-        # Проверяем и обновляем остатки
-        cart_items = []
-        total = 0
-        errors = []
-
-        # Собираем данные и проверяем остатки
-        for product_id, item in cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            qty = item.get('quantity', 1)
-            _, discounted_price = product.get_discount_info()
-            item_total = discounted_price * qty
-
-            if qty > product.stock:
-                errors.append(f'Товар "{product.name}": недостаточно на складе (в наличии {product.stock}, запрошено {qty})')
-            else:
-                cart_items.append({
-                    'product': product,
-                    'quantity': qty,
-                    'total': item_total
-                })
-                total += item_total
-
-        if errors:
-            for error in errors:
-                messages.error(request, error)
-            return render(request, 'checkout.html', {
-                'profile': profile,
-                'cart_items': cart_items,
-                'total': round(total, 2)
-            })
-
-        # Всё ок — уменьшаем остатки и оформляем заказ
-        with transaction.atomic():
-            order_items = []
-            for item in cart_items:
-                product = item['product']
-                qty = item['quantity']
-                # Уменьшаем остаток
-                product.stock -= qty
-                product.save()
+        # Списываем зарезервированное и оформляем заказ
+        try:
+            with transaction.atomic():
+                inventory.confirm(request.user, quantities)
+                order = Order.objects.create(user=request.user, total=priced.total)
                 # Сохраняем данные товара (на случай, если его удалят позже)
-                order_items.append({
-                    'product_id': product.id,
-                    'name': product.name,
-                    'price': float(product.price),
-                    'discounted_price': item['total'] / qty,
-                    'quantity': qty,
-                    'total': item['total']
-                })
-
-                order = Order.objects.create(
-                    user=request.user,
-                    total=total,
-                    items=order_items
-                )
-
+                lines = OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=line.product,
+                        name=line.product.name,
+                        price=line.product.price,
+                        discounted_price=line.unit_price,
+                        quantity=line.quantity,
+                        total=line.total,
+                        created_at=order.created_at,
+                    )
+                    for line in priced
+                ])
+                sales.record_order(order, lines)
+        except inventory.InsufficientStock as e:
+            return _checkout_shortage(request, profile, priced, e.available)
 
         # Очищаем корзину
-        request.session['cart'] = {}
+        cart.clear()
         messages.success(request, f'Заказ #{order.id} успешно оформлен! Спасибо за покупку!')
-        return redirect('cabinet')
-    # GET-запрос — показываем страницу
-    cart_items = []
-    total = 0
-    for product_id, item in cart.items():
-        product = get_object_or_404(Product, id=product_id)
-        qty = item.get('quantity', 1)
-        _, discounted_price = product.get_discount_info()
-        item_total = discounted_price * qty
-        total += item_total
-        cart_items.append({
-            'product': product,
-            'quantity': qty,
-            'total': item_total
-        })
+        return pin_primary(redirect('cabinet'))
+
+    # GET-запрос — резервируем товары на время оформления
+    try:
+        inventory.reserve(request.user, quantities)
+    except inventory.InsufficientStock as e:
+        return _checkout_shortage(request, profile, priced, e.available)
 
+    return render(request, 'checkout.html', {
+        'profile': profile,
+        'cart_items': priced,
+        'total': priced.total
+    })
+
+def _checkout_shortage(request, profile, priced, available):
+    """Показать оформление с ошибками по товарам, которых не хватает"""
+    cart_items = []
+    for line in priced:
+        if line.product.id in available:
+            messages.error(request, f'Товар "{line.product.name}": недостаточно на складе (в наличии {available[line.product.id]}, запрошено {line.quantity})')
+        else:
+            cart_items.append(line)
     return render(request, 'checkout.html', {
         'profile': profile,
         'cart_items': cart_items,
-        'total': round(total, 2)
+        'total': sum((line.total for line in cart_items), Decimal('0.00')),
     })
 
+@ratelimit('password_reset', field='identifier')
 def password_reset_code_request(request):
     if request.method == 'POST':
         identifier = request.POST.get('identifier')  # логин или email
@@ -305,20 +373,14 @@ def password_reset_code_request(request):
         request.session['password_reset_code'] = code
         request.session['password_reset_user_id'] = user.id
 
-        # Отправляем код на email
-        try:
-            send_mail(
-                'Код для смены пароля — NEXUS SPORT',
-                f'Ваш код подтверждения: {code}',
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=False,
-            )
-            messages.success(request, 'Код подтверждения отправлен на ваш email.')
-            return redirect('password_reset_code_verify')
-        except Exception:
-            messages.error(request, 'Не удалось отправить письмо. Попробуйте позже.')
-            return render(request, 'password_reset_request.html')
+        # Ставим письмо с кодом в очередь
+        OutgoingEmail.enqueue(
+            'Код для смены пароля — NEXUS SPORT',
+            f'Ваш код подтверждения: {code}',
+            [user.email],
+        )
+        messages.success(request, 'Код подтверждения отправлен на ваш email.')
+        return redirect('password_reset_code_verify')
 
     return render(request, 'password_reset_request.html')
 
@@ -347,18 +409,59 @@ def password_reset_code_verify(request):
 
     return render(request, 'password_reset_verify.html')
 
+@use_replica
 def black_friday_page(request):
-    # Получаем товары со скидками (остаток <= 5 и > 0)
-    discounted_products = Product.objects.filter(stock__gt=0, stock__lte=5)
-    
-    # Пример: Чёрная пятница длится 3 дня с 29 ноября
-    now = timezone.now()
-    bf_start = datetime(2025, 11, 29, 0, 0, tzinfo=timezone.utc)
-    bf_end = bf_start + timedelta(days=3)
-    is_active = bf_start <= now <= bf_end
-
+    # Окно распродажи задаётся в админке (Campaign), список — из витрины Deal
+    campaign = current_campaign()
     return render(request, 'black_friday.html', {
-        'products': discounted_products,
-        'is_active': is_active,
-        'bf_end': bf_end,
-    })
\ No newline at end of file
+        'products_html': deals_html(),
+        'campaign': campaign,
+        'is_active': campaign is not None and campaign.is_active(),
+        'bf_end': campaign.ends_at if campaign else None,
+    })
+
+@staff_member_required
+def metrics_view(request):
+    """Метрики в текстовом формате Prometheus (только для персонала)"""
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _date_param(request, name):
+    """Дата из GET-параметра (ГГГГ-ММ-ДД) или None; ValueError, если дата неверная"""
+    value = request.GET.get(name)
+    if not value:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+@staff_member_required
+def orders_export(request):
+    """Потоковая выгрузка позиций заказов: ?format=csv|jsonl&from=&to=&status="""
+    fmt = request.GET.get('format', 'csv')
+    status = request.GET.get('status') or None
+    if fmt not in export.FORMATS or (status and status not in export.STATUSES):
+        return HttpResponseBadRequest('Неверный формат или статус')
+    try:
+        date_from, date_to = _date_param(request, 'from'), _date_param(request, 'to')
+    except ValueError:
+        return HttpResponseBadRequest('Неверная дата')
+
+    rows = export.export_rows(date_from, date_to, status)
+    response = StreamingHttpResponse(export.iter_export(rows, fmt), content_type=export.FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="orders.{fmt}"'
+    return response
+
+@staff_member_required
+def sales_report(request):
+    """Продажи за период по дням, статусам и товарам (читает только rollup'ы)"""
+    try:
+        date_to = _date_param(request, 'to') or timezone.localdate()
+        date_from = _date_param(request, 'from') or date_to - timedelta(days=29)
+    except ValueError:
+        return HttpResponseBadRequest('Неверная дата')
+    return render(request, 'sales_report.html', {
+        'date_from': date_from,
+        'date_to': date_to,
+        **sales.report(date_from, date_to),
+    })
@@ -12,5 +12,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sportshop.settings")
+# Под ASGI страницы чтения отдают async views (shop.async_views);
+# SHOP_ASYNC_VIEWS=0 — вернуть синхронные
+os.environ.setdefault("SHOP_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
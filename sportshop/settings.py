@@ -38,11 +38,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "shop.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
+    "shop.ratelimit.RateLimitMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "shop.cart.CartMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -51,7 +54,8 @@ ROOT_URLCONF = "sportshop.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Обычный DjangoTemplates + замер времени рендеринга для /metrics
+        "BACKEND": "shop.metrics.InstrumentedTemplates",
         'DIRS': [TEMPLATE_DIR], 
         "APP_DIRS": True,
         "OPTIONS": {
@@ -82,6 +86,46 @@ DATABASES = {
     }
 }
 
+# SHOP_DB=sqlite — запуск без Postgres (тесты в CI, быстрый локальный старт)
+if os.environ.get('SHOP_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SHOP_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+# Постоянные соединения: без CONN_MAX_AGE каждый запрос открывает новое.
+# Перед повторным использованием соединение проверяется (CONN_HEALTH_CHECKS),
+# так что разрыв со стороны базы не превращается в ошибку 500.
+for _database in DATABASES.values():
+    _database['CONN_MAX_AGE'] = int(os.environ.get('SHOP_DB_CONN_MAX_AGE', 60))
+    _database['CONN_HEALTH_CHECKS'] = True
+
+# Реплики для чтения (views с @use_replica, см. shop/routers.py):
+# SHOP_DB_REPLICAS=host1,host2 — те же база и пользователь, другие хосты.
+# С SHOP_DB=sqlite реплику изображает второй файл SHOP_SQLITE_REPLICA_PATH
+# (например, копия db.sqlite3). В тестах реплики — зеркала (TEST MIRROR)
+# тестовой default: данные те же, отдельная пустая база не создаётся.
+DATABASE_ROUTERS = ['shop.routers.ReplicaRouter']
+DATABASE_REPLICAS = []
+if os.environ.get('SHOP_DB') == 'sqlite':
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ.get('SHOP_SQLITE_REPLICA_PATH', DATABASES['default']['NAME']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    if os.environ.get('SHOP_SQLITE_REPLICA_PATH'):
+        DATABASE_REPLICAS.append('replica')
+else:
+    for _number, _host in enumerate(filter(None, os.environ.get('SHOP_DB_REPLICAS', '').split(',')), 1):
+        DATABASES[f'replica{_number}'] = {
+            **DATABASES['default'], 'HOST': _host.strip(), 'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(f'replica{_number}')
+# Сколько секунд после оформления заказа клиент читает только с основной базы
+REPLICA_STICKY_SECONDS = 15
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -117,6 +161,49 @@ USE_TZ = True
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
+# Кэш. Страницы каталога кэшируются с версией каталога в ключе, версия
+# растёт при любом изменении товаров. Подойдёт и FileBasedCache.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sportshop',
+    }
+}
+PAGE_CACHE_SECONDS = 600
+
+# Каталог
+CATALOG_PAGE_SIZE = 24
+SEARCH_RESULTS_LIMIT = 48
+
+# Чёрная пятница: при SHOP_DEALS_PEAK=1 список скидок отдаётся заранее
+# отрендеренным (обновляет `python manage.py prerender_deals`, например, по cron)
+DEALS_PEAK_MODE = os.environ.get('SHOP_DEALS_PEAK') == '1'
+CAMPAIGN_CACHE_SECONDS = 60
+
+# Async views для страниц чтения (главная, каталог, товар, корзина, распродажа).
+# Включает sportshop/asgi.py; под WSGI остаются синхронные views.
+ASYNC_VIEWS = os.environ.get('SHOP_ASYNC_VIEWS') == '1'
+
+# Личный кабинет: заказов на странице истории
+CABINET_ORDERS_PAGE_SIZE = 10
+
+# Корзина: каждое изменение сразу пишется в таблицу Cart, кэш только
+# ускоряет чтение. Гостей узнаём по cookie.
+# У LocMemCache в каждом процессе своя копия: с несколькими воркерами
+# другой процесс видит старую корзину до CART_CACHE_SECONDS. В продакшене
+# нужен общий кэш (Redis, Memcached) — тогда срок можно поднять до CART_COOKIE_AGE.
+CART_COOKIE_NAME = 'cart_id'
+CART_COOKIE_AGE = 30 * 24 * 3600
+CART_CACHE_SECONDS = 60
+
+# Сколько минут держать резерв товара, пока покупатель оформляет заказ
+STOCK_RESERVATION_MINUTES = 15
+
+# Метрики (/metrics). При нескольких воркерах (gunicorn -w N) задайте
+# SHOP_METRICS_DIR — общий каталог, куда процессы сбрасывают счётчики
+METRICS_DIR = os.environ.get('SHOP_METRICS_DIR')
+METRICS_FLUSH_SECONDS = 5
+
 # Auth
 LOGIN_REDIRECT_URL = '/cabinet/'
 LOGOUT_REDIRECT_URL = '/'
@@ -130,4 +217,32 @@ EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = 'nosoa2015@yandex.ru'  # ← замени на свою почту
 EMAIL_HOST_PASSWORD = 'rursiaqjrubskzjj'  # ← замени на пароль приложения
-DEFAULT_FROM_EMAIL = 'nosoa2015@yandex.ru'
\ No newline at end of file
+DEFAULT_FROM_EMAIL = 'nosoa2015@yandex.ru'
+
+# Очередь писем: views только ставят письма в очередь, отправляет
+# воркер `python manage.py send_outbox --loop`
+EMAIL_OUTBOX_MAX_ATTEMPTS = 5
+EMAIL_OUTBOX_RETRY_SECONDS = 60
+
+# Ограничение частоты для регистрации, сброса пароля и подписки на поступление
+# (правила по умолчанию — shop.ratelimit.DEFAULT_RATE_LIMITS, свои — в RATE_LIMITS).
+# Счётчики в кэше RATELIMIT_CACHE: на нескольких воркерах нужен общий кэш
+# (Redis, Memcached), locmem считает по каждому процессу отдельно.
+RATELIMIT_ENABLED = True
+RATELIMIT_CACHE = 'default'
+# За обратным прокси — заголовок с адресом клиента, например 'HTTP_X_REAL_IP'
+# или 'HTTP_X_FORWARDED_FOR'. В X-Forwarded-For адрес берётся справа:
+# RATELIMIT_PROXY_COUNT — сколько наших прокси дописывают в него адрес
+RATELIMIT_IP_META = 'REMOTE_ADDR'
+RATELIMIT_PROXY_COUNT = 1
+
+# Telegram: сообщения ставятся в очередь TelegramMessage, отправляет
+# воркер `python manage.py send_telegram --loop`. Лимиты Bot API:
+# около 30 сообщений в секунду на бота и 1 в секунду в один чат.
+TELEGRAM_BOT_TOKEN = os.environ.get('SHOP_TELEGRAM_BOT_TOKEN', '')
+TELEGRAM_API_URL = 'https://api.telegram.org'
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CONCURRENCY = 20
+TELEGRAM_MAX_ATTEMPTS = 5
+TELEGRAM_RETRY_SECONDS = 60
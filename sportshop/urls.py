@@ -1,12 +1,28 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from django.views.static import serve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('shop.urls')),
 ]
 
+
+def serve_immutable(request, path, document_root=None):
+    # Варианты картинок названы по хэшу содержимого и никогда не меняются
+    response = serve(request, path, document_root=document_root)
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+
 if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            r'^%s(?P<path>products/variants/.*)$' % settings.MEDIA_URL.lstrip('/'),
+            serve_immutable,
+            {'document_root': settings.MEDIA_ROOT},
+        ),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file